@@ -0,0 +1,61 @@
+'''
+Compara o tempo de transform_column com a implementacao anterior (um
+str.replace com regex por chave do dicionario, sobre a coluna inteira) em
+um ano completo da coluna ESCOLARIDADE, com o mesmo arquivo e o mesmo
+dicionario de VIZ_HENRIQUE_2.
+
+Uso: python BENCH_HENRIQUE.py [csv] [repeticoes]
+'''
+import sys
+import time
+import pandas as pd
+from utils import utils_henrique as uh
+
+transform_dict = {
+    'Ensino Superior': 'Superior',
+    'Ensino Médio': 'Médio',
+    'Ensino Fundamental': 'Fundamental',
+    "Pós-":"Superior",
+    "Mestrado":"Superior",
+    "Doutorado":"Superior"
+}
+
+
+def transform_column_anterior(df, coluna, transform_dict):
+    # Implementacao anterior de utils_henrique.transform_column.
+    for original, transformado in transform_dict.items():
+        df[coluna] = df[coluna].str.replace('.*' + original + '.*', transformado, regex=True)
+    return df
+
+
+def cronometra(funcao, df, repeticoes):
+    # Melhor tempo entre as repeticoes, cada uma sobre uma copia dos dados.
+    tempos = []
+    for _ in range(repeticoes):
+        copia = df.copy()
+        inicio = time.perf_counter()
+        resultado = funcao(copia, 'ESCOLARIDADE', transform_dict)
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos), resultado
+
+
+if __name__ == '__main__':
+    csv_file = sys.argv[1] if len(sys.argv) > 1 else 'sermilH2022.csv'
+    repeticoes = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    df = uh.take_data(csv_file, ['ESCOLARIDADE'])
+    texto = df.astype({'ESCOLARIDADE': object})
+    print(f"{len(df)} linhas, {texto['ESCOLARIDADE'].nunique()} valores distintos")
+
+    anterior, esperado = cronometra(transform_column_anterior, texto, repeticoes)
+    atual, resultado = cronometra(uh.transform_column, texto, repeticoes)
+    # Os dois precisam dar o mesmo resultado; so entao os tempos sao comparaveis.
+    pd.testing.assert_series_equal(resultado['ESCOLARIDADE'], esperado['ESCOLARIDADE'])
+    print(f"anterior (str.replace por chave): {anterior:.3f} s")
+    print(f"atual (valores distintos):        {atual:.3f} s  ({anterior / atual:.1f}x)")
+
+    if isinstance(df['ESCOLARIDADE'].dtype, pd.CategoricalDtype):
+        categorica, resultado = cronometra(uh.transform_column, df, repeticoes)
+        pd.testing.assert_series_equal(resultado['ESCOLARIDADE'].astype(object), esperado['ESCOLARIDADE'],
+                                       check_dtype=False)
+        print(f"atual, coluna categorica:         {categorica:.3f} s  ({anterior / categorica:.1f}x)")
@@ -6,14 +6,18 @@ Analysis: Change of SERMIL statistics over time.
 from utils.analysis_utils import *
 from utils.data_utils import *
 
-# Aattemp to read the concatenated file
-df = concatenate_last_n_csv_files('data','data_concat',n=20)
-print(yearly_mean(df).info())
-print(yearly_mean(df).describe())
-print(yearly_aggregate(df))
-
-synthetic_df = yearly_mean(df)
-df2_agg_total = yearly_aggregate(df)['TOTAL']
+# Updating the dataset and its per-year aggregates; only new or changed years are read again.
+dataset_dir = dataset_dir_for('data_concat')
+update_dataset('data', dataset_dir)
+update_aggstore(dataset_dir)
+
+# Both answered from the per-year partial aggregates (see utils/aggstore.py).
+synthetic_df = yearly_mean(dataset_dir)
+df2_agg_total = yearly_aggregate(dataset_dir)
+print(synthetic_df.info())
+print(synthetic_df.describe())
+print(df2_agg_total)
+
 # Create some data for the plots
 x = synthetic_df.index
 y1 = synthetic_df['CINTURA']
@@ -1,3 +1,4 @@
 from utils import utils_gabriel as ug
 
+ug.update_imc_data()
 ug.bar_plot_imc()
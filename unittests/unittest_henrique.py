@@ -4,6 +4,7 @@ import sys
 sys.path.append('C:/Users/B51095/GovDataProj/utils')
 
 import unittest
+import os
 from utils_henrique import take_data, transform_column, EmptyFileError, NonexistentColumnsError
 import pandas as pd
 
@@ -23,6 +24,25 @@ class TestTakeDataFunction(unittest.TestCase):
         expected = pd.DataFrame({'Nome': ['Alice', 'Bob', 'Charlie']})
         pd.testing.assert_frame_equal(result, expected)
 
+    def test_take_data_validation_errors(self):
+        # Arquivo so com cabecalho e colunas inexistentes mantem os erros de antes
+        csv_file = 'so_cabecalho.csv'
+        with open(csv_file, 'w') as f:
+            f.write('Nome,Idade\n')
+        with self.assertRaises(Exception) as contexto:
+            take_data(csv_file, ['Nome'])
+        self.assertIsInstance(contexto.exception.__cause__, EmptyFileError)
+
+        with open(csv_file, 'w') as f:
+            f.write('Nome,Idade\nAlice,25\n')
+        with self.assertRaises(Exception) as contexto:
+            take_data(csv_file, ['Cidade'])
+        self.assertIsInstance(contexto.exception.__cause__, NonexistentColumnsError)
+
+        result = take_data(csv_file, ['Idade', 'Nome'])
+        self.assertEqual(list(result.columns), ['Idade', 'Nome'])
+        os.remove(csv_file)
+
     def test_take_data_with_invalid_format(self):
         csv_file = 'arquivo_invalido.csv' 
         try:
@@ -39,6 +59,22 @@ class TestTransformColumnFunction(unittest.TestCase):
         expected = pd.DataFrame({'ESCOLARIDADE': ['Fundamental', 'Médio', 'Superior', 'Mestrado']})
         pd.testing.assert_frame_equal(result, expected)
 
+    def test_transform_column_first_match_and_missing(self):
+        # A primeira chave que aparece no valor vence; nulos continuam nulos
+        df = pd.DataFrame({'ESCOLARIDADE': ['Ensino Superior Completo', None, 'Ensino Superior Completo',
+                                            'Ensino Médio']})
+        transform_dict = {'Superior': 'Superior', 'Completo': 'Completo', 'Médio': 'Médio'}
+        result = transform_column(df, 'ESCOLARIDADE', transform_dict)
+        self.assertEqual(result['ESCOLARIDADE'].tolist()[0], 'Superior')
+        self.assertTrue(pd.isna(result['ESCOLARIDADE'][1]))
+        self.assertEqual(result['ESCOLARIDADE'].tolist()[2:], ['Superior', 'Médio'])
+
+    def test_transform_column_on_non_text_column(self):
+        # Como o .str.replace da versao anterior, colunas que nao sao de texto geram AttributeError
+        df = pd.DataFrame({'IDADE': [18, 19, None]})
+        with self.assertRaises(AttributeError):
+            transform_column(df, 'IDADE', {'18': 'Dezoito'})
+
     def test_transform_column_with_nonexistent_column(self):
         df = pd.read_csv("sermilH2022.csv")  # Substitua pelo caminho correto
         with self.assertRaises(KeyError):
@@ -0,0 +1,141 @@
+'''
+Modulo para testes do armazenamento de agregados parciais por ano.
+'''
+import sys
+import os
+
+# Importante: mudar o path de acordo com a sua máquina, observe que é o path para a pasta do repositorio.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import tempfile
+from unittest import mock
+import numpy as np
+import pandas as pd
+
+from utils import aggstore, dataset
+from utils.analysis_utils import yearly_mean, yearly_aggregate
+
+
+class TestAggStore(unittest.TestCase):
+    '''
+    Classe de teste para update_aggstore e as consultas sobre as parciais.
+    '''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = os.path.join(self.tmp.name, dataset.DATASET_DIRNAME)
+        self.frames = {
+            2020: pd.DataFrame({'VINCULACAO_ANO': [2020, 2020, 2021], 'PESO': [70, 80, None],
+                                'ALTURA': [170, 180, 190], 'CINTURA': [80, None, 80], 'CABECA': [57, 57, 57]}),
+            2021: pd.DataFrame({'VINCULACAO_ANO': [2021, 2021, 2021], 'PESO': [60, 100, 90],
+                                'ALTURA': [160, 200, 185], 'CINTURA': [70, 90, 85], 'CABECA': [56, 58, 57]}),
+        }
+        for ano, df in self.frames.items():
+            dataset.append_year(df, ano, self.store)
+        self.aggdir = aggstore.aggstore_dir_for(self.store)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _todos(self):
+        return pd.concat(self.frames.values(), ignore_index=True)
+
+    def test_same_result_as_raw_data(self):
+        '''
+        Medias e contagens vindas das parciais sao as mesmas calculadas sobre os dados brutos.
+        '''
+        self.assertEqual(aggstore.update_aggstore(self.store), [2020, 2021])
+        medias = aggstore.yearly_mean_from_store(self.aggdir)
+        esperado = yearly_mean(self._todos())
+        self.assertEqual(medias.index.tolist(), esperado.index.tolist())
+        np.testing.assert_allclose(medias.to_numpy(), esperado.to_numpy())
+        contagens = aggstore.yearly_aggregate_from_store(self.aggdir)
+        self.assertEqual(contagens.to_dict('index'), yearly_aggregate(self._todos()).to_dict('index'))
+
+    def test_only_changed_years_are_recomputed(self):
+        '''
+        Uma segunda atualizacao nao le nada; regravar um ano recalcula so esse ano.
+        '''
+        aggstore.update_aggstore(self.store)
+        with mock.patch.object(aggstore, 'read_dataset_year') as leitura:
+            self.assertEqual(aggstore.update_aggstore(self.store), [])
+            leitura.assert_not_called()
+        self.frames[2021] = self.frames[2021].assign(PESO=[61, 101, 91])
+        dataset.append_year(self.frames[2021], 2021, self.store)
+        self.assertEqual(aggstore.update_aggstore(self.store), [2021])
+        contagens = aggstore.yearly_aggregate_from_store(self.aggdir)
+        self.assertEqual(contagens.to_dict('index'), yearly_aggregate(self._todos()).to_dict('index'))
+
+    def test_yearly_stats_and_fallback(self):
+        '''
+        Estatisticas derivaveis batem com o pandas; a mediana vem dos histogramas e as demais exigem dataset_dir.
+        '''
+        aggstore.update_aggstore(self.store)
+        stats = aggstore.yearly_stats(self.aggdir, 'ALTURA', ['count', 'mean', 'std', 'min', 'max', '50%'],
+                                      dataset_dir=self.store)
+        esperado = self._todos().groupby('VINCULACAO_ANO')['ALTURA'].describe()
+        for stat in ['count', 'mean', 'std', 'min', 'max', '50%']:
+            np.testing.assert_allclose(stats[stat].to_numpy(dtype='float64'),
+                                       esperado[stat].to_numpy(dtype='float64'), equal_nan=True)
+        mediana = aggstore.yearly_stats(self.aggdir, 'ALTURA', ['median'])
+        np.testing.assert_allclose(mediana['median'].to_numpy(dtype='float64'),
+                                   esperado['50%'].to_numpy(dtype='float64'))
+        with self.assertRaises(ValueError):
+            aggstore.yearly_stats(self.aggdir, 'ALTURA', ['skew'])
+
+    def test_non_integer_column_uses_raw_data(self):
+        '''
+        Uma coluna de histograma com valores nao inteiros fica sem histograma e os quantis vem dos dados brutos.
+        '''
+        self.frames[2021] = self.frames[2021].assign(ALTURA=[160.5, 200, 185])
+        dataset.append_year(self.frames[2021], 2021, self.store)
+        aggstore.update_aggstore(self.store)
+        with self.assertRaises(ValueError):
+            aggstore.yearly_stats(self.aggdir, 'ALTURA', ['50%'])
+        mediana = aggstore.yearly_stats(self.aggdir, 'ALTURA', ['50%'], dataset_dir=self.store)
+        esperado = self._todos().groupby('VINCULACAO_ANO')['ALTURA'].median()
+        np.testing.assert_allclose(mediana['50%'].to_numpy(dtype='float64'), esperado.to_numpy(dtype='float64'))
+
+    def test_junk_value_uses_raw_data(self):
+        '''
+        Uma coluna com um valor absurdo (ALTURA=9999, fora de MAX_WIDTH) fica sem histograma, em vez de alocar a faixa inteira.
+        '''
+        self.frames[2021] = self.frames[2021].assign(ALTURA=[160, 9999, 185])
+        dataset.append_year(self.frames[2021], 2021, self.store)
+        aggstore.update_aggstore(self.store)
+        with self.assertRaises(ValueError):
+            aggstore.yearly_stats(self.aggdir, 'ALTURA', ['50%'])
+        mediana = aggstore.yearly_stats(self.aggdir, 'ALTURA', ['50%'], dataset_dir=self.store)
+        esperado = self._todos().groupby('VINCULACAO_ANO')['ALTURA'].median()
+        np.testing.assert_allclose(mediana['50%'].to_numpy(dtype='float64'), esperado.to_numpy(dtype='float64'))
+
+    def test_trend_functions_use_store(self):
+        '''
+        yearly_mean recebe a pasta do conjunto e responde pelas parciais, sem ler os dados brutos de novo.
+        '''
+        aggstore.update_aggstore(self.store)
+        with mock.patch.object(dataset.SermilDataset, 'collect') as leitura:
+            medias = yearly_mean(self.store)
+            leitura.assert_not_called()
+        self.assertEqual(medias.index.tolist(), [2020, 2021])
+
+    def test_trend_functions_only_read(self):
+        '''
+        Sem update_aggstore, ou com um ano regravado depois dele, yearly_mean le os dados e nao grava nada.
+        '''
+        esperado = yearly_mean(self._todos())
+        medias = yearly_mean(self.store)
+        self.assertFalse(os.path.exists(self.aggdir))
+        np.testing.assert_allclose(medias.to_numpy(), esperado.to_numpy())
+        aggstore.update_aggstore(self.store)
+        self.assertTrue(aggstore.is_current(self.store))
+        self.frames[2021] = self.frames[2021].assign(PESO=[61, 101, 91])
+        dataset.append_year(self.frames[2021], 2021, self.store)
+        self.assertFalse(aggstore.is_current(self.store))
+        contagens = yearly_aggregate(self.store)
+        self.assertEqual(contagens.to_dict('index'), yearly_aggregate(self._todos()).to_dict('index'))
+        self.assertFalse(aggstore.is_current(self.store))
+
+
+if __name__ == '__main__':
+    unittest.main()
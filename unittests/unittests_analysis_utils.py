@@ -6,7 +6,9 @@ sys.path.append('C:/Users/B51095/GovDataProj/utils')
 import unittest
 import pandas as pd
 
-from analysis_utils import yearly_mean,yearly_aggregate
+import os
+import tempfile
+from analysis_utils import yearly_mean,yearly_aggregate,yearly_mean_chunked,yearly_aggregate_chunked
 
 class TestYearlyMeanFunction(unittest.TestCase):
     def setUp(self):
@@ -75,5 +77,34 @@ class TestYearlyAggregate(unittest.TestCase):
         self.assertEqual(result_df.equals(expected_df), True)  # One year expected
 
 
+class TestChunkedYearly(unittest.TestCase):
+    def setUp(self):
+        # Same data, read in small chunks from a csv
+        self.test_df = pd.DataFrame({
+            'VINCULACAO_ANO': [2007, 2007, 2008, 2008, 2009, 2007, 2009],
+            'CINTURA': [80.0, None, 79.9, 80.1, 80.3, 81.0, 82.0],
+            'PESO': [70.0, 70.2, 70.3, None, 70.7, 71.0, 72.0],
+            'ALTURA': [170.0, 170.2, None, 170.5, 170.7, 171.0, 172.0],
+            'CABECA': [56.0, 56.2, 56.3, 56.5, None, 57.0, 58.0],
+            'SEXO': ['M'] * 7,
+        })
+        self.tmp = tempfile.TemporaryDirectory()
+        self.csv_file = os.path.join(self.tmp.name, 'sermil.csv')
+        self.test_df.to_csv(self.csv_file, index=False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_chunked_matches_in_memory(self):
+        # Streaming results must match the in-memory functions
+        mean = yearly_mean_chunked(self.csv_file, chunksize=2)
+        expected_mean = yearly_mean(self.test_df)
+        self.assertEqual(mean.index.tolist(), expected_mean.index.tolist())
+        pd.testing.assert_frame_equal(mean, expected_mean, check_dtype=False, check_names=False)
+
+        aggregate = yearly_aggregate_chunked(self.csv_file, chunksize=3)
+        self.assertTrue(aggregate.equals(yearly_aggregate(self.test_df)))
+
+
 if __name__ == '__main__':
     unittest.main()
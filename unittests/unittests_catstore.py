@@ -0,0 +1,113 @@
+'''
+Modulo para testes da codificacao por dicionario das colunas de texto.
+'''
+import sys
+import os
+
+# Importante: mudar o path de acordo com a sua máquina, observe que é o path para a pasta do repositorio.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import tempfile
+import numpy as np
+import pandas as pd
+
+from utils import catstore, parquet_store
+from utils.utils_gabriel import percentage_value_counts
+from utils.utils_henrique import transform_column
+
+
+class TestCatStore(unittest.TestCase):
+    '''
+    Classe de teste para a codificacao, a leitura e as contagens pelos codigos.
+    '''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = os.path.join(self.tmp.name, catstore.CATSTORE_DIRNAME)
+        self.frames = {
+            2020: pd.DataFrame({'UF_RESIDENCIA': ['SP', 'RJ', None], 'SEXO': ['M', 'M', 'F']}),
+            2021: pd.DataFrame({'UF_RESIDENCIA': ['MG', 'SP'], 'SEXO': ['F', 'M']}),
+        }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_vocabulary_is_shared_between_years(self):
+        '''
+        O vocabulario so cresce e o codigo de um valor e o mesmo em todos os anos.
+        '''
+        catstore.build_catstore(self.frames, self.store)
+        vocab = catstore.load_vocabulary(self.store, 'UF_RESIDENCIA')
+        self.assertEqual(vocab['valores'], ['SP', 'RJ', 'MG'])
+        self.assertEqual(vocab['anos']['2020'], {'dtype': 'int8', 'linhas': 3})
+
+        codigos = catstore.read_codes(self.store, 'UF_RESIDENCIA', anos=[2021])
+        self.assertIsInstance(codigos, np.memmap)
+        self.assertEqual(codigos.tolist(), [2, 0])
+        self.assertEqual(catstore.read_codes(self.store, 'UF_RESIDENCIA').tolist(), [0, 1, -1, 2, 0])
+
+    def test_rewrite_year_keeps_other_codes(self):
+        '''
+        Reescrever um ano substitui os seus codigos sem mudar os dos outros anos.
+        '''
+        catstore.build_catstore(self.frames, self.store)
+        catstore.encode_year(pd.DataFrame({'UF_RESIDENCIA': ['BA']}), 2020, self.store)
+        self.assertEqual(catstore.load_categorical(self.store, 'UF_RESIDENCIA').tolist(), ['BA', 'MG', 'SP'])
+        self.assertEqual(catstore.read_codes(self.store, 'UF_RESIDENCIA', anos=[2021]).tolist(), [2, 0])
+
+    def test_missing_column_or_year(self):
+        '''
+        Colunas ou anos fora do armazenamento geram KeyError.
+        '''
+        catstore.build_catstore(self.frames, self.store)
+        with self.assertRaises(KeyError):
+            catstore.read_codes(self.store, 'DISPENSA')
+        with self.assertRaises(KeyError):
+            catstore.read_codes(self.store, 'SEXO', anos=[2007])
+
+    def test_load_frame_from_parquet(self):
+        '''
+        O armazenamento criado a partir do Parquet devolve os mesmos valores e a coluna ANO_COLETA.
+        '''
+        parquet_dir = os.path.join(self.tmp.name, parquet_store.STORE_DIRNAME)
+        for ano, df in self.frames.items():
+            parquet_store.write_year(df, ano, parquet_dir)
+        self.assertEqual(catstore.build_from_parquet(parquet_dir, self.store), [2020, 2021])
+
+        df = catstore.load_frame(self.store, ['SEXO', 'UF_RESIDENCIA'])
+        self.assertEqual(df['SEXO'].tolist(), ['M', 'M', 'F', 'F', 'M'])
+        self.assertEqual(df['ANO_COLETA'].tolist(), [2020, 2020, 2020, 2021, 2021])
+
+    def test_counts_match_pandas(self):
+        '''
+        count_codes e crosstab_codes dao o mesmo resultado que value_counts e crosstab.
+        '''
+        catstore.build_catstore(self.frames, self.store)
+        df = catstore.load_frame(self.store, ['SEXO', 'UF_RESIDENCIA'])
+        # Uma categoria sem ocorrencias continua nas contagens, com zero.
+        df['UF_RESIDENCIA'] = df['UF_RESIDENCIA'].cat.add_categories(['AC'])
+
+        contagem = catstore.count_codes(df['UF_RESIDENCIA'])
+        self.assertEqual(contagem.to_dict(), df['UF_RESIDENCIA'].value_counts().to_dict())
+        self.assertEqual(contagem['AC'], 0)
+        tabela = catstore.crosstab_codes(df['UF_RESIDENCIA'], df['SEXO'])
+        completos = df.dropna(subset=['UF_RESIDENCIA', 'SEXO'])
+        esperado = pd.crosstab(completos['UF_RESIDENCIA'], completos['SEXO'], dropna=False)
+        self.assertEqual(tabela.index.tolist(), df['UF_RESIDENCIA'].cat.categories.tolist())
+        self.assertEqual(tabela.to_dict(), esperado.to_dict())
+        self.assertEqual(percentage_value_counts(df['SEXO'])['PORCENTAGEM'].to_dict(),
+                         {'M': 0.6, 'F': 0.4})
+
+    def test_transform_column_on_categories(self):
+        '''
+        transform_column em uma coluna categorica junta as categorias que viram o mesmo valor.
+        '''
+        df = pd.DataFrame({'ESCOLARIDADE': pd.Categorical(['Ensino Medio', 'Medio', None, 'Superior'])})
+        resultado = transform_column(df, 'ESCOLARIDADE', {'Ensino Medio': 'Medio'})
+        self.assertIsInstance(resultado['ESCOLARIDADE'].dtype, pd.CategoricalDtype)
+        self.assertEqual(list(resultado['ESCOLARIDADE'].cat.categories), ['Medio', 'Superior'])
+        self.assertEqual(resultado['ESCOLARIDADE'].tolist(), ['Medio', 'Medio', np.nan, 'Superior'])
+
+
+if __name__ == '__main__':
+    unittest.main()
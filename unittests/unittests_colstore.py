@@ -0,0 +1,98 @@
+'''
+Modulo para testes do armazenamento de colunas numericas com memmap.
+'''
+import sys
+import os
+
+# Importante: mudar o path de acordo com a sua máquina, observe que é o path para a pasta do repositorio.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import tempfile
+import numpy as np
+import pandas as pd
+
+from utils import colstore, parquet_store
+from utils.analysis_utils import yearly_mean
+
+
+class TestColStore(unittest.TestCase):
+    '''
+    Classe de teste para a criacao, o acrescimo e a leitura das colunas.
+    '''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = os.path.join(self.tmp.name, colstore.COLSTORE_DIRNAME)
+        self.frames = {
+            2020: pd.DataFrame({'ALTURA': [170, 180, None], 'VINCULACAO_ANO': [2020, 2020, 2020]}),
+            2021: pd.DataFrame({'ALTURA': [160, 190], 'VINCULACAO_ANO': [2021, 2021]}),
+            2022: pd.DataFrame({'ALTURA': [175], 'VINCULACAO_ANO': [2022]}),
+        }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_open_column_is_memmap(self):
+        '''
+        A coluna e aberta sem copia e os anos ficam nos trechos do indice.
+        '''
+        index = colstore.build_colstore(self.frames, self.store, columns=['ALTURA', 'VINCULACAO_ANO'])
+        self.assertEqual(index['linhas'], 6)
+        self.assertEqual(index['anos']['2021'], [3, 5])
+
+        altura = colstore.open_column(self.store, 'ALTURA')
+        self.assertIsInstance(altura, np.memmap)
+        self.assertFalse(altura.flags.writeable)
+        self.assertTrue(np.isnan(altura[2]))
+
+        recorte = colstore.open_column(self.store, 'ALTURA', anos=[2021, 2022])
+        self.assertIsInstance(recorte, np.memmap)
+        self.assertEqual(recorte.tolist(), [160, 190, 175])
+
+        # Anos nao consecutivos sao copiados, na ordem do armazenamento.
+        self.assertEqual(colstore.open_column(self.store, 'ALTURA', anos=[2022, 2020])[[0, 1, 3]].tolist(),
+                         [170, 180, 175])
+
+    def test_append_year(self):
+        '''
+        Um ano novo e acrescentado sem reescrever os anteriores; um ano repetido gera erro.
+        '''
+        colstore.append_year(self.frames[2020], 2020, self.store)
+        colstore.append_year(self.frames[2021], 2021, self.store)
+        with self.assertRaises(ValueError):
+            colstore.append_year(self.frames[2021], 2021, self.store)
+        df = colstore.load_columns(self.store, ['ALTURA'])
+        self.assertEqual(df['ANO_COLETA'].tolist(), [2020, 2020, 2020, 2021, 2021])
+        self.assertEqual(os.path.getsize(os.path.join(self.store, 'ALTURA.bin')), 5 * 4)
+
+    def test_missing_column_or_year(self):
+        '''
+        Colunas ou anos fora do armazenamento geram KeyError.
+        '''
+        colstore.build_colstore(self.frames, self.store, columns=['ALTURA'])
+        with self.assertRaises(KeyError):
+            colstore.open_column(self.store, 'PESO')
+        with self.assertRaises(KeyError):
+            colstore.open_column(self.store, 'ALTURA', anos=[2007])
+
+    def test_from_parquet_and_yearly_mean(self):
+        '''
+        O armazenamento criado a partir do Parquet alimenta yearly_mean com o mesmo resultado.
+        '''
+        parquet_dir = os.path.join(self.tmp.name, parquet_store.STORE_DIRNAME)
+        for ano, df in self.frames.items():
+            df = df.assign(PESO=70.5, CINTURA=80, CABECA=57)
+            self.frames[ano] = df
+            parquet_store.write_year(df, ano, parquet_dir)
+        colstore.build_from_parquet(parquet_dir, self.store)
+
+        colunas = ['VINCULACAO_ANO', 'CINTURA', 'PESO', 'ALTURA', 'CABECA']
+        resultado = yearly_mean(colstore.load_columns(self.store, colunas))
+        esperado = yearly_mean(pd.concat(self.frames.values(), ignore_index=True))
+        self.assertEqual(resultado.index.tolist(), esperado.index.tolist())
+        for coluna in colunas[1:]:
+            self.assertEqual(resultado[coluna].tolist(), esperado[coluna].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+'''
+Modulo para testes do acumulador de covariancias em fluxo.
+'''
+import sys
+import os
+
+# Importante: mudar o path de acordo com a sua máquina, observe que é o path para a pasta do repositorio.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import tempfile
+from unittest import mock
+import numpy as np
+import pandas as pd
+
+from utils import dataset
+from utils.covariance import CovarianceAccumulator, stream_covariance
+from utils import utils_tomas
+
+COLUNAS = ['ALTURA', 'PESO', 'CINTURA', 'CABECA']
+
+
+def _amostra(seed, linhas=600):
+    rng = np.random.default_rng(seed)
+    altura = rng.normal(172, 7, linhas).round()
+    df = pd.DataFrame({'ALTURA': altura, 'PESO': (altura - 100 + rng.normal(0, 8, linhas)).round(),
+                       'CINTURA': rng.normal(80, 6, linhas).round(), 'CABECA': rng.normal(57, 2, linhas).round(),
+                       'UF_RESIDENCIA': rng.choice(['SP', 'RJ', 'MG'], linhas)})
+    # Nulos em posicoes diferentes em cada coluna, para exercitar o descarte par a par.
+    for i, coluna in enumerate(COLUNAS):
+        df.loc[rng.random(linhas) < 0.05 * (i + 1), coluna] = np.nan
+    return df
+
+
+class TestCovarianceAccumulator(unittest.TestCase):
+    '''
+    Classe de teste para CovarianceAccumulator e stream_covariance.
+    '''
+    def test_pairwise_matches_pandas(self):
+        '''
+        Acumulado em pedacos (com centros diferentes), o resultado e o de DataFrame.corr() e cov().
+        '''
+        df = _amostra(0)
+        acumulador = CovarianceAccumulator(COLUNAS)
+        for pedaco in [df.iloc[i:i + 90] for i in range(0, len(df), 90)]:
+            acumulador.merge(CovarianceAccumulator(COLUNAS).update(pedaco))
+        np.testing.assert_allclose(acumulador.corr().to_numpy(), df[COLUNAS].corr().to_numpy(), atol=1e-12)
+        np.testing.assert_allclose(acumulador.cov().to_numpy(), df[COLUNAS].cov().to_numpy(), rtol=1e-10)
+        self.assertEqual(acumulador.count().loc['ALTURA', 'CABECA'], df[['ALTURA', 'CABECA']].dropna().shape[0])
+
+    def test_dataset_years_and_groups(self):
+        '''
+        Uma passagem pelos anos do conjunto da a matriz de todos os anos e a de cada UF, em um ou varios processos.
+        '''
+        frames = {ano: _amostra(ano) for ano in (2020, 2021, 2022)}
+        todos = pd.concat(frames.values(), ignore_index=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            store = os.path.join(tmp, dataset.DATASET_DIRNAME)
+            for ano, df in frames.items():
+                dataset.append_year(df, ano, store)
+            for workers in (1, 2):
+                total, por_uf = stream_covariance(store, COLUNAS, by='UF_RESIDENCIA', workers=workers)
+                np.testing.assert_allclose(total.corr().to_numpy(), todos[COLUNAS].corr().to_numpy(), atol=1e-12)
+                self.assertEqual(sorted(por_uf), ['MG', 'RJ', 'SP'])
+                esperado = todos[todos['UF_RESIDENCIA'] == 'RJ'][COLUNAS].corr()
+                np.testing.assert_allclose(por_uf['RJ'].corr().to_numpy(), esperado.to_numpy(), atol=1e-12)
+
+    def test_heatmap_from_accumulated_matrix(self):
+        '''
+        create_correlation_matrix desenha a matriz acumulada e valida os pedacos com as mesmas regras.
+        '''
+        pedacos = [_amostra(1), _amostra(2)]
+        with mock.patch.object(utils_tomas.plt, 'show'), mock.patch.object(utils_tomas.sns, 'heatmap') as heatmap:
+            self.assertTrue(utils_tomas.create_correlation_matrix(pedacos, COLUNAS, uf='SP'))
+        esperado = pd.concat(pedacos).query("UF_RESIDENCIA == 'SP'")[COLUNAS].corr().round(2)
+        pd.testing.assert_frame_equal(heatmap.call_args.args[0], esperado, check_exact=False, atol=0.01)
+        pedacos[1].loc[3, 'PESO'] = 0
+        self.assertIsNone(utils_tomas.create_correlation_matrix(pedacos, COLUNAS))
+
+    def test_dataframe_drops_nulls_pairwise(self):
+        '''
+        Um DataFrame com nulos da a mesma matriz que os seus pedacos, descartando os nulos par a par.
+        '''
+        pedacos = [_amostra(1), _amostra(2)]
+        df = pd.concat(pedacos, ignore_index=True)
+        esperado = df.query("UF_RESIDENCIA == 'SP'")[COLUNAS].corr().round(2)
+        for fonte in (df, pedacos):
+            with mock.patch.object(utils_tomas.plt, 'show'), mock.patch.object(utils_tomas.sns, 'heatmap') as heatmap:
+                self.assertTrue(utils_tomas.create_correlation_matrix(fonte, COLUNAS, uf='SP'))
+            pd.testing.assert_frame_equal(heatmap.call_args.args[0], esperado, check_exact=False, atol=0.01)
+        utils_tomas.plt.close('all')
+        self.assertIsNone(utils_tomas.create_correlation_matrix(df.drop(columns='UF_RESIDENCIA'), COLUNAS, uf='SP'))
+
+    def test_uf_filter_validates_only_selected_rows(self):
+        '''
+        Com uf, as linhas das outras UFs nao sao acumuladas nem validadas, nos pedacos e no conjunto de dados.
+        '''
+        pedacos = [_amostra(1), _amostra(2)]
+        pedacos[1].loc[pedacos[1]['UF_RESIDENCIA'] == 'RJ', 'PESO'] = 0
+        esperado = pd.concat(pedacos).query("UF_RESIDENCIA == 'SP'")[COLUNAS].corr().round(2)
+        with tempfile.TemporaryDirectory() as tmp:
+            store = os.path.join(tmp, dataset.DATASET_DIRNAME)
+            for ano, df in zip((2021, 2022), pedacos):
+                dataset.append_year(df, ano, store)
+            for fonte in (pedacos, store, dataset.SermilDataset(store)):
+                with mock.patch.object(utils_tomas.plt, 'show'), \
+                        mock.patch.object(utils_tomas.sns, 'heatmap') as heatmap:
+                    self.assertTrue(utils_tomas.create_correlation_matrix(fonte, COLUNAS, uf='SP'))
+                pd.testing.assert_frame_equal(heatmap.call_args.args[0], esperado, check_exact=False, atol=0.01)
+            with mock.patch.object(utils_tomas.plt, 'show'), mock.patch.object(utils_tomas.sns, 'heatmap'):
+                self.assertIsNone(utils_tomas.create_correlation_matrix(store, COLUNAS, uf='RJ'))
+        utils_tomas.plt.close('all')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,10 @@ sys.path.append('C:/Users/B51095/GovDataProj/utils')
 import unittest
 import pandas as pd
 import os
-from data_utils import concatenate_last_n_csv_files, integrity_check
+import shutil
+from unittest import mock
+from data_utils import concatenate_last_n_csv_files, integrity_check, file_manifest, FILES_MANIFEST
+from dataset import dataset_dir_for, dataset_years, load_dataset_manifest
 
 class TestDataUtils(unittest.TestCase):
 
@@ -19,11 +22,8 @@ class TestDataUtils(unittest.TestCase):
     def tearDown(self):
         # Remove the temporary directory and its contents
         # Cleaning up.
-        for filename in os.listdir(self.test_dir):
-            file_path = os.path.join(self.test_dir, filename)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
-        os.rmdir(self.test_dir)
+        # The multi-year dataset is a subfolder, so the whole tree is removed.
+        shutil.rmtree(self.test_dir)
 
     def test_concatenate_last_n_csv_files(self):
         # Create some dummy dataset
@@ -37,12 +37,41 @@ class TestDataUtils(unittest.TestCase):
         result = concatenate_last_n_csv_files(self.test_dir, self.test_dir, n=5)
         print(result)
         self.assertEqual(result.shape[0], 6)  # Check the number of rows in the concatenated DataFrame
+        self.assertEqual(result['ANO_COLETA'].tolist(), list(range(2017, 2023)))
+
+    def test_concatenate_appends_only_new_years(self):
+        # Years already in the dataset are not written again
+        for i in range(2020, 2022):
+            data = pd.DataFrame({'A': [i], 'B': [i * 2]})
+            data.to_csv(os.path.join(self.test_dir, f'sermil{i}.csv'), index=False)
+        concatenate_last_n_csv_files(self.test_dir, self.test_dir, n=20)
+        dataset_dir = dataset_dir_for(self.test_dir)
+        particao = os.path.join(dataset_dir, load_dataset_manifest(dataset_dir)['2020']['particao'])
+        antes = os.stat(particao).st_mtime_ns
+
+        pd.DataFrame({'A': [2022, 2022], 'B': [0, 0]}).to_csv(os.path.join(self.test_dir, 'sermil2022.csv'), index=False)
+        result = concatenate_last_n_csv_files(self.test_dir, self.test_dir, n=20)
+        self.assertEqual(dataset_years(dataset_dir), [2020, 2021, 2022])
+        self.assertEqual(os.stat(particao).st_mtime_ns, antes)
+        self.assertEqual(result['A'].tolist(), [2020, 2021, 2022, 2022])
+
+    def test_concatenate_parallel_keeps_year_order(self):
+        # Parallel workers must give the same result, in year order
+        for i in range(2012, 2018):
+            data = pd.DataFrame({'A': [i] * (2023 - i), 'SEXO': ['M', 'F'][i % 2]})
+            data.to_csv(os.path.join(self.test_dir, f'sermil{i}.csv'), index=False)
+        result = concatenate_last_n_csv_files(self.test_dir, self.test_dir, n=20, workers=4)
+        self.assertEqual(result['ANO_COLETA'].tolist(), result['A'].tolist())
+        self.assertTrue(result['ANO_COLETA'].is_monotonic_increasing)
+        self.assertEqual(str(result['SEXO'].dtype), 'category')
+        self.assertEqual(result.shape[0], sum(2023 - i for i in range(2012, 2018)))
 
     def test_integrity_check(self):
-        # Create some test CSV files
+        # Create some test CSV files (empty files no longer pass the check)
         for year in range(2012, 2023):
             file_name = f'sermil{year}.csv'
-            open(os.path.join(self.test_dir, file_name), 'w').close()
+            with open(os.path.join(self.test_dir, file_name), 'w') as f:
+                f.write('ALTURA,PESO\n170,70\n')
 
         # Test integrity with the correct range
         integrity_result = integrity_check(self.test_dir, begin=2012, end=2022)
@@ -53,6 +82,45 @@ class TestDataUtils(unittest.TestCase):
         integrity_result = integrity_check(self.test_dir, begin=2012, end=2022)
         self.assertFalse(integrity_result)
 
+    def test_integrity_check_detects_bad_files(self):
+        # Empty, truncated or missing-column files fail the check
+        for year in range(2020, 2023):
+            with open(os.path.join(self.test_dir, f'sermil{year}.csv'), 'w') as f:
+                f.write('ALTURA,PESO\n170,70\n180,80\n')
+        self.assertTrue(integrity_check(self.test_dir, begin=2020, end=2022, columns=['PESO']))
+        self.assertFalse(integrity_check(self.test_dir, begin=2020, end=2022, columns=['CINTURA']))
+
+        with open(os.path.join(self.test_dir, 'sermil2021.csv'), 'w') as f:
+            f.write('ALTURA,PESO\n170,70\n18')
+        self.assertFalse(integrity_check(self.test_dir, begin=2020, end=2022))
+
+        with open(os.path.join(self.test_dir, 'sermil2021.csv'), 'w') as f:
+            f.write('ALTURA,PESO\n')
+        self.assertFalse(integrity_check(self.test_dir, begin=2020, end=2022))
+
+    def test_file_manifest_is_cached(self):
+        # Unchanged files are not hashed again
+        for year in range(2020, 2022):
+            pd.DataFrame({'A': [year]}).to_csv(os.path.join(self.test_dir, f'sermil{year}.csv'), index=False)
+        primeiro = file_manifest(self.test_dir)
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, FILES_MANIFEST)))
+        self.assertEqual(primeiro['sermil2020.csv']['linhas'], 1)
+
+        import data_utils
+        with mock.patch.object(data_utils, '_scan_file', side_effect=data_utils._scan_file) as leitura:
+            pd.DataFrame({'A': [1, 2]}).to_csv(os.path.join(self.test_dir, 'sermil2021.csv'), index=False)
+            segundo = file_manifest(self.test_dir)
+        self.assertEqual(leitura.call_count, 1)
+        self.assertEqual(segundo['sermil2020.csv'], primeiro['sermil2020.csv'])
+        self.assertEqual(segundo['sermil2021.csv']['linhas'], 2)
+        self.assertNotEqual(segundo['sermil2021.csv']['sha256'], primeiro['sermil2021.csv']['sha256'])
+    def test_other_csvs_with_year_are_ignored(self):
+        # 'sermilH2022.csv' must not replace 'sermil2022.csv' in the manifest
+        pd.DataFrame({'PESO': [70]}).to_csv(os.path.join(self.test_dir, 'sermil2022.csv'), index=False)
+        pd.DataFrame({'ESCOLARIDADE': ['Superior']}).to_csv(os.path.join(self.test_dir, 'sermilH2022.csv'), index=False)
+        self.assertEqual(list(file_manifest(self.test_dir)), ['sermil2022.csv'])
+        self.assertTrue(integrity_check(self.test_dir, begin=2022, end=2022, columns=['PESO']))
+
 if __name__ == '__main__':
     #Running Unittests
     unittest.main()
@@ -0,0 +1,103 @@
+'''
+Modulo para testes do conjunto de dados com varios anos e das consultas preguicosas.
+'''
+import sys
+import os
+
+# Importante: mudar o path de acordo com a sua máquina, observe que é o path para a pasta do repositorio.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import tempfile
+from unittest import mock
+import pandas as pd
+
+from utils import dataset
+from utils.analysis_utils import yearly_mean
+
+
+class TestSermilDataset(unittest.TestCase):
+    '''
+    Classe de teste para select, where e collect.
+    '''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = os.path.join(self.tmp.name, dataset.DATASET_DIRNAME)
+        self.frames = {
+            2020: pd.DataFrame({'VINCULACAO_ANO': [2020] * 3, 'PESO': [70, 80, 90], 'ALTURA': [170, 180, 190],
+                                'CINTURA': [80, 80, 80], 'CABECA': [57, 57, 57], 'UF_RESIDENCIA': ['SP', 'RJ', 'SP']}),
+            2021: pd.DataFrame({'VINCULACAO_ANO': [2021] * 2, 'PESO': [60, 100], 'ALTURA': [160, 200],
+                                'CINTURA': [70, 90], 'CABECA': [56, 58], 'UF_RESIDENCIA': ['MG', 'SP']}),
+            2022: pd.DataFrame({'VINCULACAO_ANO': [2022], 'PESO': [75], 'ALTURA': [175],
+                                'CINTURA': [85], 'CABECA': [57], 'UF_RESIDENCIA': ['SP']}),
+        }
+        for ano, df in self.frames.items():
+            dataset.append_year(df, ano, self.store)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_select_and_where(self):
+        '''
+        So as colunas pedidas voltam, e os filtros de ano e de valor sao acumulados.
+        '''
+        consulta = dataset.SermilDataset(self.store).select(['PESO']).where(anos=range(2021, 2030))
+        consulta = consulta.where(UF_RESIDENCIA=['SP', 'RJ'])
+        df = consulta.collect()
+        self.assertEqual(list(df.columns), ['PESO', 'ANO_COLETA'])
+        self.assertEqual(df['PESO'].tolist(), [100, 75])
+        self.assertEqual(df['ANO_COLETA'].tolist(), [2021, 2022])
+
+    def test_filter_on_column_missing_in_a_year(self):
+        '''
+        Um ano sem a coluna do filtro nao tem linhas aceitas, e os demais anos sao lidos normalmente.
+        '''
+        dataset.append_year(self.frames[2020].drop(columns='UF_RESIDENCIA'), 2020, self.store)
+        df = dataset.SermilDataset(self.store).select('PESO').where(UF_RESIDENCIA='SP').collect()
+        self.assertEqual(df['PESO'].tolist(), [100, 75])
+        self.assertEqual(df['ANO_COLETA'].tolist(), [2021, 2022])
+        vazio = dataset.read_dataset_year(self.store, 2020, ['PESO', 'UF_RESIDENCIA'], {'UF_RESIDENCIA': ['SP']})
+        self.assertEqual((list(vazio.columns), len(vazio)), (['PESO'], 0))
+
+    def test_only_needed_partitions_and_columns_are_read(self):
+        '''
+        Anos fora do filtro nao sao abertos e as colunas lidas sao as selecionadas mais as dos filtros.
+        '''
+        consulta = dataset.SermilDataset(self.store).select('PESO').where(anos=[2020, 2022], UF_RESIDENCIA='SP')
+        self.assertEqual(consulta.years(), [2020, 2022])
+        original = dataset.read_dataset_year
+        with mock.patch.object(dataset, 'read_dataset_year', side_effect=original) as leitura:
+            df = consulta.collect()
+        self.assertEqual([chamada.args[1] for chamada in leitura.call_args_list], [2020, 2022])
+        self.assertEqual(sorted(leitura.call_args_list[0].args[2]), ['PESO', 'UF_RESIDENCIA'])
+        self.assertEqual(df['PESO'].tolist(), [70, 90, 75])
+
+    def test_analysis_accepts_dataset(self):
+        '''
+        yearly_mean recebe a consulta e devolve o mesmo que com o DataFrame completo.
+        '''
+        consulta = dataset.SermilDataset(self.store).where(anos=[2020, 2021])
+        resultado = yearly_mean(consulta)
+        esperado = yearly_mean(pd.concat([self.frames[2020], self.frames[2021]], ignore_index=True))
+        self.assertEqual(resultado.index.tolist(), esperado.index.tolist())
+        self.assertEqual(resultado['PESO'].tolist(), esperado['PESO'].tolist())
+
+    def test_update_ignores_other_csvs_with_year(self):
+        '''
+        Com 'sermil2022.csv' e 'sermilH2022.csv' na pasta, so o primeiro e o ano 2022 do conjunto.
+        '''
+        pasta = os.path.join(self.tmp.name, 'csvs')
+        os.makedirs(pasta)
+        self.frames[2022].to_csv(os.path.join(pasta, 'sermil2022.csv'), index=False)
+        pd.DataFrame({'ESCOLARIDADE': ['Superior'], 'DISPENSA': ['Sem dispensa']}).to_csv(
+            os.path.join(pasta, 'sermilH2022.csv'), index=False)
+        destino = dataset.dataset_dir_for(pasta)
+        self.assertEqual(dataset.update_dataset(pasta, destino), [2022])
+        self.assertEqual(dataset.update_dataset(pasta, destino), [])
+        df = dataset.read_dataset(destino, columns=['PESO', 'ALTURA'])
+        self.assertEqual(df['PESO'].tolist(), [75])
+        self.assertEqual(df['ALTURA'].tolist(), [175])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,349 @@
+'''
+Modulo para testes das funcoes de download do modulo downloaddata.
+'''
+import sys
+import os
+
+# Importante: mudar o path de acordo com a sua máquina, observe que é o path para a pasta do repositorio.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import hashlib
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import pandas as pd
+
+from utils import downloaddata
+
+
+class LocalCSVHandler(BaseHTTPRequestHandler):
+    '''
+    Servidor HTTP local que faz o papel do dadosabertos.eb.mil.br nos testes.
+    '''
+    payload = b''
+    # Se definido, a proxima resposta e cortada apos esse numero de bytes.
+    drop_after = None
+    ranges = []
+    etag = None
+    last_modified = 'Wed, 01 Jan 2025 00:00:00 GMT'
+
+    def do_GET(self):
+        if self.etag is not None and self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        inicio = 0
+        faixa = self.headers.get('Range')
+        LocalCSVHandler.ranges.append(faixa)
+        validador = self.headers.get('If-Range')
+        if validador is not None and validador not in (self.etag, self.last_modified):
+            # O arquivo mudou: o Range e ignorado e o arquivo todo e enviado.
+            faixa = None
+        if faixa is not None:
+            inicio = int(faixa.split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {inicio}-{len(self.payload) - 1}/{len(self.payload)}')
+        else:
+            self.send_response(200)
+        corpo = self.payload[inicio:]
+        self.send_header('Content-Type', 'text/csv; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        if self.etag is not None:
+            self.send_header('ETag', self.etag)
+        if self.last_modified is not None:
+            self.send_header('Last-Modified', self.last_modified)
+        self.end_headers()
+        if LocalCSVHandler.drop_after is not None:
+            # Derruba a conexao no meio da transferencia.
+            self.wfile.write(corpo[:LocalCSVHandler.drop_after])
+            LocalCSVHandler.drop_after = None
+            self.close_connection = True
+            return
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalServerTestCase(unittest.TestCase):
+    '''
+    Sobe o servidor local e uma pasta temporaria para cada teste.
+    '''
+    handler = LocalCSVHandler
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/sermil2022.csv'
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+
+class TestDownloadCSVStream(LocalServerTestCase):
+    '''
+    Classe de teste para o modo streaming de download_csv_local.
+    '''
+    def setUp(self):
+        linhas = ['PESO,ALTURA,UF_RESIDENCIA'] + [f'{60 + i % 30},{170 + i % 20},SP' for i in range(1000)]
+        linhas[10] = ',180,RJ'
+        LocalCSVHandler.payload = ('\n'.join(linhas) + '\n').encode('utf-8')
+        super().setUp()
+
+    def test_stream_selected_columns(self):
+        '''
+        O csv gravado em blocos deve ser igual ao da leitura completa.
+        '''
+        destino = os.path.join(self.tmp.name, 'sermil2022.csv')
+        ok = downloaddata.download_csv_local(self.url, dropna=True, local_file=destino,
+                                             columns=['PESO', 'ALTURA'], chunksize=64)
+        self.assertTrue(ok)
+        resultado = pd.read_csv(destino)
+        self.assertEqual(list(resultado.columns), ['PESO', 'ALTURA'])
+        self.assertEqual(len(resultado), 999)
+        self.assertFalse(os.path.exists(destino + '.tmp'))
+
+    def test_stream_missing_column(self):
+        '''
+        Uma coluna inexistente faz o download falhar sem deixar arquivos.
+        '''
+        destino = os.path.join(self.tmp.name, 'sermil2022.csv')
+        ok = downloaddata.download_csv_local(self.url, local_file=destino, columns=['CABECA'], chunksize=64)
+        self.assertFalse(ok)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+
+class TestDownloadResumable(LocalServerTestCase):
+    '''
+    Classe de teste para download_file_resumable, com um servidor que derruba conexoes.
+    '''
+    def setUp(self):
+        LocalCSVHandler.payload = os.urandom(300000)
+        LocalCSVHandler.ranges = []
+        super().setUp()
+        self.destino = os.path.join(self.tmp.name, 'sermil2022.csv')
+
+    def tearDown(self):
+        LocalCSVHandler.drop_after = None
+        LocalCSVHandler.last_modified = 'Wed, 01 Jan 2025 00:00:00 GMT'
+        super().tearDown()
+
+    def test_resume_after_dropped_connection(self):
+        '''
+        A queda no meio deixa o arquivo parcial, e a chamada seguinte o retoma com Range.
+        '''
+        LocalCSVHandler.drop_after = 122880
+        info = downloaddata.download_file_resumable(self.url, self.destino, block_size=4096, tentativas=1)
+        self.assertIsNone(info)
+        self.assertTrue(os.path.exists(self.destino + '.part'))
+        self.assertTrue(os.path.exists(self.destino + '.part.json'))
+
+        esperado = hashlib.sha256(LocalCSVHandler.payload).hexdigest()
+        info = downloaddata.download_file_resumable(self.url, self.destino, expected_sha256=esperado)
+        self.assertEqual(info['sha256'], esperado)
+        self.assertEqual(LocalCSVHandler.ranges, [None, 'bytes=122880-'])
+        with open(self.destino, 'rb') as f:
+            self.assertEqual(f.read(), LocalCSVHandler.payload)
+        self.assertEqual(os.listdir(self.tmp.name), ['sermil2022.csv'])
+
+    def test_changed_file_is_not_spliced(self):
+        '''
+        Se o arquivo mudou no servidor, o If-Range com o Last-Modified faz o download recomecar;
+        sem ETag nem Last-Modified o trecho salvo nao e reaproveitado.
+        '''
+        LocalCSVHandler.drop_after = 122880
+        self.assertIsNone(downloaddata.download_file_resumable(self.url, self.destino, block_size=4096,
+                                                               tentativas=1))
+        LocalCSVHandler.payload = os.urandom(300000)
+        LocalCSVHandler.last_modified = 'Thu, 02 Jan 2025 00:00:00 GMT'
+        info = downloaddata.download_file_resumable(self.url, self.destino)
+        self.assertEqual(info['sha256'], hashlib.sha256(LocalCSVHandler.payload).hexdigest())
+
+        os.remove(self.destino)
+        LocalCSVHandler.ranges = []
+        LocalCSVHandler.last_modified = None
+        LocalCSVHandler.drop_after = 122880
+        self.assertIsNone(downloaddata.download_file_resumable(self.url, self.destino, block_size=4096,
+                                                               tentativas=1))
+        info = downloaddata.download_file_resumable(self.url, self.destino)
+        self.assertEqual(LocalCSVHandler.ranges, [None, None])
+        self.assertEqual(info['size'], 300000)
+
+    def test_retry_in_same_call(self):
+        '''
+        Com mais de uma tentativa, a mesma chamada retoma o download sozinha.
+        '''
+        LocalCSVHandler.drop_after = 5120
+        info = downloaddata.download_file_resumable(self.url, self.destino, block_size=1024)
+        self.assertEqual(info['size'], 300000)
+        self.assertEqual(LocalCSVHandler.ranges[1], 'bytes=5120-')
+
+    def test_checksum_mismatch(self):
+        '''
+        Um hash diferente do esperado descarta o arquivo.
+        '''
+        info = downloaddata.download_file_resumable(self.url, self.destino, expected_sha256='0' * 64)
+        self.assertIsNone(info)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_csv_checksum(self):
+        '''
+        download_csv_local confere o hash esperado antes de gravar o csv.
+        '''
+        LocalCSVHandler.payload = b'PESO,ALTURA\n70,175\n80,180\n'
+        esperado = hashlib.sha256(LocalCSVHandler.payload).hexdigest()
+        self.assertFalse(downloaddata.download_csv_local(self.url, local_file=self.destino, expected_sha256='0' * 64))
+        self.assertEqual(os.listdir(self.tmp.name), [])
+        self.assertTrue(downloaddata.download_csv_local(self.url, local_file=self.destino, columns=['PESO'],
+                                                        expected_sha256=esperado))
+        self.assertEqual(pd.read_csv(self.destino)['PESO'].tolist(), [70, 80])
+
+
+class TestRefreshAllData(LocalServerTestCase):
+    '''
+    Classe de teste para refresh_alldata e o manifesto de downloads.
+    '''
+    def setUp(self):
+        LocalCSVHandler.payload = b'PESO,ALTURA\n70,175\n80,180\n'
+        LocalCSVHandler.etag = '"v1"'
+        super().setUp()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        base = f'http://127.0.0.1:{self.server.server_port}/sermil{{ano}}.csv'
+        self.patch = mock.patch.object(downloaddata, 'SERMIL_URL', base)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        LocalCSVHandler.etag = None
+        os.chdir(self.cwd)
+        super().tearDown()
+
+    def test_only_changed_years_are_fetched(self):
+        '''
+        Na segunda execucao so os anos cujo ETag mudou sao baixados de novo.
+        '''
+        atualizados, falhas = downloaddata.refresh_alldata(['PESO'], workers=4)
+        self.assertEqual(atualizados, list(range(2007, 2023)))
+        self.assertEqual(falhas, {})
+        manifest = downloaddata.load_manifest('sermil_manifest.json')
+        self.assertEqual(manifest['2022']['sha256'], hashlib.sha256(LocalCSVHandler.payload).hexdigest())
+        self.assertEqual(manifest['2022']['etag'], '"v1"')
+
+        atualizados, falhas = downloaddata.refresh_alldata(['PESO'], workers=4)
+        self.assertEqual(atualizados, [])
+
+        # Um ano apagado localmente e baixado de novo mesmo sem mudar no servidor.
+        os.remove('sermil2015.csv')
+        atualizados, falhas = downloaddata.refresh_alldata(['PESO'], workers=4)
+        self.assertEqual(atualizados, [2015])
+
+        # Com um novo ETag no servidor, todos os anos sao baixados de novo.
+        LocalCSVHandler.payload = b'PESO,ALTURA\n90,190\n'
+        LocalCSVHandler.etag = '"v2"'
+        atualizados, falhas = downloaddata.refresh_alldata(['PESO'], workers=4)
+        self.assertEqual(len(atualizados), 16)
+        self.assertEqual(pd.read_csv('sermil2015.csv')['PESO'].tolist(), [90])
+
+    def test_changed_columns_force_download(self):
+        '''
+        Com outra lista de colunas, os anos sao baixados de novo mesmo se o servidor responderia 304.
+        '''
+        downloaddata.refresh_alldata(['PESO'], workers=4)
+        atualizados, falhas = downloaddata.refresh_alldata(['PESO', 'ALTURA'], workers=4)
+        self.assertEqual(atualizados, list(range(2007, 2023)))
+        self.assertEqual(list(pd.read_csv('sermil2022.csv').columns), ['PESO', 'ALTURA'])
+        manifest = downloaddata.load_manifest('sermil_manifest.json')
+        self.assertEqual(manifest['2022']['columns'], ['PESO', 'ALTURA'])
+        atualizados, falhas = downloaddata.refresh_alldata(['PESO', 'ALTURA'], workers=4)
+        self.assertEqual(atualizados, [])
+
+    def test_folder_holds_csvs_and_manifest(self):
+        '''
+        Com folder, os csvs e o manifesto sao gravados nessa pasta e nao na pasta atual.
+        '''
+        os.makedirs('csvs')
+        atualizados, falhas = downloaddata.refresh_alldata(['PESO'], workers=4, folder='csvs')
+        self.assertEqual(atualizados, list(range(2007, 2023)))
+        self.assertEqual(os.listdir('.'), ['csvs'])
+        self.assertIn('sermil_manifest.json', os.listdir('csvs'))
+        self.assertEqual(pd.read_csv(os.path.join('csvs', 'sermil2022.csv'))['PESO'].tolist(), [70, 80])
+        atualizados, falhas = downloaddata.refresh_alldata(['PESO'], workers=4, folder='csvs')
+        self.assertEqual(atualizados, [])
+
+    def test_truncated_response_keeps_previous_file(self):
+        '''
+        Uma resposta cortada no meio, ou com hash diferente do esperado, nao substitui o csv ja baixado.
+        '''
+        url = downloaddata.SERMIL_URL.format(ano=2022)
+        resultado = downloaddata.download_csv_conditional(url, 'sermil2022.csv')
+        self.assertTrue(resultado[0])
+        LocalCSVHandler.payload = b'PESO,ALTURA\n' + b'90,190\n' * 1000
+        LocalCSVHandler.etag = '"v2"'
+        LocalCSVHandler.drop_after = 100
+        try:
+            self.assertIsNone(downloaddata.download_csv_conditional(url, 'sermil2022.csv', resultado[1]))
+        finally:
+            LocalCSVHandler.drop_after = None
+        self.assertIsNone(downloaddata.download_csv_conditional(url, 'sermil2022.csv', resultado[1],
+                                                                expected_sha256='0' * 64))
+        self.assertEqual(pd.read_csv('sermil2022.csv')['PESO'].tolist(), [70, 80])
+        self.assertEqual(sorted(os.listdir('.')), ['sermil2022.csv'])
+
+
+class TestDownloadAllData(unittest.TestCase):
+    '''
+    Classe de teste para a funcao download_alldata.
+    '''
+    def setUp(self):
+        '''
+        Executa os testes em uma pasta temporaria, ja que os csvs sao salvos no diretorio atual.
+        '''
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_parallel_collects_failures(self):
+        '''
+        Os anos que falham devem ser devolvidos, e os demais baixados.
+        '''
+        def falso_download(ano, colunas, **opcoes):
+            if ano == 2010:
+                return False
+            if ano == 2011:
+                raise ConnectionError('conexao perdida')
+            return True
+
+        with mock.patch.object(downloaddata, '_download_year', side_effect=falso_download) as download:
+            falhas = downloaddata.download_alldata(['PESO'], workers=4)
+
+        self.assertEqual(download.call_count, 16)
+        self.assertEqual(sorted(falhas), [2010, 2011])
+        self.assertEqual(falhas[2011], 'conexao perdida')
+
+    def test_existing_files_are_skipped(self):
+        '''
+        Anos ja presentes localmente nao devem ser baixados de novo.
+        '''
+        for ano in range(2007, 2023):
+            if ano != 2022:
+                open(f'sermil{ano}.csv', 'w').close()
+
+        with mock.patch.object(downloaddata, '_download_year', return_value=True) as download:
+            falhas = downloaddata.download_alldata(['PESO'], workers=8)
+
+        download.assert_called_once_with(2022, ['PESO'], chunksize=None, resumable=False)
+        self.assertEqual(falhas, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
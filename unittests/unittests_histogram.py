@@ -0,0 +1,86 @@
+'''
+Modulo para testes dos histogramas de contagem das medidas inteiras.
+'''
+import sys
+import os
+
+# Importante: mudar o path de acordo com a sua máquina, observe que é o path para a pasta do repositorio.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import numpy as np
+import pandas as pd
+
+from utils.histogram import MAX_WIDTH, IntegerHistogram, grouped_histograms, fits_histogram
+from utils.streamstats import KLLSketch, describe_series
+
+
+class TestIntegerHistogram(unittest.TestCase):
+    '''
+    Classe de teste para IntegerHistogram e grouped_histograms.
+    '''
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.anos = [rng.integers(150, 200, 5000) for _ in range(3)]
+
+    def test_quantiles_are_exact(self):
+        '''
+        Os quantis do histograma juntado sao os mesmos do pandas sobre todos os valores.
+        '''
+        histograma = IntegerHistogram()
+        for valores in self.anos:
+            histograma.merge(IntegerHistogram().update(valores))
+        todos = pd.Series(np.concatenate(self.anos))
+        q = np.linspace(0, 1, 41)
+        np.testing.assert_allclose(histograma.quantile(q), todos.quantile(q).to_numpy())
+        self.assertEqual(histograma.n, len(todos))
+        self.assertEqual(histograma.rank_error(), 0.0)
+
+    def test_merge_is_addition(self):
+        '''
+        Juntar histogramas de faixas diferentes e somar as contagens, e to_frame/from_counts se invertem.
+        '''
+        a = IntegerHistogram().update([40, 41, 41])
+        b = IntegerHistogram().update([45, 41])
+        quadro = a.to_frame()
+        juntos = IntegerHistogram.from_counts(quadro['VALOR'], quadro['N']).merge(b)
+        self.assertEqual(juntos.to_frame().to_dict('list'), {'VALOR': [40, 41, 45], 'N': [1, 3, 1]})
+        with self.assertRaises(ValueError):
+            IntegerHistogram().update([41.5])
+        with self.assertRaises(TypeError):
+            IntegerHistogram().merge(KLLSketch())
+        sketch = KLLSketch.from_histogram(juntos)
+        self.assertEqual(sketch.quantile([0, 0.5, 1]).tolist(), juntos.quantile([0, 0.5, 1]).tolist())
+
+    def test_width_is_capped(self):
+        '''
+        Um valor absurdo nao faz o vetor de contagens crescer: a faixa passa de MAX_WIDTH e gera ValueError.
+        '''
+        self.assertTrue(fits_histogram([150, 150 + MAX_WIDTH - 1]))
+        self.assertFalse(fits_histogram([170, 99999]))
+        histograma = IntegerHistogram().update([170, 180])
+        self.assertFalse(fits_histogram([99999], histograma))
+        with self.assertRaises(ValueError):
+            histograma.update([99999])
+        with self.assertRaises(ValueError):
+            histograma.merge(IntegerHistogram().update([99999]))
+        self.assertEqual(histograma.limites(), (170, 180))
+        with self.assertRaises(ValueError):
+            grouped_histograms(pd.Series([2020, 2021]), pd.Series([170, 99999]))
+        serie = pd.Series([170, 180, 99999, 175], name='ALTURA')
+        pd.testing.assert_series_equal(describe_series(serie), serie.astype('float64').describe())
+
+    def test_grouped_histograms_and_describe(self):
+        '''
+        Os histogramas por grupo batem com value_counts e describe_series com describe().
+        '''
+        df = pd.DataFrame({'ANO': np.repeat([2020, 2021, 2022], 5000), 'ALTURA': np.concatenate(self.anos)})
+        contagem = grouped_histograms(df['ANO'], df['ALTURA']).set_index(['GRUPO', 'VALOR'])['N']
+        esperado = df.groupby(['ANO', 'ALTURA']).size()
+        self.assertEqual(contagem.to_dict(), esperado.to_dict())
+        serie = df['ALTURA'].astype('UInt16')
+        pd.testing.assert_series_equal(describe_series(serie), serie.describe().astype('float64'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+'''
+Modulo para testes da camada HTTP compartilhada (httpclient).
+'''
+import sys
+import os
+
+# Importante: mudar o path de acordo com a sua máquina, observe que é o path para a pasta do repositorio.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gc
+import time
+import unittest
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import requests
+
+from utils import httpclient
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    '''
+    Servidor que falha as primeiras requisicoes e conta quantas estao abertas ao mesmo tempo.
+    '''
+    falhas_restantes = 0
+    demora = 0
+    abertas = 0
+    max_abertas = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with FlakyHandler.lock:
+            FlakyHandler.abertas += 1
+            FlakyHandler.max_abertas = max(FlakyHandler.max_abertas, FlakyHandler.abertas)
+        try:
+            time.sleep(FlakyHandler.demora)
+            with FlakyHandler.lock:
+                falhar = FlakyHandler.falhas_restantes > 0
+                FlakyHandler.falhas_restantes -= 1
+            corpo = b'ok'
+            self.send_response(503 if falhar else 200)
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+        finally:
+            with FlakyHandler.lock:
+                FlakyHandler.abertas -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHttpClient(unittest.TestCase):
+    '''
+    Classe de teste para httpclient.get.
+    '''
+    def setUp(self):
+        FlakyHandler.falhas_restantes = 0
+        FlakyHandler.demora = 0
+        FlakyHandler.max_abertas = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/arquivo'
+        self.backoff = mock.patch.object(httpclient, 'BACKOFF_BASE', 0.01)
+        self.backoff.start()
+
+    def tearDown(self):
+        self.backoff.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_temporary_failure(self):
+        '''
+        Respostas 503 sao repetidas ate o servidor responder 200.
+        '''
+        FlakyHandler.falhas_restantes = 2
+        response = httpclient.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, 'ok')
+
+    def test_retries_exhausted(self):
+        '''
+        Esgotadas as tentativas, a ultima resposta e devolvida.
+        '''
+        FlakyHandler.falhas_restantes = 10
+        response = httpclient.get(self.url, retries=1)
+        self.assertEqual(response.status_code, 503)
+
+    def test_read_timeout(self):
+        '''
+        Um servidor travado gera erro de timeout em vez de travar para sempre.
+        '''
+        FlakyHandler.demora = 1
+        with self.assertRaises(requests.exceptions.Timeout):
+            httpclient.get(self.url, timeout=(1, 0.2), retries=0)
+
+    def test_per_host_cap(self):
+        '''
+        Nunca ha mais requisicoes abertas para o servidor do que o limite.
+        '''
+        FlakyHandler.demora = 0.05
+
+        def baixa(_):
+            with httpclient.get(self.url, stream=True) as response:
+                return response.content
+
+        with ThreadPoolExecutor(max_workers=12) as executor:
+            resultados = list(executor.map(baixa, range(24)))
+        self.assertEqual(resultados, [b'ok'] * 24)
+        self.assertLessEqual(FlakyHandler.max_abertas, httpclient.MAX_CONNECTIONS_PER_HOST)
+
+    def test_slots_released_without_close(self):
+        '''
+        Respostas lidas ate o fim ou descartadas sem fechar nao prendem as vagas do servidor.
+        '''
+        for _ in range(httpclient.MAX_CONNECTIONS_PER_HOST + 2):
+            self.assertEqual(httpclient.get(self.url, stream=True).content, b'ok')
+        for _ in range(httpclient.MAX_CONNECTIONS_PER_HOST + 2):
+            httpclient.get(self.url, stream=True)
+            gc.collect()
+        slot = httpclient._host_slot(f'127.0.0.1:{self.server.server_port}')
+        vagas = [slot.acquire(timeout=1) for _ in range(httpclient.MAX_CONNECTIONS_PER_HOST)]
+        for _ in range(sum(vagas)):
+            slot.release()
+        self.assertEqual(vagas, [True] * httpclient.MAX_CONNECTIONS_PER_HOST)
+
+
+if __name__ == '__main__':
+    unittest.main()
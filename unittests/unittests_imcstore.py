@@ -0,0 +1,126 @@
+'''
+Modulo para testes do cubo de IMC por ano guardado no armazenamento de agregados.
+'''
+import sys
+import os
+
+# Importante: mudar o path de acordo com a sua máquina, observe que é o path para a pasta do repositorio.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import tempfile
+from unittest import mock
+import numpy as np
+import pandas as pd
+
+from utils import aggstore, dataset, imcstore, yearstore, utils_gabriel
+
+
+class TestImcCube(unittest.TestCase):
+    '''
+    Classe de teste para o cubo de IMC por ano, UF e DISPENSA.
+    '''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = os.path.join(self.tmp.name, dataset.DATASET_DIRNAME)
+        self.aggdir = yearstore.aggstore_dir_for(self.store)
+        rng = np.random.default_rng(5)
+        self.frames = {}
+        for ano in (2020, 2021):
+            linhas = 400
+            self.frames[ano] = pd.DataFrame({
+                'ALTURA': rng.integers(150, 200, linhas), 'PESO': rng.integers(45, 140, linhas),
+                'DISPENSA': rng.choice(['Com dispensa', 'Sem dispensa'], linhas),
+                'UF_RESIDENCIA': rng.choice(['SP', 'RJ', 'AM'], linhas)})
+            dataset.append_year(self.frames[ano], ano, self.store)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _esperado(self, df):
+        imc = df['PESO'] / (df['ALTURA'] / 100) ** 2
+        categoria = pd.cut(imc, bins=imcstore.IMC_BINS, labels=imcstore.IMC_LABELS)
+        contagem = pd.crosstab(categoria, df['DISPENSA']).reindex(imcstore.IMC_LABELS, fill_value=0)
+        return contagem / contagem.sum()
+
+    def test_percentages_match_raw_data(self):
+        '''
+        As porcentagens vindas do cubo sao as do pd.cut sobre os dados brutos, com e sem filtros de ano e UF.
+        '''
+        aggstore.update_aggstore(self.store)
+        todos = pd.concat(self.frames.values(), ignore_index=True)
+        casos = [(None, None, todos), ([2021], None, self.frames[2021]),
+                 ([2020], ['SP', 'AM'], self.frames[2020][self.frames[2020]['UF_RESIDENCIA'].isin(['SP', 'AM'])])]
+        for anos, ufs, df in casos:
+            resultado = imcstore.imc_percentages(imcstore.load_imc_cube(self.aggdir, anos, ufs))
+            esperado = self._esperado(df)
+            np.testing.assert_allclose(resultado[esperado.columns].to_numpy(), esperado.to_numpy())
+
+    def test_new_year_updates_only_its_slice(self):
+        '''
+        Um ano novo acrescenta so a sua parte do cubo.
+        '''
+        aggstore.update_aggstore(self.store)
+        antes = imcstore.load_imc_cube(self.aggdir)
+        dataset.append_year(self.frames[2021], 2022, self.store)
+        self.assertEqual(aggstore.update_aggstore(self.store), [2022])
+        depois = imcstore.load_imc_cube(self.aggdir)
+        self.assertEqual(depois['N'].sum(), antes['N'].sum() + len(self.frames[2021]))
+        self.assertEqual(sorted(depois['ANO_COLETA'].unique()), [2020, 2021, 2022])
+
+    def test_missing_uf_fails_when_filtering(self):
+        '''
+        Filtrar por UF um ano cujo cubo nao tem UF_RESIDENCIA levanta ValueError, em vez de omitir o ano.
+        '''
+        dataset.append_year(self.frames[2021].drop(columns=['UF_RESIDENCIA']), 2022, self.store)
+        aggstore.update_aggstore(self.store)
+        self.assertEqual(imcstore.load_imc_cube(self.aggdir, [2020, 2021], ['SP'])['N'].sum(),
+                         sum((df['UF_RESIDENCIA'] == 'SP').sum() for df in self.frames.values()))
+        with self.assertRaises(ValueError):
+            imcstore.load_imc_cube(self.aggdir, ufs=['SP'])
+        self.assertEqual(imcstore.load_imc_cube(self.aggdir, [2022])['N'].sum(), len(self.frames[2021]))
+
+    def test_update_imc_data_ignores_other_csvs_with_year(self):
+        '''
+        Com 'sermil2022.csv' e 'sermilH2022.csv' na pasta, o cubo de 2022 vem do primeiro e so e refeito se o csv mudar.
+        '''
+        pasta = os.path.join(self.tmp.name, 'csvs')
+        os.makedirs(pasta)
+        self.frames[2021].to_csv(os.path.join(pasta, 'sermil2022.csv'), index=False)
+        pd.DataFrame({'ESCOLARIDADE': ['Superior'], 'DISPENSA': ['Sem dispensa']}).to_csv(
+            os.path.join(pasta, 'sermilH2022.csv'), index=False)
+
+        with mock.patch.object(utils_gabriel, 'refresh_alldata', return_value=([], {})) as download:
+            self.assertEqual(utils_gabriel.update_imc_data(folder=pasta), [2022])
+            self.assertEqual(utils_gabriel.update_imc_data(folder=pasta), [])
+        self.assertEqual(download.call_args.kwargs['folder'], pasta)
+
+        destino = dataset.dataset_dir_for(pasta)
+        self.assertEqual(dataset.read_dataset(destino, columns=['PESO'])['PESO'].tolist(),
+                         self.frames[2021]['PESO'].tolist())
+        resultado = imcstore.imc_percentages(imcstore.load_imc_cube(yearstore.aggstore_dir_for(destino), [2022]))
+        esperado = self._esperado(self.frames[2021])
+        np.testing.assert_allclose(resultado[esperado.columns].to_numpy(), esperado.to_numpy())
+
+    def test_bar_plot_imc_only_reads_the_cube(self):
+        '''
+        bar_plot_imc nao baixa nem grava nada; sem cubo para os anos pedidos ele levanta ValueError.
+        '''
+        pasta = os.path.join(self.tmp.name, 'csvs')
+        os.makedirs(pasta)
+        with self.assertRaises(ValueError):
+            utils_gabriel.bar_plot_imc(folder=pasta)
+
+        aggstore.update_aggstore(self.store)
+        with mock.patch.object(utils_gabriel, 'refresh_alldata') as download, \
+                mock.patch.object(utils_gabriel, 'update_dataset') as atualizar, \
+                mock.patch.object(utils_gabriel.plt, 'show'):
+            utils_gabriel.bar_plot_imc(anos=[2021], ufs=['SP'], folder=self.tmp.name)
+        utils_gabriel.plt.close('all')
+        download.assert_not_called()
+        atualizar.assert_not_called()
+        with self.assertRaises(ValueError):
+            utils_gabriel.bar_plot_imc(anos=[2019], folder=self.tmp.name)
+
+if __name__ == '__main__':
+    unittest.main()
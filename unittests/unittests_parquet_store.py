@@ -0,0 +1,116 @@
+'''
+Modulo para testes do armazenamento Parquet particionado por ano.
+'''
+import sys
+import os
+
+# Importante: mudar o path de acordo com a sua máquina, observe que é o path para a pasta do repositorio.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+import unittest
+import tempfile
+import pandas as pd
+
+from utils import parquet_store
+from utils.utils_gabriel import read_local_data
+
+
+class TestParquetStore(unittest.TestCase):
+    '''
+    Classe de teste para a conversao e a leitura do armazenamento Parquet.
+    '''
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = self.tmp.name
+        for ano in range(2018, 2023):
+            df = pd.DataFrame({'PESO': [60 + ano % 10, 70.5],
+                               'ALTURA': [170, 180],
+                               'UF_RESIDENCIA': ['SP', 'RJ']})
+            df.to_csv(os.path.join(self.folder, f'sermil{ano}.csv'), index=False)
+        self.store = os.path.join(self.folder, parquet_store.STORE_DIRNAME)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_convert_folder_once(self):
+        '''
+        Cada ano e convertido uma vez; uma segunda chamada nao converte nada.
+        '''
+        self.assertEqual(parquet_store.convert_folder(self.folder), [2018, 2019, 2020, 2021, 2022])
+        self.assertEqual(parquet_store.convert_folder(self.folder), [])
+        self.assertEqual(parquet_store.stored_years(self.store), [2018, 2019, 2020, 2021, 2022])
+
+    def test_read_store_projection_and_years(self):
+        '''
+        Apenas as colunas e os anos pedidos sao devolvidos, com a coluna ANO_COLETA.
+        '''
+        parquet_store.convert_folder(self.folder)
+        df = parquet_store.read_store(self.store, columns=['PESO'], anos=[2019, 2021])
+        self.assertEqual(list(df.columns), ['PESO', 'ANO_COLETA'])
+        self.assertEqual(df['ANO_COLETA'].tolist(), [2019, 2019, 2021, 2021])
+        self.assertEqual(df['PESO'].tolist(), [69, 70.5, 61, 70.5])
+
+    def test_stale_partition_falls_back_to_csv(self):
+        '''
+        Se o csv mudou depois da conversao, ele e lido no lugar do Parquet.
+        '''
+        csv = os.path.join(self.folder, 'sermil2022.csv')
+        parquet_store.convert_folder(self.folder)
+        self.assertTrue(parquet_store.is_fresh(csv))
+
+        time.sleep(0.01)
+        pd.DataFrame({'PESO': [99], 'ALTURA': [190], 'UF_RESIDENCIA': ['MG']}).to_csv(csv, index=False)
+        os.utime(csv, (time.time() + 5, time.time() + 5))
+        self.assertFalse(parquet_store.is_fresh(csv))
+        self.assertEqual(parquet_store.read_sermil_csv(csv, usecols=['PESO'])['PESO'].tolist(), [99])
+
+    def test_missing_column(self):
+        '''
+        Uma coluna inexistente gera ValueError, como no read_csv com usecols.
+        '''
+        csv = os.path.join(self.folder, 'sermil2020.csv')
+        parquet_store.convert_csv_to_parquet(csv)
+        with self.assertRaises(ValueError):
+            parquet_store.read_sermil_csv(csv, usecols=['CABECA'])
+
+    def test_read_local_data_uses_store(self):
+        '''
+        read_local_data continua funcionando com apenas o Parquet presente.
+        '''
+        csv = os.path.join(self.folder, 'sermil2020.csv')
+        parquet_store.convert_csv_to_parquet(csv)
+        os.remove(csv)
+        df = read_local_data(csv, cols=['ALTURA', 'UF_RESIDENCIA'])
+        self.assertEqual(df['UF_RESIDENCIA'].tolist(), ['SP', 'RJ'])
+
+    def test_other_csvs_with_year_keep_their_columns(self):
+        '''
+        'sermilH2022.csv' nao e convertido nem lido como a particao de 2022.
+        '''
+        outro = os.path.join(self.folder, 'sermilH2022.csv')
+        pd.DataFrame({'ESCOLARIDADE': ['Superior'], 'DISPENSA': ['Sem dispensa']}).to_csv(outro, index=False)
+        self.assertEqual(parquet_store.convert_folder(self.folder), [2018, 2019, 2020, 2021, 2022])
+        self.assertFalse(parquet_store.is_fresh(outro))
+        self.assertEqual(parquet_store.peek_columns(outro), (['ESCOLARIDADE', 'DISPENSA'], True))
+        self.assertEqual(parquet_store.read_sermil_csv(outro, usecols=['ESCOLARIDADE'])['ESCOLARIDADE'].tolist(),
+                         ['Superior'])
+        csv = os.path.join(self.folder, 'sermil2022.csv')
+        self.assertEqual(parquet_store.read_sermil_csv(csv)['PESO'].tolist(), [62, 70.5])
+
+    def test_csv_arguments_on_parquet(self):
+        '''
+        nrows e dtype valem tambem para o Parquet; outros argumentos sem o csv geram TypeError.
+        '''
+        csv = os.path.join(self.folder, 'sermil2020.csv')
+        parquet_store.convert_csv_to_parquet(csv)
+        os.remove(csv)
+        df = parquet_store.read_sermil_csv(csv, schema=False, nrows=1, dtype={'ALTURA': 'float64'}, encoding='latin1')
+        self.assertEqual(len(df), 1)
+        self.assertEqual(str(df['ALTURA'].dtype), 'float64')
+        with self.assertRaises(TypeError):
+            parquet_store.read_sermil_csv(csv, sep=';')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+'''
+Modulo para testes do pipeline de ingestao (download -> parse -> escrita).
+'''
+import sys
+import os
+
+# Importante: mudar o path de acordo com a sua máquina, observe que é o path para a pasta do repositorio.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import pandas as pd
+
+from utils import downloaddata, pipeline
+
+
+class YearHandler(BaseHTTPRequestHandler):
+    '''
+    Servidor local que devolve um csv pequeno para cada ano, e 404 para 2013.
+    '''
+    def do_GET(self):
+        ano = int(self.path[-8:-4])
+        if ano == 2013:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        corpo = f'PESO,ALTURA,SEXO\n70,{ano % 100 + 100},M\n,180,F\n80,175,M\n'.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRunPipeline(unittest.TestCase):
+    '''
+    Classe de teste para a funcao run_pipeline.
+    '''
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), YearHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{self.server.server_port}/sermil{{ano}}.csv'
+        self.patch = mock.patch.object(downloaddata, 'SERMIL_URL', base)
+        self.patch.start()
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_pipeline_writes_years_and_reports(self):
+        '''
+        Os anos sao escritos com as colunas pedidas, as falhas sao registradas e as metricas devolvidas.
+        '''
+        resultado = pipeline.run_pipeline(anos=list(range(2010, 2016)), desired_columns=['PESO', 'ALTURA'],
+                                          folder=self.tmp.name, download_workers=3, queue_size=1)
+        self.assertEqual(list(resultado['escritos']), [2010, 2011, 2012, 2014, 2015])
+        self.assertEqual(list(resultado['falhas']), [2013])
+
+        df = pd.read_csv(resultado['escritos'][2012])
+        self.assertEqual(list(df.columns), ['PESO', 'ALTURA'])
+        self.assertEqual(df['ALTURA'].tolist(), [112, 175])
+
+        metricas = resultado['metricas']
+        self.assertEqual(metricas['etapas']['download']['itens'], 5)
+        self.assertEqual(metricas['etapas']['download']['falhas'], 1)
+        self.assertEqual(metricas['etapas']['escrita']['itens'], 5)
+        self.assertLessEqual(metricas['filas']['download->parse']['ocupacao_maxima'], 1)
+        self.assertIn(metricas['gargalo'], ('download', 'parse', 'escrita'))
+        # Os arquivos brutos sao apagados depois do parse.
+        self.assertFalse([f for f in os.listdir(self.tmp.name) if f.endswith('.raw')])
+
+    def test_failed_parse_removes_raw_file(self):
+        '''
+        O parse le em blocos; se ele falha (coluna inexistente), o ano e registrado e nenhum arquivo bruto sobra.
+        '''
+        with mock.patch.object(pipeline, 'process_data_chunks', wraps=pipeline.process_data_chunks) as parse:
+            resultado = pipeline.run_pipeline(anos=[2020], desired_columns=['CABECA'], folder=self.tmp.name,
+                                              chunksize=1)
+        self.assertEqual(parse.call_args.kwargs['chunksize'], 1)
+        self.assertEqual(resultado['escritos'], {})
+        self.assertEqual(list(resultado['falhas']), [2020])
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_custom_writer(self):
+        '''
+        A etapa de escrita pode ser trocada, por exemplo por um armazenamento em outro formato.
+        '''
+        recebidos = {}
+
+        def writer(ano, df, folder):
+            recebidos[ano] = len(df)
+            return f'memoria://{ano}'
+
+        resultado = pipeline.run_pipeline(anos=[2020, 2021], folder=self.tmp.name, writer=writer)
+        self.assertEqual(resultado['escritos'], {2020: 'memoria://2020', 2021: 'memoria://2021'})
+        self.assertEqual(recebidos, {2020: 2, 2021: 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
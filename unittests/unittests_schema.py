@@ -0,0 +1,69 @@
+'''
+Modulo para testes do esquema de tipos do SERMIL.
+'''
+import sys
+import os
+
+# Importante: mudar o path de acordo com a sua máquina, observe que é o path para a pasta do repositorio.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import tempfile
+import pandas as pd
+
+from utils.schema import apply_schema, memory_report
+from utils.parquet_store import read_sermil_csv
+
+
+class TestApplySchema(unittest.TestCase):
+    '''
+    Classe de teste para apply_schema e memory_report.
+    '''
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'ALTURA': [170.0, 182.0, None, 165.0] * 500,
+            'CABECA': [56, 57, 58, 300] * 500,
+            'PESO': [70.5, 80.0, 65.0, 90.0] * 500,
+            'UF_RESIDENCIA': ['SP', 'RJ', 'MG', 'SP'] * 500,
+            'OUTRA': ['a', 'b', 'c', 'd'] * 500,
+        })
+
+    def test_types(self):
+        '''
+        Inteiros compactos quando possivel, float32 caso contrario, e categorias para texto.
+        '''
+        resultado = apply_schema(self.df)
+        self.assertEqual(str(resultado['ALTURA'].dtype), 'UInt16')
+        self.assertTrue(resultado['ALTURA'].isna().sum() == 500)
+        # 300 nao cabe em UInt8.
+        self.assertEqual(str(resultado['CABECA'].dtype), 'float32')
+        self.assertEqual(str(resultado['PESO'].dtype), 'float32')
+        self.assertIsInstance(resultado['UF_RESIDENCIA'].dtype, pd.CategoricalDtype)
+        self.assertEqual(resultado['OUTRA'].dtype, self.df['OUTRA'].dtype)
+        # O DataFrame original nao e alterado.
+        self.assertEqual(str(self.df['ALTURA'].dtype), 'float64')
+
+    def test_memory_report(self):
+        '''
+        O relatorio mostra a economia por coluna e no total.
+        '''
+        relatorio = memory_report(self.df, apply_schema(self.df))
+        self.assertIn('TOTAL', relatorio.index)
+        self.assertGreater(relatorio.loc['ALTURA', 'ECONOMIA_BYTES'], 0)
+        self.assertGreater(relatorio.loc['UF_RESIDENCIA', 'ECONOMIA'], 0.5)
+        self.assertGreater(relatorio.loc['TOTAL', 'ECONOMIA'], 0)
+
+    def test_loader_applies_schema(self):
+        '''
+        Os leitores do projeto devolvem os tipos do esquema.
+        '''
+        with tempfile.TemporaryDirectory() as pasta:
+            csv = os.path.join(pasta, 'sermil2022.csv')
+            self.df.to_csv(csv, index=False)
+            resultado = read_sermil_csv(csv, usecols=['ALTURA', 'UF_RESIDENCIA'])
+        self.assertEqual(str(resultado['ALTURA'].dtype), 'UInt16')
+        self.assertIsInstance(resultado['UF_RESIDENCIA'].dtype, pd.CategoricalDtype)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+'''
+Modulo para testes das estatisticas em fluxo (momentos e sketch de quantis).
+'''
+import sys
+import os
+
+# Importante: mudar o path de acordo com a sua máquina, observe que é o path para a pasta do repositorio.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import tempfile
+import numpy as np
+import pandas as pd
+
+from utils import dataset
+from utils.histogram import IntegerHistogram
+from utils.streamstats import StreamingStats, stream_stats
+from utils.utils_tomas import get_stats
+
+
+class TestStreamingStats(unittest.TestCase):
+    '''
+    Classe de teste para StreamingStats e stream_stats.
+    '''
+    def test_small_input_matches_describe(self):
+        '''
+        Sem compactacao o resultado e o mesmo de describe(), em qualquer divisao em blocos.
+        '''
+        serie = pd.Series([170, 181, None, 165, 190, 172, 168], name='ALTURA')
+        stats = StreamingStats('ALTURA').update(serie[:3]).merge(StreamingStats().update(serie[3:]))
+        pd.testing.assert_series_equal(stats.describe(), serie.describe())
+        self.assertEqual(stats.describe().attrs['erro_rank'], 0.0)
+
+    def test_non_integer_values_and_mixed_sketches(self):
+        '''
+        Valores nao inteiros numa coluna de histograma e juntar histograma com KLL dao o mesmo describe().
+        '''
+        serie = pd.Series([170.5, 180, 175, 168, 181.25], name='ALTURA')
+        pd.testing.assert_series_equal(get_stats([serie[:3].to_frame(), serie[3:].to_frame()], 'ALTURA'),
+                                       serie.describe())
+        inteiros = pd.Series([170, 181, 165, 190, 172, 168], name='ALTURA')
+        for primeiro, segundo in [(StreamingStats(), StreamingStats('ALTURA')),
+                                  (StreamingStats('ALTURA'), StreamingStats())]:
+            stats = primeiro.update(inteiros[:2]).merge(segundo.update(inteiros[2:]))
+            stats.name = 'ALTURA'
+            pd.testing.assert_series_equal(stats.describe(), inteiros.astype('float64').describe())
+
+    def test_wide_values_switch_to_kll(self):
+        '''
+        Um valor absurdo num bloco ou num resumo juntado troca o histograma por KLL, com o mesmo describe().
+        '''
+        serie = pd.Series([170, 181, 165, 99999, 172, 168], name='ALTURA')
+        stats = StreamingStats('ALTURA').update(serie[:3]).update(serie[3:])
+        self.assertNotIsInstance(stats.sketch, IntegerHistogram)
+        pd.testing.assert_series_equal(stats.describe(), serie.astype('float64').describe())
+        juntos = StreamingStats('ALTURA').update(serie[:3]).merge(StreamingStats('ALTURA').update(serie[3:4]))
+        self.assertNotIsInstance(juntos.sketch, IntegerHistogram)
+        self.assertEqual(juntos.describe()['max'], 99999)
+
+    def test_quartiles_within_rank_error(self):
+        '''
+        Com muitos valores os quartis ficam dentro do erro de posto informado e os momentos continuam exatos.
+        '''
+        rng = np.random.default_rng(1)
+        valores = rng.normal(172, 7, 200000)
+        stats = StreamingStats(k=200, seed=0)
+        for bloco in np.array_split(valores, 20):
+            stats.update(bloco)
+        esperado = pd.Series(valores).describe()
+        resultado = stats.describe()
+        erro = resultado.attrs['erro_rank']
+        self.assertGreater(erro, 0)
+        ordenados = np.sort(valores)
+        for q, nome in [(0.25, '25%'), (0.5, '50%'), (0.75, '75%')]:
+            posto = np.searchsorted(ordenados, resultado[nome]) / len(valores)
+            self.assertLessEqual(abs(posto - q), erro)
+            baixo, alto = stats.quantile_interval(q)
+            self.assertTrue(baixo <= esperado[nome] <= alto)
+        for nome in ['count', 'mean', 'std', 'min', 'max']:
+            self.assertAlmostEqual(resultado[nome], esperado[nome], places=6)
+
+    def test_dataset_years_in_parallel(self):
+        '''
+        Os anos do conjunto sao resumidos em processos separados com o mesmo resultado do processo unico.
+        '''
+        with tempfile.TemporaryDirectory() as tmp:
+            store = os.path.join(tmp, dataset.DATASET_DIRNAME)
+            frames = [pd.DataFrame({'ALTURA': [170 + ano % 7, 180, 175 + ano % 3]}) for ano in range(2020, 2023)]
+            for ano, df in zip(range(2020, 2023), frames):
+                dataset.append_year(df, ano, store)
+            um = stream_stats(store, 'ALTURA', workers=1).describe()
+            varios = stream_stats(store, 'ALTURA', workers=2).describe()
+            pd.testing.assert_series_equal(um, varios)
+            esperado = pd.concat(frames)['ALTURA'].astype('float64').describe()
+            pd.testing.assert_series_equal(get_stats(store, 'ALTURA'), esperado)
+            pd.testing.assert_series_equal(get_stats(dataset.SermilDataset(store), 'ALTURA'), esperado)
+            self.assertIsNone(get_stats(store, 'COLUNA_INEXISTENTE'))
+
+    def test_invalid_values_are_reported(self):
+        '''
+        As regras de get_stats sao verificadas em cada bloco.
+        '''
+        pedacos = [pd.DataFrame({'CABECA': [56, 57]}), pd.DataFrame({'CABECA': [57, -1]})]
+        self.assertIsNone(get_stats(pedacos, 'CABECA'))
+        stats = stream_stats(pedacos, 'CABECA', rules={'positive': True})
+        self.assertEqual(stats.relatorio['primeira'], 'positivo')
+
+
+if __name__ == '__main__':
+    unittest.main()
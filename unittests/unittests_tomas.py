@@ -9,7 +9,7 @@ import pandas as pd
 
 # Adicionar um ponto antes do nome do módulo causa um erro na minha máquina quando executo o código.
 from utils_tomas import get_age,  merge_height_geography_df, create_height_heatmap, get_stats, create_correlation_matrix, create_age_histogram, get_state_coordinates
-from download_data_tomas import check_libraries, download_gpkg_local
+from download_data_tomas import check_libraries, download_gpkg_local, state_layer_path
 
 class TestExistenceFile(unittest.TestCase):
 
@@ -39,6 +39,44 @@ class TestExistenceFile(unittest.TestCase):
 
 
 
+class TestStateLayerExtraction(unittest.TestCase):
+    """
+    Classe de teste para a extração da camada dos estados do geopackage.
+    """
+
+    def setUp(self):
+        """
+        Cria um geopackage pequeno com a camada dos estados e uma camada extra.
+        """
+        import tempfile
+        import geopandas as gpd
+        from shapely.geometry import box
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.gpkg_path = os.path.join(self.tmp.name, "geo_data.gpkg")
+        estados = gpd.GeoDataFrame({"sigla": ["SP", "RJ"], "nome": ["São Paulo", "Rio de Janeiro"]},
+                                   geometry=[box(0, 0, 1, 1), box(1, 0, 2, 1)], crs="EPSG:4674")
+        estados.to_file(self.gpkg_path, layer="lim_unidade_federacao_a", driver="GPKG")
+        rios = gpd.GeoDataFrame({"nome": ["Tietê"]}, geometry=[box(0, 0, 3, 3)], crs="EPSG:4674")
+        rios.to_file(self.gpkg_path, layer="hid_trecho_drenagem_l", driver="GPKG")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_compact_file_is_used(self):
+        """
+        A primeira leitura extrai a camada dos estados, e as seguintes usam apenas o arquivo compacto.
+        """
+        result = get_state_coordinates(self.gpkg_path)
+        self.assertEqual(sorted(result["UF_RESIDENCIA"]), ["RJ", "SP"])
+        self.assertTrue(os.path.exists(state_layer_path(self.gpkg_path)))
+
+        # Sem o geopackage completo, a leitura continua funcionando pelo arquivo compacto.
+        os.remove(self.gpkg_path)
+        result = get_state_coordinates(self.gpkg_path)
+        self.assertEqual(sorted(result["UF_RESIDENCIA"]), ["RJ", "SP"])
+
+
 class TestMergeData(unittest.TestCase):
     """
     Classe de teste para a função merge_height_geography_df
@@ -0,0 +1,55 @@
+'''
+Modulo para testes da leitura paralela de save_data_in_list (utils_gabriel).
+'''
+import sys
+import os
+
+# Importante: mudar o path de acordo com a sua máquina, observe que é o path para a pasta do repositorio.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import tempfile
+import pandas as pd
+
+from utils.utils_gabriel import save_data_in_list
+
+
+class TestSaveDataInList(unittest.TestCase):
+    '''
+    Classe de teste para a leitura paralela da funcao save_data_in_list.
+    '''
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        for ano in (2008, 2010, 2011):
+            pd.DataFrame({'PESO': [ano % 100, None], 'ALTURA': [170, 180]}).to_csv(f'sermil{ano}.csv', index=False)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_parallel_same_as_serial(self):
+        '''
+        Os processos devolvem a mesma lista da leitura em serie, na ordem dos anos.
+        '''
+        serial = save_data_in_list(dropna=True)
+        paralelo = save_data_in_list(dropna=True, workers=3)
+        self.assertEqual(len(paralelo), 3)
+        self.assertEqual([df['PESO'].tolist() for df in paralelo], [[8], [10], [11]])
+        for a, b in zip(serial, paralelo):
+            self.assertTrue(a.equals(b))
+
+    def test_single_file_is_serial(self):
+        '''
+        Com apenas um arquivo a leitura e feita sem criar processos.
+        '''
+        os.remove('sermil2010.csv')
+        os.remove('sermil2011.csv')
+        resultado = save_data_in_list(cols=['ALTURA'], workers=8)
+        self.assertEqual(len(resultado), 1)
+        self.assertEqual(resultado[0]['ALTURA'].tolist(), [170, 180])
+
+
+if __name__ == '__main__':
+    unittest.main()
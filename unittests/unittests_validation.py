@@ -0,0 +1,78 @@
+'''
+Modulo para testes da validacao vetorizada das colunas numericas.
+'''
+import sys
+import os
+
+# Importante: mudar o path de acordo com a sua máquina, observe que é o path para a pasta do repositorio.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unittest
+import numpy as np
+import pandas as pd
+
+from utils.validation import check_numeric, raise_if_invalid
+
+
+def _primeira_regra_em_laco(serie, nonzero=False, positive=False, greater_than=None):
+    '''
+    Regras avaliadas valor a valor, como nos asserts antigos.
+    '''
+    for valor in serie:
+        if not isinstance(valor, (int, float, np.number)):
+            return 'tipo'
+        if nonzero and valor == 0:
+            return 'zero'
+        if positive and not valor > 0:
+            return 'positivo'
+        if greater_than is not None and not valor > greater_than:
+            return 'minimo'
+    return None
+
+
+class TestCheckNumeric(unittest.TestCase):
+    '''
+    Classe de teste para check_numeric e raise_if_invalid.
+    '''
+    def test_same_decision_as_loop(self):
+        '''
+        A primeira regra violada e a mesma do laco, para varios tipos de coluna.
+        '''
+        casos = [
+            pd.Series([170, 180, 190]),
+            pd.Series([170.0, np.nan, 0.0]),
+            pd.Series([170, 0, -1]),
+            pd.Series([170, None], dtype='UInt16'),
+            pd.Series([170, 'a', 0], dtype=object),
+            pd.Series([1999, 1920, 2001]),
+        ]
+        for serie in casos:
+            for regras in ({'nonzero': True, 'positive': True}, {'greater_than': 1920}):
+                relatorio = check_numeric(serie, **regras)
+                self.assertEqual(relatorio['primeira'], _primeira_regra_em_laco(serie, **regras))
+                self.assertEqual(relatorio['valido'], relatorio['primeira'] is None)
+
+    def test_report_counts_and_sample(self):
+        '''
+        O relatorio conta cada linha uma vez, na primeira regra violada, e traz a amostra com o indice original.
+        '''
+        serie = pd.Series([0, -3, 170, 'x', 0], index=[10, 11, 12, 13, 14], dtype=object, name='ALTURA')
+        relatorio = check_numeric(serie, nonzero=True, positive=True, sample=2)
+        self.assertEqual(relatorio['coluna'], 'ALTURA')
+        self.assertEqual(relatorio['linhas'], 5)
+        self.assertEqual(relatorio['falhas'], {'tipo': 1, 'zero': 2, 'positivo': 1, 'minimo': 0})
+        self.assertEqual(relatorio['amostra'].index.tolist(), [10, 11])
+        self.assertEqual(relatorio['amostra']['REGRA'].tolist(), ['zero', 'positivo'])
+
+    def test_raise_if_invalid(self):
+        '''
+        A mensagem levantada e a da regra da primeira linha rejeitada.
+        '''
+        mensagens = {'tipo': 'tipo', 'zero': 'zero', 'positivo': 'positivo'}
+        raise_if_invalid(check_numeric(pd.Series([1, 2]), nonzero=True, positive=True), mensagens)
+        with self.assertRaisesRegex(AssertionError, 'positivo'):
+            raise_if_invalid(check_numeric(pd.Series([1, -2, 0]), nonzero=True, positive=True), mensagens)
+
+
+if __name__ == '__main__':
+    unittest.main()
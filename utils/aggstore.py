@@ -0,0 +1,359 @@
+'''
+Agregados parciais por ano das colunas numericas do SERMIL, persistidos em
+disco.
+
+Para cada ano do conjunto de dados (modulo dataset) e guardada uma pequena
+tabela 'sermil_aggstore/{ano}.csv' com, para cada VINCULACAO_ANO e cada
+coluna numerica, o numero de valores, a soma, a soma dos quadrados, o minimo
+e o maximo. Essas parciais se somam entre anos, entao medias, desvios,
+totais e extremos de todo o historico saem delas sem reler os dados
+brutos. O indice da pasta (modulo yearstore) guarda a origem de cada ano (a
+mesma do manifesto do conjunto) e update_aggstore so recalcula os anos novos
+ou alterados.
+
+update_aggstore grava tambem, no mesmo passo, as outras tabelas por ano da
+pasta: os histogramas das medidas inteiras (histstore), que dao medianas e
+percentis exatos a yearly_stats, e o cubo de IMC (imcstore). As demais
+estatisticas que nao podem ser derivadas das parciais sao calculadas a
+partir dos dados brutos por yearly_stats.
+'''
+
+import os
+import numpy as np
+import pandas as pd
+from typing import List
+try:
+    from .manifest import save_manifest
+    from .colstore import NUMERIC_COLUMNS
+    from .dataset import load_dataset_manifest, read_dataset_year, SermilDataset
+    from .histogram import HISTOGRAM_COLUMNS
+    from .yearstore import (GROUP_COLUMN, INDEX_FILE, aggstore_dir_for, load_aggstore_index, read_year_tables,
+                            write_table)
+    from .histstore import HIST_TABLE, partial_histograms, load_histograms
+    from .imcstore import IMC_TABLE, CUBE_DIMENSIONS, imc_cube
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    from manifest import save_manifest
+    from colstore import NUMERIC_COLUMNS
+    from dataset import load_dataset_manifest, read_dataset_year, SermilDataset
+    from histogram import HISTOGRAM_COLUMNS
+    from yearstore import (GROUP_COLUMN, INDEX_FILE, aggstore_dir_for, load_aggstore_index, read_year_tables,
+                           write_table)
+    from histstore import HIST_TABLE, partial_histograms, load_histograms
+    from imcstore import IMC_TABLE, CUBE_DIMENSIONS, imc_cube
+
+# Colunas que yearly_mean usa; a media considera so as linhas completas nelas.
+COMPLETE_COLUMNS = ['CINTURA', 'PESO', 'ALTURA', 'CABECA']
+
+# Colunas contadas por yearly_aggregate.
+COUNT_COLUMNS = ['CINTURA', 'PESO', 'ALTURA']
+
+_PARTIAL_COLUMNS = [GROUP_COLUMN, 'ESCOPO', 'COLUNA', 'N', 'SOMA', 'SOMA_QUAD', 'MINIMO', 'MAXIMO']
+
+# Tabela das parciais de cada ano.
+PARTIAL_TABLE = '{ano}.csv'
+
+# Tabelas gravadas para cada ano.
+_YEAR_FILES = [PARTIAL_TABLE, HIST_TABLE, IMC_TABLE]
+
+# Estatisticas que saem das parciais.
+DERIVABLE_STATS = ['count', 'mean', 'std', 'min', 'max', 'sum']
+
+
+def _partials(valores: pd.DataFrame, grupos: pd.Series, escopo: str) -> List[pd.DataFrame]:
+    partes = []
+    for coluna in valores.columns:
+        x = valores[coluna].astype('float64')
+        agrupado = pd.DataFrame({'x': x, 'x2': x * x}).groupby(grupos)
+        resumo = pd.DataFrame({
+            'N': agrupado['x'].count(),
+            'SOMA': agrupado['x'].sum(),
+            'SOMA_QUAD': agrupado['x2'].sum(),
+            'MINIMO': agrupado['x'].min(),
+            'MAXIMO': agrupado['x'].max(),
+        })
+        resumo.index.name = GROUP_COLUMN
+        partes.append(resumo.reset_index().assign(ESCOPO=escopo, COLUNA=coluna))
+    return partes
+
+
+def partial_aggregates(df: pd.DataFrame, columns: List[str] = None) -> pd.DataFrame:
+    '''
+    Calcula as parciais de um DataFrame, por VINCULACAO_ANO.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dados de um ano (ou de um pedaco).
+
+    columns : List[str], optional
+        Colunas numericas resumidas. Por padrao as de colstore.NUMERIC_COLUMNS
+        presentes em df.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Uma linha por VINCULACAO_ANO, ESCOPO e COLUNA, com N, SOMA,
+        SOMA_QUAD, MINIMO e MAXIMO. O ESCOPO 'coluna' considera os valores
+        nao nulos de cada coluna, 'completas' so as linhas sem nulos em
+        COMPLETE_COLUMNS (como yearly_mean) e 'linhas' traz o total de linhas
+        (COLUNA 'TOTAL').
+
+    Example
+    -------
+    >>> df = pd.DataFrame({'VINCULACAO_ANO': [2007, 2007], 'PESO': [70, None]})
+    >>> partial_aggregates(df)[['ESCOPO', 'COLUNA', 'N']].to_dict('records')
+    [{'ESCOPO': 'coluna', 'COLUNA': 'PESO', 'N': 1}, {'ESCOPO': 'linhas', 'COLUNA': 'TOTAL', 'N': 2}]
+    '''
+    if columns is None:
+        columns = [col for col in NUMERIC_COLUMNS if col in df.columns and col != GROUP_COLUMN]
+    grupos = df[GROUP_COLUMN]
+    partes = _partials(df[columns], grupos, 'coluna')
+    if all(col in df.columns for col in COMPLETE_COLUMNS):
+        completas = df[[GROUP_COLUMN] + COMPLETE_COLUMNS].dropna(axis='index')
+        partes += _partials(completas[COMPLETE_COLUMNS], completas[GROUP_COLUMN], 'completas')
+    linhas = grupos.groupby(grupos).size().rename('N').rename_axis(GROUP_COLUMN).reset_index()
+    partes.append(linhas.assign(ESCOPO='linhas', COLUNA='TOTAL'))
+    resultado = pd.concat(partes, ignore_index=True).reindex(columns=_PARTIAL_COLUMNS)
+    resultado['N'] = resultado['N'].astype('int64')
+    return resultado
+
+
+def _signature(dataset_dir: str, entrada: dict) -> dict:
+    # A particao regravada muda de mtime mesmo quando o ano nao tem csv de origem.
+    particao = os.path.join(dataset_dir, entrada['particao'])
+    return {'origem': entrada.get('origem'), 'linhas': entrada['linhas'],
+            'mtime_ns': os.stat(particao).st_mtime_ns}
+
+
+def _stale_years(dataset_dir: str, store_dir: str, index: dict, manifest: dict) -> List[str]:
+    # Anos do conjunto cujas tabelas faltam ou sao de outra versao da particao.
+    pendentes = []
+    for ano, entrada in sorted(manifest.items()):
+        arquivos = [os.path.join(store_dir, nome.format(ano=ano)) for nome in _YEAR_FILES]
+        if index.get(ano) != _signature(dataset_dir, entrada) or not all(map(os.path.exists, arquivos)):
+            pendentes.append(ano)
+    return pendentes
+
+
+def is_current(dataset_dir: str, store_dir: str = None) -> bool:
+    '''
+    Indica se o armazenamento tem as tabelas de todos os anos do conjunto
+    de dados, na versao atual, e nenhum ano a mais. Nao grava nada: a
+    atualizacao e feita por update_aggstore, na ingestao dos dados.
+    '''
+    if store_dir is None:
+        store_dir = aggstore_dir_for(dataset_dir)
+    index = load_aggstore_index(store_dir)
+    manifest = load_dataset_manifest(dataset_dir)
+    return set(index) == set(manifest) and not _stale_years(dataset_dir, store_dir, index, manifest)
+
+
+def update_aggstore(dataset_dir: str, store_dir: str = None) -> List[int]:
+    '''
+    Recalcula as parciais, os histogramas e o cubo de IMC dos anos do
+    conjunto de dados que sao novos ou mudaram desde a ultima atualizacao e
+    remove os dos anos que sairam do conjunto. Os demais anos nao sao lidos.
+    E chamada na ingestao (depois de dataset.update_dataset); as consultas
+    apenas leem o armazenamento.
+
+    Parameters
+    ----------
+    dataset_dir : str
+        Pasta do conjunto de dados.
+
+    store_dir : str, optional
+        Pasta do armazenamento. Por padrao aggstore_dir_for(dataset_dir).
+
+    Returns
+    -------
+    List[int]
+        Anos recalculados nesta chamada.
+    '''
+    if store_dir is None:
+        store_dir = aggstore_dir_for(dataset_dir)
+    os.makedirs(store_dir, exist_ok=True)
+    index = load_aggstore_index(store_dir)
+    manifest = load_dataset_manifest(dataset_dir)
+    atualizados = []
+    for ano in _stale_years(dataset_dir, store_dir, index, manifest):
+        entrada = manifest[ano]
+        arquivos = [os.path.join(store_dir, nome.format(ano=ano)) for nome in _YEAR_FILES]
+        colunas = [col for col in NUMERIC_COLUMNS + CUBE_DIMENSIONS if col in entrada['colunas']]
+        df = read_dataset_year(dataset_dir, int(ano), colunas) if colunas else pd.DataFrame()
+        parciais = partial_aggregates(df) if GROUP_COLUMN in df.columns else pd.DataFrame(columns=_PARTIAL_COLUMNS)
+        for tabela, arquivo in zip([parciais, partial_histograms(df), imc_cube(df)], arquivos):
+            write_table(tabela, arquivo)
+        # O indice so e atualizado depois que as tabelas do ano foram gravadas.
+        index[ano] = _signature(dataset_dir, entrada)
+        save_manifest(index, os.path.join(store_dir, INDEX_FILE))
+        atualizados.append(int(ano))
+    for ano in [ano for ano in index if ano not in manifest]:
+        for nome in _YEAR_FILES:
+            if os.path.exists(os.path.join(store_dir, nome.format(ano=ano))):
+                os.remove(os.path.join(store_dir, nome.format(ano=ano)))
+        del index[ano]
+        save_manifest(index, os.path.join(store_dir, INDEX_FILE))
+    return atualizados
+
+
+def load_partials(store_dir: str, anos: List[int] = None) -> pd.DataFrame:
+    '''
+    Le as parciais guardadas, com a coluna ANO_COLETA.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    anos : List[int], optional
+        Anos do conjunto (ANO_COLETA) desejados. Se None, todos.
+    '''
+    return read_year_tables(store_dir, PARTIAL_TABLE, _PARTIAL_COLUMNS, anos)
+
+
+def _quantile_of(stat: str) -> float:
+    # 'median' e 'NN%' viram o quantil correspondente; outras estatisticas, None.
+    if stat == 'median':
+        return 0.5
+    if stat.endswith('%'):
+        return float(stat[:-1]) / 100
+    return None
+
+
+def merge_partials(parciais: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Junta parciais de varios anos ou pedacos: somas e contagens se somam,
+    minimos e maximos se combinam.
+
+    Example
+    -------
+    >>> a = partial_aggregates(pd.DataFrame({'VINCULACAO_ANO': [2007], 'PESO': [70]}))
+    >>> b = partial_aggregates(pd.DataFrame({'VINCULACAO_ANO': [2007], 'PESO': [80]}))
+    >>> juntas = merge_partials(pd.concat([a, b]))
+    >>> juntas.loc[(2007, 'coluna', 'PESO'), ['N', 'SOMA', 'MINIMO', 'MAXIMO']].to_dict()
+    {'N': 2.0, 'SOMA': 150.0, 'MINIMO': 70.0, 'MAXIMO': 80.0}
+    '''
+    agrupado = parciais.groupby([GROUP_COLUMN, 'ESCOPO', 'COLUNA'])
+    return agrupado.agg(N=('N', 'sum'), SOMA=('SOMA', 'sum'), SOMA_QUAD=('SOMA_QUAD', 'sum'),
+                        MINIMO=('MINIMO', 'min'), MAXIMO=('MAXIMO', 'max'))
+
+
+def _scope(juntas: pd.DataFrame, escopo: str, campo: str, colunas: List[str]) -> pd.DataFrame:
+    tabela = juntas.xs(escopo, level='ESCOPO')[campo].unstack('COLUNA')
+    return tabela.reindex(columns=colunas)
+
+
+def yearly_mean_from_store(store_dir: str, anos: List[int] = None) -> pd.DataFrame:
+    '''
+    O mesmo resultado de analysis_utils.yearly_mean, a partir das parciais.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    anos : List[int], optional
+        Anos do conjunto (ANO_COLETA) considerados. Se None, todos.
+    '''
+    juntas = merge_partials(load_partials(store_dir, anos))
+    somas = _scope(juntas, 'completas', 'SOMA', COMPLETE_COLUMNS)
+    contagens = _scope(juntas, 'completas', 'N', COMPLETE_COLUMNS)
+    medias = somas / contagens
+    return medias[contagens[COMPLETE_COLUMNS[0]] > 0].rename_axis(columns=None)
+
+
+def yearly_aggregate_from_store(store_dir: str, anos: List[int] = None) -> pd.DataFrame:
+    '''
+    O mesmo resultado de analysis_utils.yearly_aggregate, a partir das parciais.
+    '''
+    juntas = merge_partials(load_partials(store_dir, anos))
+    contagens = _scope(juntas, 'coluna', 'N', COUNT_COLUMNS).fillna(0).astype('int64')
+    contagens['TOTAL'] = juntas.xs(('linhas', 'TOTAL'), level=['ESCOPO', 'COLUNA'])['N']
+    return contagens.rename_axis(columns=None)
+
+
+def yearly_stats(store_dir: str, coluna: str, stats: List[str] = None, dataset_dir: str = None,
+                 anos: List[int] = None) -> pd.DataFrame:
+    '''
+    Estatisticas de uma coluna por VINCULACAO_ANO. count, mean, std
+    (amostral, como no pandas), min, max e sum saem das parciais. 'median'
+    e percentis ('50%', '90%', ...) das colunas de HISTOGRAM_COLUMNS saem
+    exatos dos histogramas guardados. As demais sao calculadas a partir
+    dos dados brutos do conjunto, lendo so essa coluna.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    coluna : str
+        Coluna numerica.
+
+    stats : List[str], optional
+        Estatisticas desejadas. Por padrao as derivaveis das parciais.
+
+    dataset_dir : str, optional
+        Pasta do conjunto de dados, necessaria para estatisticas que nao
+        saem das parciais.
+
+    anos : List[int], optional
+        Anos do conjunto (ANO_COLETA) considerados. Se None, todos.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Uma coluna por estatistica, indexado por VINCULACAO_ANO.
+
+    Raises
+    ------
+    ValueError
+        Se for pedida uma estatistica que nao sai das parciais sem dataset_dir.
+    '''
+    if stats is None:
+        stats = DERIVABLE_STATS
+    juntas = merge_partials(load_partials(store_dir, anos)).xs(('coluna', coluna), level=['ESCOPO', 'COLUNA'])
+    n = juntas['N'].astype('float64')
+    media = juntas['SOMA'] / n
+    derivadas = {
+        'count': juntas['N'],
+        'sum': juntas['SOMA'],
+        'mean': media,
+        # Variancia amostral a partir das somas; negativos minusculos vem de arredondamento.
+        'std': np.sqrt(((juntas['SOMA_QUAD'] - n * media ** 2) / (n - 1)).clip(lower=0)),
+        'min': juntas['MINIMO'],
+        'max': juntas['MAXIMO'],
+    }
+    resultado = pd.DataFrame({stat: derivadas[stat] for stat in stats if stat in derivadas})
+    faltando = [stat for stat in stats if stat not in derivadas]
+    if coluna in HISTOGRAM_COLUMNS and any(_quantile_of(stat) is not None for stat in faltando):
+        histogramas = load_histograms(store_dir, coluna, anos)
+        # Um ano sem histograma (valores nao inteiros) deixa as contagens menores que N.
+        esperado = juntas['N'][juntas.index.notna()].astype('int64')
+        contagens = pd.Series({grupo: histograma.n for grupo, histograma in histogramas.items()}, dtype='int64')
+        completos = bool((contagens.reindex(esperado.index, fill_value=0).to_numpy() == esperado.to_numpy()).all())
+    else:
+        completos = False
+    if completos:
+        for stat in [stat for stat in faltando if _quantile_of(stat) is not None]:
+            resultado[stat] = pd.Series({grupo: float(histograma.quantile(_quantile_of(stat))[0])
+                                         for grupo, histograma in histogramas.items()}, dtype='float64')
+        faltando = [stat for stat in faltando if _quantile_of(stat) is None]
+    if faltando:
+        if dataset_dir is None:
+            raise ValueError(f"As estatisticas {faltando} precisam dos dados brutos: informe dataset_dir.")
+        consulta = SermilDataset(dataset_dir).select([GROUP_COLUMN, coluna])
+        if anos is not None:
+            consulta = consulta.where(anos=anos)
+        brutos = consulta.collect().groupby(GROUP_COLUMN)[coluna]
+        for stat in faltando:
+            if _quantile_of(stat) is not None:
+                resultado[stat] = brutos.quantile(_quantile_of(stat))
+            else:
+                resultado[stat] = brutos.agg(stat)
+    return resultado[list(stats)]
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(verbose=True)
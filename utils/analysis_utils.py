@@ -8,8 +8,20 @@ Em especial, análise de séries temporais,
 onde se deseja estudar a mudança ao longo do tempo.
  
 """
+import os
 import pandas as pd
 import doctest
+try:
+    from .dataset import as_frame, SermilDataset, load_dataset_manifest
+    from .aggstore import is_current, aggstore_dir_for, yearly_mean_from_store, yearly_aggregate_from_store
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    from dataset import as_frame, SermilDataset, load_dataset_manifest
+    from aggstore import is_current, aggstore_dir_for, yearly_mean_from_store, yearly_aggregate_from_store
+
+MEAN_COLUMNS = ['VINCULACAO_ANO', 'CINTURA', 'PESO', 'ALTURA', 'CABECA']
+AGGREGATE_COLUMNS = ['VINCULACAO_ANO', 'CINTURA', 'PESO', 'ALTURA']
+
 def yearly_mean(df:pd.DataFrame)->pd.DataFrame:
     """
     Função que cálcula a média anual de variáveis numéricas
@@ -18,6 +30,13 @@ def yearly_mean(df:pd.DataFrame)->pd.DataFrame:
 
     Exclusivamente para uso com este dataset.
 
+    df pode ser um DataFrame, um SermilDataset ou a pasta do conjunto de
+    dados (ex.: 'data_concat/sermil_dataset'), lidos só com as colunas usadas.
+    Para a pasta (ou uma consulta só com filtro de anos) a resposta sai dos
+    agregados parciais de aggstore, se estiverem em dia com o conjunto
+    (update_aggstore, chamado na ingestão); senão os dados são lidos.
+    Nada é gravado.
+
     Returns:
     -------
     pandas.DataFrame:
@@ -40,9 +59,18 @@ def yearly_mean(df:pd.DataFrame)->pd.DataFrame:
     2009            80.076656  68.011941  173.784207  56.927371
     2010            80.097404  68.522337  173.709347  57.003246
     2011            79.899922  68.839196  173.632318  56.865574
+
+    Com a pasta do conjunto de dados:
+
+    >>> yearly_mean('data_concat/sermil_dataset').shape[0] > 0
+    True
     """
     
-    selected_df = df[['VINCULACAO_ANO', 'CINTURA', 'PESO', 'ALTURA','CABECA']]
+    store = _aggstore_for(df)
+    if store is not None:
+        return yearly_mean_from_store(*store)
+    df = as_frame(df, MEAN_COLUMNS)
+    selected_df = df[MEAN_COLUMNS]
     #droping NaN values
     selected_df = selected_df.dropna(axis='index')
     selected_df = selected_df.set_index('VINCULACAO_ANO')
@@ -60,6 +88,12 @@ def yearly_aggregate(df:pd.DataFrame)->pd.DataFrame:
 
     Exclusivamente para uso com este dataset.
 
+    df pode ser um DataFrame, um SermilDataset ou a pasta do conjunto de
+    dados (ex.: 'data_concat/sermil_dataset'), lidos só com as colunas usadas.
+    Para a pasta (ou uma consulta só com filtro de anos) a resposta sai dos
+    agregados parciais de aggstore quando estão em dia, como em
+    yearly_mean. Nada é gravado.
+
     Returns:
     -------
     pandas.DataFrame:
@@ -82,14 +116,130 @@ def yearly_aggregate(df:pd.DataFrame)->pd.DataFrame:
     2009             328006  327890  327961  1542705
     2010             340473  340447  340493  1695573
     2011             362280  362266  362315  1785369
+
+    Com a pasta do conjunto de dados:
+
+    >>> yearly_aggregate('data_concat/sermil_dataset').shape[0] > 0
+    True
     """
 
-    synthetic_df = df.copy()
-    synthetic_df['TOTAL'] = synthetic_df['VINCULACAO_ANO'].copy()
-    synthetic_df = synthetic_df[['VINCULACAO_ANO','CINTURA','PESO','ALTURA','TOTAL']].set_index('VINCULACAO_ANO')
-    synthetic_df = synthetic_df.groupby(level='VINCULACAO_ANO').count()
-    # Return the resulting DataFrame, which contains the yearly mean values.
+    store = _aggstore_for(df)
+    if store is not None:
+        return yearly_aggregate_from_store(*store)
+    df = as_frame(df, AGGREGATE_COLUMNS)
+    # Counting straight from the selected columns, without copying the DataFrame.
+    synthetic_df = _aggregate_counts(df[AGGREGATE_COLUMNS])
+    # Return the resulting DataFrame, which contains the yearly totals.
     return synthetic_df
 
+def _aggstore_for(df):
+    # (pasta dos agregados, anos) quando df e o conjunto de dados sem filtros de valor
+    # e os agregados estao em dia. So le: a atualizacao fica na ingestao.
+    if isinstance(df, str) and os.path.isdir(df):
+        df = SermilDataset(df)
+    if not isinstance(df, SermilDataset) or df.filters or not load_dataset_manifest(df.dataset_dir):
+        return None
+    store_dir = aggstore_dir_for(df.dataset_dir)
+    if not is_current(df.dataset_dir, store_dir):
+        return None
+    return store_dir, df.anos
+
+def _aggregate_counts(selected_df:pd.DataFrame)->pd.DataFrame:
+    # Non-null values per year, plus TOTAL (rows per year).
+    grouped = selected_df.groupby('VINCULACAO_ANO')
+    counts = grouped.count()
+    counts['TOTAL'] = grouped.size()
+    return counts
+
+def iter_chunks(source, columns:list, chunksize:int=500000):
+    """
+    Percorre os dados em pedaços, sem carregar tudo na memória.
+
+    source pode ser um csv (lido com pandas.read_csv(..., chunksize=...)),
+    a pasta do conjunto de dados ou um SermilDataset (um ano por vez),
+    um DataFrame (um único pedaço) ou qualquer iterável de DataFrames.
+
+    Returns:
+    -------
+    iterator of pandas.DataFrame:
+        Pedaços com as colunas pedidas.
+
+    Example:
+    --------
+    >>> pedacos = iter_chunks([pd.DataFrame({'PESO': [70], 'X': [1]})], ['PESO'])
+    >>> [list(p.columns) for p in pedacos]
+    [['PESO']]
+    """
+    if isinstance(source, str) and os.path.isdir(source):
+        source = SermilDataset(source)
+    if isinstance(source, SermilDataset):
+        consulta = source.select(columns)
+        for ano in consulta.years():
+            yield consulta.where(anos=[ano]).collect()[columns]
+    elif isinstance(source, str):
+        yield from pd.read_csv(source, usecols=columns, chunksize=chunksize, encoding='latin1')
+    elif isinstance(source, pd.DataFrame):
+        yield source[columns]
+    else:
+        for chunk in source:
+            yield chunk[columns]
+
+def yearly_mean_chunked(source, chunksize:int=500000)->pd.DataFrame:
+    """
+    Versão de yearly_mean que lê os dados em pedaços (ver iter_chunks),
+    guardando apenas somas e contagens parciais por ano. A memória usada
+    depende do tamanho do pedaço, não do histórico inteiro.
+
+    Returns:
+    -------
+    pandas.DataFrame:
+        O mesmo resultado de yearly_mean (a menos de arredondamento).
+
+    Example:
+    --------
+    >>> pedacos = [pd.DataFrame({'VINCULACAO_ANO': [2007, 2008], 'CINTURA': [80, 81],
+    ...                          'PESO': [70, 71], 'ALTURA': [170, 171], 'CABECA': [56, 57]}),
+    ...            pd.DataFrame({'VINCULACAO_ANO': [2007], 'CINTURA': [82],
+    ...                          'PESO': [72], 'ALTURA': [172], 'CABECA': [58]})]
+    >>> yearly_mean_chunked(pedacos).to_dict('index')
+    {2007: {'CINTURA': 81.0, 'PESO': 71.0, 'ALTURA': 171.0, 'CABECA': 57.0}, 2008: {'CINTURA': 81.0, 'PESO': 71.0, 'ALTURA': 171.0, 'CABECA': 57.0}}
+    """
+    somas = []
+    contagens = []
+    for chunk in iter_chunks(source, MEAN_COLUMNS, chunksize):
+        # Same row filter as yearly_mean: only rows complete in every column.
+        grouped = chunk.dropna(axis='index').groupby('VINCULACAO_ANO')
+        somas.append(grouped.sum().astype('float64'))
+        contagens.append(grouped.size())
+    if not somas:
+        return pd.DataFrame(columns=MEAN_COLUMNS[1:]).rename_axis('VINCULACAO_ANO')
+    total = pd.concat(somas).groupby(level='VINCULACAO_ANO').sum()
+    linhas = pd.concat(contagens).groupby(level='VINCULACAO_ANO').sum()
+    return total.div(linhas, axis='index')
+
+def yearly_aggregate_chunked(source, chunksize:int=500000)->pd.DataFrame:
+    """
+    Versão de yearly_aggregate que lê os dados em pedaços (ver
+    iter_chunks), somando as contagens parciais de cada ano.
+
+    Returns:
+    -------
+    pandas.DataFrame:
+        O mesmo resultado de yearly_aggregate.
+
+    Example:
+    --------
+    >>> pedacos = [pd.DataFrame({'VINCULACAO_ANO': [2007, 2007], 'CINTURA': [80, None],
+    ...                          'PESO': [70, 71], 'ALTURA': [None, None]}),
+    ...            pd.DataFrame({'VINCULACAO_ANO': [2007], 'CINTURA': [82],
+    ...                          'PESO': [72], 'ALTURA': [172]})]
+    >>> yearly_aggregate_chunked(pedacos).to_dict('index')
+    {2007: {'CINTURA': 2, 'PESO': 3, 'ALTURA': 1, 'TOTAL': 3}}
+    """
+    parciais = [_aggregate_counts(chunk) for chunk in iter_chunks(source, AGGREGATE_COLUMNS, chunksize)]
+    if not parciais:
+        return pd.DataFrame(columns=AGGREGATE_COLUMNS[1:] + ['TOTAL']).rename_axis('VINCULACAO_ANO')
+    return pd.concat(parciais).groupby(level='VINCULACAO_ANO').sum()
+
 if __name__ == "__main__":
     doctest.testmod(verbose=True)
\ No newline at end of file
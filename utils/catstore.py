@@ -0,0 +1,411 @@
+'''
+Codificacao por dicionario das colunas de texto do SERMIL, persistida em
+disco.
+
+Colunas como UF_RESIDENCIA, DISPENSA, ESCOLARIDADE, SEXO e as de municipio
+repetem um vocabulario pequeno milhoes de vezes. Aqui cada coluna guarda
+uma unica vez o seu vocabulario ('vocab.json') e, para cada ano, um vetor
+de codigos inteiros ('{ano}.codes', -1 para valores ausentes) aberto com
+numpy.memmap. O vocabulario so cresce, entao o codigo de um valor e o mesmo
+em todos os anos, e as colunas sao lidas como pandas.Categorical sem
+precisar reler ou recalcular o hash de nenhum texto.
+
+As funcoes count_codes e crosstab_codes contam categorias diretamente
+pelos codigos e sao usadas por percentage_value_counts e bar_cluster quando
+as colunas sao categoricas.
+'''
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from typing import Dict, List
+try:
+    from .schema import CATEGORICAL_COLUMNS
+    from .parquet_store import PARTITION_COLUMN, partition_path, stored_years, read_year
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    from schema import CATEGORICAL_COLUMNS
+    from parquet_store import PARTITION_COLUMN, partition_path, stored_years, read_year
+
+# Nome da pasta do armazenamento, criada ao lado dos csvs.
+CATSTORE_DIRNAME = 'sermil_catstore'
+
+_VOCAB_FILE = 'vocab.json'
+
+
+def _code_dtype(tamanho: int) -> str:
+    '''
+    Menor inteiro com sinal que representa os codigos de um vocabulario
+    com 'tamanho' valores, mais o -1 dos ausentes.
+    '''
+    for dtype in ('int8', 'int16', 'int32'):
+        if tamanho - 1 <= np.iinfo(dtype).max:
+            return dtype
+    return 'int64'
+
+
+def load_vocabulary(store_dir: str, coluna: str) -> dict:
+    '''
+    Le o vocabulario de uma coluna.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    coluna : str
+        Nome da coluna.
+
+    Returns
+    -------
+    dict
+        'valores' (lista com o valor de cada codigo) e 'anos' (ano ->
+        {'dtype', 'linhas'} do vetor de codigos). Vazio se a coluna ainda nao
+        foi guardada.
+
+    Example
+    -------
+    >>> load_vocabulary('ESSA_PASTA_N_EXISTE', 'SEXO')
+    {'valores': [], 'anos': {}}
+    '''
+    try:
+        with open(os.path.join(store_dir, coluna, _VOCAB_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'valores': [], 'anos': {}}
+
+
+def _save_vocabulary(store_dir: str, coluna: str, vocab: dict):
+    temp_file = os.path.join(store_dir, coluna, _VOCAB_FILE + '.tmp')
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    os.replace(temp_file, os.path.join(store_dir, coluna, _VOCAB_FILE))
+
+
+def encode_series(serie: pd.Series, valores: List[str]) -> np.ndarray:
+    '''
+    Converte uma serie de texto em codigos do vocabulario, acrescentando ao
+    final de 'valores' (alterado no lugar) os valores ainda nao vistos.
+
+    Parameters
+    ----------
+    serie : pandas.Series
+        Valores de texto (ou categoricos).
+
+    valores : List[str]
+        Vocabulario atual.
+
+    Returns
+    -------
+    numpy.ndarray
+        Codigos de cada linha, -1 para valores ausentes.
+
+    Example
+    -------
+    >>> vocab = ['SP']
+    >>> encode_series(pd.Series(['RJ', 'SP', None, 'RJ']), vocab).tolist(), vocab
+    ([1, 0, -1, 1], ['SP', 'RJ'])
+    '''
+    codigos_locais, unicos = pd.factorize(serie)
+    posicao = {valor: codigo for codigo, valor in enumerate(valores)}
+    traducao = np.empty(len(unicos), dtype='int64')
+    for i, valor in enumerate(unicos):
+        valor = str(valor)
+        if valor not in posicao:
+            posicao[valor] = len(valores)
+            valores.append(valor)
+        traducao[i] = posicao[valor]
+    codigos = np.full(len(codigos_locais), -1, dtype='int64')
+    validos = codigos_locais >= 0
+    codigos[validos] = traducao[codigos_locais[validos]]
+    return codigos
+
+
+def encode_year(df: pd.DataFrame, ano: int, store_dir: str, columns: List[str] = None) -> List[str]:
+    '''
+    Guarda os codigos de um ano para cada coluna categorica, atualizando os
+    vocabularios. Reescrever um ano ja guardado substitui os seus codigos;
+    os codigos dos outros anos nao mudam.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dados do ano.
+
+    ano : int
+        Ano dos dados.
+
+    store_dir : str
+        Pasta do armazenamento.
+
+    columns : List[str], optional
+        Colunas codificadas. Por padrao, as colunas categoricas do esquema
+        (schema.CATEGORICAL_COLUMNS) presentes em df.
+
+    Returns
+    -------
+    List[str]
+        As colunas guardadas.
+    '''
+    if columns is None:
+        columns = [col for col in CATEGORICAL_COLUMNS if col in df.columns]
+    for coluna in columns:
+        os.makedirs(os.path.join(store_dir, coluna), exist_ok=True)
+        vocab = load_vocabulary(store_dir, coluna)
+        codigos = encode_series(df[coluna], vocab['valores'])
+        dtype = _code_dtype(len(vocab['valores']))
+        destino = os.path.join(store_dir, coluna, f'{ano}.codes')
+        codigos.astype(dtype).tofile(destino + '.tmp')
+        os.replace(destino + '.tmp', destino)
+        vocab['anos'][str(ano)] = {'dtype': dtype, 'linhas': len(codigos)}
+        _save_vocabulary(store_dir, coluna, vocab)
+    return list(columns)
+
+
+def build_catstore(frames: Dict[int, pd.DataFrame], store_dir: str, columns: List[str] = None) -> List[str]:
+    '''
+    Codifica varios anos, um de cada vez.
+
+    Parameters
+    ----------
+    frames : Dict[int, pandas.DataFrame]
+        Dados por ano. Pode ser um dicionario ou qualquer iteravel de pares
+        (ano, DataFrame).
+
+    store_dir : str
+        Pasta do armazenamento.
+
+    columns : List[str], optional
+        Colunas codificadas. Por padrao, as colunas categoricas do esquema.
+
+    Returns
+    -------
+    List[int]
+        Os anos codificados.
+    '''
+    pares = frames.items() if isinstance(frames, dict) else frames
+    anos = []
+    for ano, df in pares:
+        encode_year(df, ano, store_dir, columns)
+        anos.append(ano)
+    return anos
+
+
+def build_from_parquet(parquet_dir: str, store_dir: str, columns: List[str] = None) -> List[int]:
+    '''
+    Codifica os anos do armazenamento Parquet (modulo parquet_store), lendo
+    apenas as colunas categoricas de um ano de cada vez.
+
+    Parameters
+    ----------
+    parquet_dir : str
+        Pasta do armazenamento Parquet.
+
+    store_dir : str
+        Pasta do armazenamento de codigos.
+
+    columns : List[str], optional
+        Colunas codificadas. Por padrao, as colunas categoricas do esquema.
+
+    Returns
+    -------
+    List[int]
+        Os anos codificados.
+    '''
+    import pyarrow.parquet as pq
+
+    desejadas = CATEGORICAL_COLUMNS if columns is None else columns
+
+    def anos():
+        for ano in stored_years(parquet_dir):
+            existentes = pq.read_schema(partition_path(parquet_dir, ano)).names
+            yield ano, read_year(parquet_dir, ano, [c for c in desejadas if c in existentes])
+
+    return build_catstore(anos(), store_dir, columns)
+
+
+def read_codes(store_dir: str, coluna: str, anos: List[int] = None) -> np.ndarray:
+    '''
+    Le os codigos de uma coluna. Com um unico ano o retorno e o proprio
+    numpy.memmap, sem copia.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    coluna : str
+        Nome da coluna.
+
+    anos : List[int], optional
+        Anos desejados, lidos em ordem crescente. Se None, todos.
+
+    Returns
+    -------
+    numpy.ndarray
+        Os codigos, -1 para valores ausentes.
+
+    Raises
+    ------
+    KeyError
+        Se a coluna ou algum ano nao estiver no armazenamento.
+    '''
+    vocab = load_vocabulary(store_dir, coluna)
+    if not vocab['anos']:
+        raise KeyError(f"A coluna '{coluna}' nao esta no armazenamento.")
+    if anos is None:
+        anos = [int(ano) for ano in vocab['anos']]
+    vetores = []
+    for ano in sorted(anos):
+        if str(ano) not in vocab['anos']:
+            raise KeyError(f"O ano {ano} nao esta no armazenamento da coluna '{coluna}'.")
+        info = vocab['anos'][str(ano)]
+        if info['linhas'] == 0:
+            vetores.append(np.empty(0, dtype=info['dtype']))
+            continue
+        vetores.append(np.memmap(os.path.join(store_dir, coluna, f'{ano}.codes'),
+                                 dtype=info['dtype'], mode='r', shape=(info['linhas'],)))
+    if len(vetores) == 1:
+        return vetores[0]
+    return np.concatenate(vetores)
+
+
+def load_categorical(store_dir: str, coluna: str, anos: List[int] = None) -> pd.Series:
+    '''
+    Le uma coluna como serie categorica, montada direto dos codigos e do
+    vocabulario.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    coluna : str
+        Nome da coluna.
+
+    anos : List[int], optional
+        Anos desejados, lidos em ordem crescente. Se None, todos.
+
+    Returns
+    -------
+    pandas.Series
+        Serie do tipo category, com as categorias na ordem do vocabulario.
+
+    Example
+    -------
+    >>> import tempfile
+    >>> pasta = os.path.join(tempfile.mkdtemp(), CATSTORE_DIRNAME)
+    >>> _ = build_catstore({2021: pd.DataFrame({'SEXO': ['M', 'F']}),
+    ...                     2022: pd.DataFrame({'SEXO': ['M', None]})}, pasta)
+    >>> load_categorical(pasta, 'SEXO').tolist()
+    ['M', 'F', 'M', nan]
+    '''
+    valores = load_vocabulary(store_dir, coluna)['valores']
+    codigos = read_codes(store_dir, coluna, anos)
+    return pd.Series(pd.Categorical.from_codes(codigos, categories=valores), name=coluna)
+
+
+def load_frame(store_dir: str, columns: List[str], anos: List[int] = None) -> pd.DataFrame:
+    '''
+    Monta um DataFrame com colunas categoricas e a coluna ANO_COLETA.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    columns : List[str]
+        Colunas desejadas. Todas devem ter os mesmos anos guardados.
+
+    anos : List[int], optional
+        Anos desejados. Se None, os anos da primeira coluna.
+
+    Returns
+    -------
+    pandas.DataFrame
+        As colunas pedidas e ANO_COLETA.
+    '''
+    if anos is None:
+        anos = [int(ano) for ano in load_vocabulary(store_dir, columns[0])['anos']]
+    anos = sorted(anos)
+    dados = {coluna: load_categorical(store_dir, coluna, anos) for coluna in columns}
+    info = load_vocabulary(store_dir, columns[0])['anos']
+    dados[PARTITION_COLUMN] = np.repeat(np.array(anos, dtype='uint16'),
+                                        [info[str(ano)]['linhas'] for ano in anos])
+    return pd.DataFrame(dados)
+
+
+def count_codes(serie: pd.Series) -> pd.Series:
+    '''
+    Conta as ocorrencias de cada categoria de uma serie categorica com
+    numpy.bincount sobre os codigos. Como value_counts de uma serie
+    categorica, ignora ausentes, mantem as categorias sem ocorrencias (com
+    zero) e ordena da mais para a menos frequente (empates na ordem das
+    categorias).
+
+    Parameters
+    ----------
+    serie : pandas.Series
+        Serie do tipo category.
+
+    Returns
+    -------
+    pandas.Series
+        Contagem por categoria.
+
+    Example
+    -------
+    >>> serie = pd.Series(pd.Categorical(['b', 'a', 'b', None], categories=['a', 'b', 'c']))
+    >>> count_codes(serie).to_dict()
+    {'b': 2, 'a': 1, 'c': 0}
+    '''
+    codigos = np.asarray(serie.cat.codes)
+    categorias = serie.cat.categories
+    contagem = np.bincount(codigos[codigos >= 0], minlength=len(categorias))
+    resultado = pd.Series(contagem, index=categorias, name='count')
+    resultado.index.name = serie.name
+    return resultado.sort_values(ascending=False, kind='stable')
+
+
+def crosstab_codes(linhas: pd.Series, colunas: pd.Series) -> pd.DataFrame:
+    '''
+    Tabela de contagem entre duas series categoricas, calculada com um
+    unico numpy.bincount sobre os pares de codigos. Equivale ao
+    pandas.crosstab(..., dropna=False) das mesmas series: ignora pares com
+    ausentes e mostra todas as categorias, mesmo as sem ocorrencias, na
+    ordem das categorias.
+
+    Parameters
+    ----------
+    linhas : pandas.Series
+        Serie do tipo category usada nas linhas da tabela.
+
+    colunas : pandas.Series
+        Serie do tipo category usada nas colunas da tabela.
+
+    Returns
+    -------
+    pandas.DataFrame
+        A tabela de contagem.
+
+    Example
+    -------
+    >>> uf = pd.Series(pd.Categorical(['SP', 'RJ', 'SP', 'SP'], categories=['SP', 'RJ', 'MG']), name='UF')
+    >>> sexo = pd.Series(['M', 'F', 'F', None], dtype='category', name='SEXO')
+    >>> crosstab_codes(uf, sexo).to_dict('index')
+    {'SP': {'F': 1, 'M': 1}, 'RJ': {'F': 1, 'M': 0}, 'MG': {'F': 0, 'M': 0}}
+    '''
+    codigos_l = np.asarray(linhas.cat.codes, dtype='int64')
+    codigos_c = np.asarray(colunas.cat.codes, dtype='int64')
+    n_l, n_c = len(linhas.cat.categories), len(colunas.cat.categories)
+    validos = (codigos_l >= 0) & (codigos_c >= 0)
+    contagem = np.bincount(codigos_l[validos] * n_c + codigos_c[validos], minlength=n_l * n_c)
+    return pd.DataFrame(contagem.reshape(n_l, n_c),
+                        index=pd.Index(linhas.cat.categories, name=linhas.name),
+                        columns=pd.Index(colunas.cat.categories, name=colunas.name))
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(verbose=True)
@@ -6,14 +6,21 @@ Tambem pode auxiliar na limpeza de um dataset.
 '''
 
 import io
-import requests
+import os
 import pandas as pd
 from typing import List
+try:
+    from . import httpclient
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    import httpclient
 
 def make_http_request(url: str):
     """
     Faz uma solicitacao HTTP para obter dados a partir de uma URL.
     Note que a HTTP tem que levar diretamente aos dados csv.
+    A solicitacao passa pela sessao compartilhada do modulo httpclient,
+    com timeout e novas tentativas em caso de falha temporaria.
 
     Parameters
     ----------
@@ -27,7 +34,7 @@ def make_http_request(url: str):
         None, se ocorrer uma falha na solicitacao HTTP.
     """
     try:
-        response = requests.get(url)
+        response = httpclient.get(url)
         if response.status_code == 200:
             return response.text
         else:
@@ -38,6 +45,38 @@ def make_http_request(url: str):
         return None
 
 
+def make_http_stream(url: str):
+    """
+    Faz uma solicitacao HTTP em modo streaming para uma URL de dados csv.
+    Diferente de make_http_request, o corpo da resposta nao e carregado na
+    memoria: ele e lido aos poucos por quem consumir o retorno.
+
+    Parameters
+    ----------
+    url : str
+        A URL que aponta para o conjunto de dados a ser lido.
+
+    Returns
+    -------
+    requests.Response or None
+        A resposta aberta, cujo atributo raw pode ser lido como um arquivo.
+        None, se ocorrer uma falha na solicitacao HTTP.
+    """
+    try:
+        response = httpclient.get(url, stream=True)
+        if response.status_code == 200:
+            # Descomprime gzip/deflate enquanto o corpo e lido.
+            response.raw.decode_content = True
+            return response
+        else:
+            print("Falha ao recuperar dados. Codigo de status:", response.status_code)
+            response.close()
+            return None
+    except Exception as erro:
+        print("Ocorreu um erro:", str(erro))
+        return None
+
+
 def process_data(data: str, dropnull: bool = False, desired_columns: List[str] = None):
     """
     Le e limpa dados CSV os transformando em pandas.DataFrame.
@@ -119,6 +158,92 @@ def process_data(data: str, dropnull: bool = False, desired_columns: List[str] =
         return None
 
 
+def process_data_chunks(stream, local_file: str, dropnull: bool = False, desired_columns: List[str] = None,
+                        chunksize: int = 100000, encoding: str = None):
+    """
+    Le dados CSV de um arquivo ou stream em blocos de linhas e grava as
+    colunas selecionadas em disco a cada bloco. Assim o pico de memoria e
+    limitado pelo tamanho do bloco, e nao pelo tamanho do arquivo.
+
+    O arquivo e escrito primeiro em 'local_file.tmp' e so e renomeado para
+    local_file no final, para que uma falha no meio nao deixe um csv
+    incompleto com o nome definitivo.
+
+    Parameters
+    ----------
+    stream : file-like
+        Objeto com metodo read, por exemplo o atributo raw de uma resposta
+        devolvida por make_http_stream.
+
+    local_file : str
+        Caminho do csv que sera gravado.
+
+    dropnull : bool, False by default
+        Se True, tira as linhas com valores nulos de cada bloco.
+
+    desired_columns : list, optional
+        Lista com os nomes das colunas desejadas, se nao especificado, todas as colunas serao lidas.
+
+    chunksize : int, optional
+        Numero de linhas lidas por bloco. Por padrao 100000.
+
+    encoding : str, optional
+        Codificacao do texto. Se nao especificada, o pandas usa utf-8.
+
+    Returns
+    -------
+    int or None
+        Numero de linhas gravadas em local_file.
+        None, se ocorrer uma falha no processamento.
+
+    Example
+    -------
+    >>> import os, tempfile
+    >>> dados_teste = io.StringIO('''Nome,Idade,Sexo
+    ... João,30,M
+    ... Maria,25,F
+    ... Carlos,35,M
+    ... ''')
+    >>> destino = os.path.join(tempfile.mkdtemp(), 'saida.csv')
+    >>> process_data_chunks(dados_teste, destino, desired_columns=['Nome', 'Idade'], chunksize=2)
+    3
+    >>> print(open(destino, encoding='utf-8').read().strip())
+    Nome,Idade
+    João,30
+    Maria,25
+    Carlos,35
+    """
+    temp_file = local_file + '.tmp'
+    try:
+        if desired_columns is not None:
+            # Não permite que o nome das colunas sejam diferentes de strings
+            for el in desired_columns:
+                if not isinstance(el, str):
+                    raise TypeError("Todos os elementos da lista de colunas devem ser strings.")
+        leitor = pd.read_csv(stream, usecols=desired_columns, chunksize=chunksize,
+                             encoding=encoding, on_bad_lines='skip')
+        total_linhas = 0
+        primeiro = True
+        for bloco in leitor:
+            if dropnull:
+                bloco = bloco.dropna()
+            # O cabecalho so e escrito no primeiro bloco, os demais sao anexados.
+            bloco.to_csv(temp_file, mode='w' if primeiro else 'a', header=primeiro, index=False)
+            primeiro = False
+            total_linhas += len(bloco)
+        if primeiro:
+            open(temp_file, 'w').close()
+        os.replace(temp_file, local_file)
+        return total_linhas
+    except TypeError as e:
+        print("Erro:", e)
+    except Exception as erro:
+        print("Ocorreu um erro no processamento dos dados:", str(erro))
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+    return None
+
+
 def clean_dataframe(
     df,                
     columns_to_drop: list = None,    
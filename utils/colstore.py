@@ -0,0 +1,319 @@
+'''
+Armazenamento das colunas numericas do SERMIL como vetores binarios em
+disco, abertos com numpy.memmap.
+
+Cada coluna fica em um arquivo 'COLUNA.bin', com os valores de todos os
+anos em sequencia (float32, NaN para valores ausentes), e um pequeno
+'index.json' guarda onde cada ano comeca e termina. Abrir ALTURA de 2007
+a 2022 e apenas mapear o arquivo na memoria: nada e lido ou copiado ate os
+valores serem usados, e o cache de paginas do sistema operacional e
+compartilhado entre processos de analise que abrem a mesma coluna.
+'''
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from typing import Dict, List
+try:
+    from .parquet_store import PARTITION_COLUMN, partition_path, stored_years, read_year
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    from parquet_store import PARTITION_COLUMN, partition_path, stored_years, read_year
+
+# Nome da pasta do armazenamento, criada ao lado dos csvs.
+COLSTORE_DIRNAME = 'sermil_colstore'
+
+# Colunas numericas guardadas por padrao.
+NUMERIC_COLUMNS = ['ALTURA', 'PESO', 'CINTURA', 'CABECA', 'CALCADO', 'ANO_NASCIMENTO', 'VINCULACAO_ANO']
+
+# Tipo dos vetores em disco. float32 representa as medidas sem perda e usa NaN como ausente.
+DTYPE = 'float32'
+
+_INDEX_FILE = 'index.json'
+
+
+def _column_file(store_dir: str, coluna: str) -> str:
+    return os.path.join(store_dir, f'{coluna}.bin')
+
+
+def load_index(store_dir: str) -> dict:
+    '''
+    Le o indice do armazenamento.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    Returns
+    -------
+    dict
+        'colunas' (lista), 'dtype', 'linhas' (total) e 'anos' (ano ->
+        [inicio, fim] das linhas do ano). Um indice vazio se a pasta nao
+        tiver indice.
+
+    Example
+    -------
+    >>> load_index('ESSA_PASTA_N_EXISTE')
+    {'colunas': [], 'dtype': 'float32', 'linhas': 0, 'anos': {}}
+    '''
+    try:
+        with open(os.path.join(store_dir, _INDEX_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'colunas': [], 'dtype': DTYPE, 'linhas': 0, 'anos': {}}
+
+
+def _save_index(store_dir: str, index: dict):
+    temp_file = os.path.join(store_dir, _INDEX_FILE + '.tmp')
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    os.replace(temp_file, os.path.join(store_dir, _INDEX_FILE))
+
+
+def append_year(df: pd.DataFrame, ano: int, store_dir: str, columns: List[str] = None) -> dict:
+    '''
+    Acrescenta as colunas numericas de um ano ao final dos vetores. Os
+    dados ja guardados nao sao reescritos.
+
+    O indice so e atualizado depois que todos os vetores foram gravados, e
+    bytes alem do que o indice registra sao descartados na proxima escrita,
+    entao uma falha no meio nao corrompe o armazenamento.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dados do ano.
+
+    ano : int
+        Ano dos dados.
+
+    store_dir : str
+        Pasta do armazenamento.
+
+    columns : List[str], optional
+        Colunas guardadas. Na primeira escrita, por padrao NUMERIC_COLUMNS
+        presentes em df; depois, sempre as colunas ja registradas no indice.
+
+    Returns
+    -------
+    dict
+        O indice atualizado.
+
+    Raises
+    ------
+    ValueError
+        Se o ano ja estiver no armazenamento.
+    '''
+    os.makedirs(store_dir, exist_ok=True)
+    index = load_index(store_dir)
+    if str(ano) in index['anos']:
+        raise ValueError(f"O ano {ano} ja esta no armazenamento; use build_colstore para reconstrui-lo.")
+    if not index['colunas']:
+        if columns is None:
+            columns = [col for col in NUMERIC_COLUMNS if col in df.columns]
+        index['colunas'] = list(columns)
+
+    itemsize = np.dtype(index['dtype']).itemsize
+    inicio = index['linhas']
+    for coluna in index['colunas']:
+        if coluna in df.columns:
+            valores = pd.to_numeric(df[coluna], errors='coerce').to_numpy(dtype=index['dtype'], na_value=np.nan)
+        else:
+            valores = np.full(len(df), np.nan, dtype=index['dtype'])
+        with open(_column_file(store_dir, coluna), 'ab') as f:
+            f.truncate(inicio * itemsize)
+            valores.tofile(f)
+
+    index['anos'][str(ano)] = [inicio, inicio + len(df)]
+    index['linhas'] = inicio + len(df)
+    _save_index(store_dir, index)
+    return index
+
+
+def build_colstore(frames: Dict[int, pd.DataFrame], store_dir: str, columns: List[str] = None) -> dict:
+    '''
+    Cria (ou recria do zero) o armazenamento a partir dos dados de cada ano.
+
+    Parameters
+    ----------
+    frames : Dict[int, pandas.DataFrame]
+        Dados por ano. Pode ser um dicionario ou qualquer iteravel de pares
+        (ano, DataFrame), para que os anos sejam lidos um de cada vez.
+
+    store_dir : str
+        Pasta do armazenamento.
+
+    columns : List[str], optional
+        Colunas guardadas. Por padrao NUMERIC_COLUMNS.
+
+    Returns
+    -------
+    dict
+        O indice do armazenamento.
+
+    Example
+    -------
+    >>> import tempfile
+    >>> pasta = os.path.join(tempfile.mkdtemp(), COLSTORE_DIRNAME)
+    >>> dados = {2021: pd.DataFrame({'ALTURA': [170, 180]}), 2022: pd.DataFrame({'ALTURA': [175, None]})}
+    >>> build_colstore(dados, pasta, columns=['ALTURA'])['anos']
+    {'2021': [0, 2], '2022': [2, 4]}
+    '''
+    if columns is None:
+        columns = NUMERIC_COLUMNS
+    os.makedirs(store_dir, exist_ok=True)
+    for coluna in columns:
+        open(_column_file(store_dir, coluna), 'wb').close()
+    _save_index(store_dir, {'colunas': list(columns), 'dtype': DTYPE, 'linhas': 0, 'anos': {}})
+    pares = frames.items() if isinstance(frames, dict) else frames
+    index = load_index(store_dir)
+    for ano, df in pares:
+        index = append_year(df, ano, store_dir)
+    return index
+
+
+def build_from_parquet(parquet_dir: str, store_dir: str, columns: List[str] = None) -> dict:
+    '''
+    Cria o armazenamento a partir do armazenamento Parquet (modulo
+    parquet_store), lendo um ano de cada vez e apenas as colunas pedidas.
+
+    Parameters
+    ----------
+    parquet_dir : str
+        Pasta do armazenamento Parquet.
+
+    store_dir : str
+        Pasta do armazenamento de colunas.
+
+    columns : List[str], optional
+        Colunas guardadas. Por padrao NUMERIC_COLUMNS.
+
+    Returns
+    -------
+    dict
+        O indice do armazenamento.
+    '''
+    import pyarrow.parquet as pq
+
+    if columns is None:
+        columns = NUMERIC_COLUMNS
+
+    def anos():
+        for ano in stored_years(parquet_dir):
+            existentes = pq.read_schema(partition_path(parquet_dir, ano)).names
+            yield ano, read_year(parquet_dir, ano, [c for c in columns if c in existentes])
+
+    return build_colstore(anos(), store_dir, columns)
+
+
+def open_column(store_dir: str, coluna: str, anos: List[int] = None) -> np.ndarray:
+    '''
+    Abre uma coluna com numpy.memmap, somente leitura e sem copiar dados.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    coluna : str
+        Nome da coluna.
+
+    anos : List[int], optional
+        Anos desejados. Se None, todos. Se os anos pedidos forem
+        consecutivos no armazenamento, o retorno continua sendo uma visao do
+        memmap; caso contrario os trechos sao copiados para um novo vetor.
+
+    Returns
+    -------
+    numpy.ndarray
+        Os valores da coluna (numpy.memmap quando nao ha copia).
+
+    Raises
+    ------
+    KeyError
+        Se a coluna ou algum ano nao estiver no armazenamento.
+
+    Example
+    -------
+    >>> import tempfile
+    >>> pasta = os.path.join(tempfile.mkdtemp(), COLSTORE_DIRNAME)
+    >>> dados = {2021: pd.DataFrame({'ALTURA': [170, 180]}), 2022: pd.DataFrame({'ALTURA': [175, 165]})}
+    >>> _ = build_colstore(dados, pasta, columns=['ALTURA'])
+    >>> altura = open_column(pasta, 'ALTURA', anos=[2022])
+    >>> isinstance(altura, np.memmap), altura.tolist()
+    (True, [175.0, 165.0])
+    '''
+    index = load_index(store_dir)
+    if coluna not in index['colunas']:
+        raise KeyError(f"A coluna '{coluna}' nao esta no armazenamento.")
+    if index['linhas'] == 0:
+        return np.empty(0, dtype=index['dtype'])
+    vetor = np.memmap(_column_file(store_dir, coluna), dtype=index['dtype'], mode='r', shape=(index['linhas'],))
+    if anos is None:
+        return vetor
+    trechos = []
+    for ano in anos:
+        if str(ano) not in index['anos']:
+            raise KeyError(f"O ano {ano} nao esta no armazenamento.")
+        trechos.append(index['anos'][str(ano)])
+    trechos.sort()
+    consecutivos = all(trechos[i][1] == trechos[i + 1][0] for i in range(len(trechos) - 1))
+    if consecutivos and trechos:
+        return vetor[trechos[0][0]:trechos[-1][1]]
+    return np.concatenate([vetor[inicio:fim] for inicio, fim in trechos])
+
+
+def year_labels(store_dir: str, anos: List[int] = None) -> np.ndarray:
+    '''
+    Vetor com o ano de cada linha, alinhado com open_column para os mesmos anos.
+    '''
+    index = load_index(store_dir)
+    trechos = sorted((inicio, fim, int(ano)) for ano, (inicio, fim) in index['anos'].items()
+                     if anos is None or int(ano) in set(anos))
+    return np.concatenate([np.full(fim - inicio, ano, dtype='uint16') for inicio, fim, ano in trechos]) \
+        if trechos else np.empty(0, dtype='uint16')
+
+
+def load_columns(store_dir: str, columns: List[str], anos: List[int] = None) -> pd.DataFrame:
+    '''
+    Monta um DataFrame com algumas colunas numericas e a coluna ANO_COLETA,
+    pronto para funcoes como yearly_mean, create_imc ou
+    create_correlation_matrix.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    columns : List[str]
+        Colunas desejadas.
+
+    anos : List[int], optional
+        Anos desejados. Se None, todos.
+
+    Returns
+    -------
+    pandas.DataFrame
+        As colunas pedidas e ANO_COLETA.
+
+    Example
+    -------
+    >>> import tempfile
+    >>> pasta = os.path.join(tempfile.mkdtemp(), COLSTORE_DIRNAME)
+    >>> dados = {2021: pd.DataFrame({'ALTURA': [170, 180], 'PESO': [70, 80]})}
+    >>> _ = build_colstore(dados, pasta, columns=['ALTURA', 'PESO'])
+    >>> load_columns(pasta, ['PESO'])
+       PESO  ANO_COLETA
+    0  70.0        2021
+    1  80.0        2021
+    '''
+    dados = {coluna: open_column(store_dir, coluna, anos) for coluna in columns}
+    dados[PARTITION_COLUMN] = year_labels(store_dir, anos)
+    return pd.DataFrame(dados, copy=False)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,238 @@
+'''
+Matrizes de covariancia e correlacao acumuladas em fluxo.
+
+CovarianceAccumulator guarda, para cada par de colunas (i, j), somas
+apenas sobre as linhas em que as duas estao preenchidas: o numero de
+linhas N, a soma de x_i (S), a soma de x_i ao quadrado (Q) e a soma de
+x_i * x_j (P). Com elas a correlacao de cada par sai como em
+pandas.DataFrame.corr(), que tambem descarta os nulos par a par. As somas
+de dois acumuladores se juntam por adicao, entao pedacos, anos e processos
+podem ser acumulados separadamente.
+
+Os valores sao somados ja deslocados por um centro (a media de cada
+coluna no primeiro pedaco), o que evita perder precisao com alturas e
+pesos grandes em relacao a sua variancia. Acumuladores com centros
+diferentes sao levados ao mesmo centro antes de somar.
+
+stream_covariance percorre os anos do conjunto de dados em paralelo e
+acumula ao mesmo tempo a matriz de todos os dados e uma matriz por grupo
+(por exemplo por UF_RESIDENCIA).
+'''
+
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+try:
+    from .dataset import SermilDataset, read_dataset_year
+    from .validation import check_numeric
+    from .analysis_utils import iter_chunks
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    from dataset import SermilDataset, read_dataset_year
+    from validation import check_numeric
+    from analysis_utils import iter_chunks
+
+
+class CovarianceAccumulator:
+    '''
+    Somas par a par de um conjunto de colunas numericas.
+
+    Parameters
+    ----------
+    columns : List[str]
+        Colunas acumuladas, na ordem das linhas e colunas das matrizes.
+
+    Attributes
+    ----------
+    relatorio : dict
+        Primeiro relatorio de check_numeric com linhas rejeitadas, quando
+        update recebe regras; None se todos os pedacos passaram.
+
+    Example
+    -------
+    >>> df = pd.DataFrame({'ALTURA': [170, 180, 175, None], 'PESO': [60, 80, 70, 90]})
+    >>> acc = CovarianceAccumulator(['ALTURA', 'PESO']).update(df[:2]).merge(
+    ...     CovarianceAccumulator(['ALTURA', 'PESO']).update(df[2:]))
+    >>> acc.corr().round(6).equals(df.corr().round(6))
+    True
+    '''
+    def __init__(self, columns: List[str]):
+        self.columns = list(columns)
+        p = len(self.columns)
+        self.centro = None
+        self.n = np.zeros((p, p), dtype='int64')
+        self.s = np.zeros((p, p))
+        self.q = np.zeros((p, p))
+        self.prod = np.zeros((p, p))
+        self.relatorio = None
+
+    def update(self, df: pd.DataFrame, rules: Dict[str, object] = None) -> 'CovarianceAccumulator':
+        '''
+        Acumula um pedaco. Com rules (argumentos de check_numeric), os
+        valores nao nulos de cada coluna sao verificados antes.
+        '''
+        if rules is not None and self.relatorio is None:
+            for coluna in self.columns:
+                relatorio = check_numeric(df[coluna].dropna(), **rules)
+                if not relatorio['valido']:
+                    self.relatorio = relatorio
+                    break
+        x = np.column_stack([pd.to_numeric(df[coluna], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+                             for coluna in self.columns]) if len(df) else np.zeros((0, len(self.columns)))
+        presente = ~np.isnan(x)
+        if self.centro is None:
+            if not presente.any():
+                return self
+            contagem = presente.sum(axis=0)
+            self.centro = np.where(contagem > 0, np.where(presente, x, 0).sum(axis=0) / np.maximum(contagem, 1), 0.0)
+        y = np.where(presente, x - self.centro, 0.0)
+        m = presente.astype('float64')
+        # Os produtos de matrizes somam so as linhas com as duas colunas presentes.
+        self.n += (m.T @ m).astype('int64')
+        self.s += y.T @ m
+        self.q += (y * y).T @ m
+        self.prod += y.T @ y
+        return self
+
+    def _recentered(self, centro: np.ndarray) -> tuple:
+        # Somas deste acumulador como se tivessem sido feitas com outro centro.
+        d = self.centro - centro
+        s = self.s + d[:, None] * self.n
+        q = self.q + 2 * d[:, None] * self.s + (d ** 2)[:, None] * self.n
+        prod = self.prod + self.s * d[None, :] + self.s.T * d[:, None] + np.outer(d, d) * self.n
+        return s, q, prod
+
+    def merge(self, outro: 'CovarianceAccumulator') -> 'CovarianceAccumulator':
+        '''
+        Soma as parciais de outro acumulador, das mesmas colunas, a este.
+        '''
+        if outro.columns != self.columns:
+            raise ValueError("Os acumuladores precisam ter as mesmas colunas.")
+        if self.relatorio is None:
+            self.relatorio = outro.relatorio
+        if outro.centro is None:
+            return self
+        if self.centro is None:
+            self.centro = outro.centro.copy()
+        s, q, prod = outro._recentered(self.centro)
+        self.n += outro.n
+        self.s += s
+        self.q += q
+        self.prod += prod
+        return self
+
+    def _frame(self, matriz: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame(matriz, index=self.columns, columns=self.columns)
+
+    def count(self) -> pd.DataFrame:
+        '''
+        Numero de linhas com as duas colunas preenchidas, por par.
+        '''
+        return self._frame(self.n)
+
+    def cov(self) -> pd.DataFrame:
+        '''
+        Covariancia amostral par a par, como pandas.DataFrame.cov().
+        '''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            n = self.n.astype('float64')
+            desvios = self.prod - self.s * self.s.T / n
+            return self._frame(np.where(n > 1, desvios / (n - 1), np.nan))
+
+    def corr(self) -> pd.DataFrame:
+        '''
+        Correlacao de Pearson par a par, como pandas.DataFrame.corr().
+        '''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            n = self.n.astype('float64')
+            desvios = self.prod - self.s * self.s.T / n
+            quadrados = self.q - self.s ** 2 / n
+            correlacao = desvios / np.sqrt(quadrados * quadrados.T)
+            correlacao = np.where(n > 1, np.clip(correlacao, -1.0, 1.0), np.nan)
+            # A diagonal e 1 sempre que a coluna varia, como no pandas.
+            diagonal = np.diag(quadrados) > 0
+            correlacao[np.diag_indices_from(correlacao)] = np.where(diagonal, 1.0, np.nan)
+        return self._frame(correlacao)
+
+
+def _accumulate(chunks, columns: List[str], by: str, rules: Dict[str, object]) -> tuple:
+    total = CovarianceAccumulator(columns)
+    grupos = {}
+    for chunk in chunks:
+        total.update(chunk, rules)
+        if by is not None:
+            for grupo, parte in chunk.groupby(by, observed=True):
+                grupos.setdefault(grupo, CovarianceAccumulator(columns)).update(parte)
+    return total, grupos
+
+
+def _year_covariance(dataset_dir: str, ano: int, columns: List[str], by: str, filters: Dict[str, list],
+                     rules: Dict[str, object]) -> tuple:
+    extras = [col for col in [by, *filters] if col is not None and col not in columns]
+    df = read_dataset_year(dataset_dir, ano, list(columns) + extras, filters)
+    return _accumulate([df], columns, by, rules)
+
+
+def stream_covariance(source, columns: List[str], by: str = None, workers: int = 1,
+                      rules: Dict[str, object] = None) -> Tuple[CovarianceAccumulator, Dict[object, CovarianceAccumulator]]:
+    '''
+    Acumula covariancias em uma unica passagem pelos dados.
+
+    Parameters
+    ----------
+    source : str, SermilDataset, pandas.DataFrame ou iteravel de DataFrames
+        A pasta do conjunto de dados ou uma consulta (um acumulador por
+        ano, lido so com as colunas usadas), um csv lido em pedacos ou
+        pedacos ja lidos (ver analysis_utils.iter_chunks).
+
+    columns : List[str]
+        Colunas numericas.
+
+    by : str, optional
+        Coluna de grupo (por exemplo 'UF_RESIDENCIA'). Se informada, tambem
+        e devolvido um acumulador por valor dessa coluna.
+
+    workers : int, optional
+        Numero de processos para os anos do conjunto.
+
+    rules : dict, optional
+        Regras de check_numeric verificadas em cada pedaco.
+
+    Returns
+    -------
+    Tuple[CovarianceAccumulator, Dict[object, CovarianceAccumulator]]
+        O acumulador de todos os dados e os acumuladores por grupo.
+
+    Raises
+    ------
+    KeyError
+        Se alguma coluna nao existir nos dados.
+    '''
+    if isinstance(source, str) and os.path.isdir(source):
+        source = SermilDataset(source)
+    if isinstance(source, SermilDataset):
+        anos = source.years()
+        argumentos = ([source.dataset_dir] * len(anos), anos, [columns] * len(anos), [by] * len(anos),
+                      [source.filters] * len(anos), [rules] * len(anos))
+        if workers <= 1 or len(anos) <= 1:
+            partes = list(map(_year_covariance, *argumentos))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                partes = list(executor.map(_year_covariance, *argumentos))
+    else:
+        lidas = list(columns) + ([by] if by is not None and by not in columns else [])
+        partes = [_accumulate(iter_chunks(source, lidas), columns, by, rules)]
+    total = CovarianceAccumulator(columns)
+    grupos = {}
+    for parcial, por_grupo in partes:
+        total.merge(parcial)
+        for grupo, acumulador in por_grupo.items():
+            grupos.setdefault(grupo, CovarianceAccumulator(columns)).merge(acumulador)
+    return total, grupos
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(verbose=True)
@@ -13,15 +13,39 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import datetime as dt
 import os
+import csv
+import hashlib
 import doctest
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from .dataset import dataset_dir_for, update_dataset, read_dataset
+    from .aggstore import update_aggstore
+    from .manifest import load_manifest, save_manifest
+    from .parquet_store import year_from_filename
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    from dataset import dataset_dir_for, update_dataset, read_dataset
+    from aggstore import update_aggstore
+    from manifest import load_manifest, save_manifest
+    from parquet_store import year_from_filename
 
-def concatenate_last_n_csv_files(folder:str, destination_folder:str,n:int=15)->pd.DataFrame:
+# Manifesto dos csvs de uma pasta, usado por integrity_check.
+FILES_MANIFEST = 'sermil_files.json'
+
+def concatenate_last_n_csv_files(folder:str, destination_folder:str,n:int=15,workers:int=1)->pd.DataFrame:
     """
     Função que concatena os n últimos arquivos csv em uma pasta,
     onde n é um número inteiro escolhido pelo usuário,
     se n for um número maior que o de registros disponíveis,
     a função concatena todos os arquivos. 
 
+    Os anos ficam guardados no conjunto de dados de destination_folder
+    (módulo dataset, pasta 'sermil_dataset'), que substitui o antigo
+    'SERMIL_5_ANOS.csv': só os anos novos ou alterados são lidos e gravados,
+    e cada um na sua própria partição. Com workers > 1 os anos são lidos
+    em processos paralelos; o resultado é montado com uma única
+    concatenação, sempre em ordem de ano.
+
     Parameters
     ----------
     folder : str
@@ -33,6 +57,9 @@ def concatenate_last_n_csv_files(folder:str, destination_folder:str,n:int=15)->p
     n : int , optional
         n últimos arquivos a serem concatenados, por default n = 10.
 
+    workers : int, optional
+        Número de processos que fazem o parse dos anos, por default 1.
+
     Returns
     -------
     pd.DataFrame
@@ -60,24 +87,115 @@ def concatenate_last_n_csv_files(folder:str, destination_folder:str,n:int=15)->p
     # Get the last n csv fiLes
         last_n_csv_files = sorted_filenames[n:]
     
-    # Initialize empty DataFrame to store concat data
-    concatenated_data = pd.DataFrame()
-    # Concatenate the CSV files, based on Date
-    counter = 0
-    for csv_file in last_n_csv_files:
-        file_path = os.path.join(folder, csv_file)
-        data = pd.read_csv(file_path, encoding='latin1',low_memory=False)
-        data['ANO_COLETA'] = int(last_n_csv_files[counter][6:10])
-        concatenated_data = pd.concat([concatenated_data, data], ignore_index=True)
-        counter += 1
-    concatenated_data.to_csv(os.path.join(destination_folder, 'SERMIL_5_ANOS.csv'),index=False)
-    return concatenated_data
-
-def integrity_check(folder:str,begin:int=2012,end:int=2022):
+    # Only new or modified years are written to the dataset,
+    # then the requested years are read back, tagged by ANO_COLETA.
+    anos = [int(csv_file[6:10]) for csv_file in last_n_csv_files]
+    dataset_dir = dataset_dir_for(destination_folder)
+    update_dataset(folder, dataset_dir, anos=anos, workers=workers)
+    # The per-year aggregates (trend partials, histograms, IMC cube) follow the ingestion.
+    update_aggstore(dataset_dir)
+    return read_dataset(dataset_dir, anos=anos, workers=workers)
+
+def _scan_file(path: str, block_size: int = 1 << 20) -> dict:
+    """
+    Lê um arquivo uma única vez, em blocos, calculando o sha256, o número
+    de linhas de dados e o cabeçalho.
+    """
+    hasher = hashlib.sha256()
+    quebras = 0
+    primeira = b''
+    ultimo = b''
+    with open(path, 'rb') as f:
+        for bloco in iter(lambda: f.read(block_size), b''):
+            hasher.update(bloco)
+            quebras += bloco.count(b'\n')
+            if len(primeira) < 1 << 16 and b'\n' not in primeira:
+                primeira += bloco
+            ultimo = bloco[-1:]
+    info = os.stat(path)
+    cabecalho = primeira.split(b'\n', 1)[0].rstrip(b'\r').decode('latin1')
+    # Uma última linha sem quebra também conta (e indica um arquivo possivelmente truncado).
+    linhas = quebras + (1 if ultimo not in (b'', b'\n') else 0)
+    return {
+        'size': info.st_size,
+        'mtime_ns': info.st_mtime_ns,
+        'sha256': hasher.hexdigest(),
+        'linhas': max(linhas - 1, 0),
+        'colunas': next(csv.reader([cabecalho]), []) if cabecalho else [],
+        'completo': ultimo == b'\n',
+    }
+
+
+def file_manifest(folder: str, workers: int = 4) -> dict:
+    """
+    Atualiza e devolve o manifesto dos csvs 'sermilYYYY.csv' de uma pasta
+    ('sermil_files.json', na própria pasta), com tamanho, data de
+    modificação, sha256, número de linhas e cabeçalho de cada arquivo.
+
+    Só os arquivos novos ou cujo tamanho ou data de modificação mudaram
+    são lidos de novo, em paralelo; os demais custam apenas um os.stat.
+
+    Parameters
+    ----------
+    folder : str
+        Diretório da pasta que contém os arquivos CSV.
+
+    workers : int, optional
+        Número máximo de arquivos lidos simultaneamente.
+
+    Returns
+    -------
+    dict
+        Nome do arquivo -> entrada do manifesto (com o ano em 'ano').
+
+    Example
+    -------
+    >>> import tempfile
+    >>> pasta = tempfile.mkdtemp()
+    >>> pd.DataFrame({'PESO': [70, 80]}).to_csv(os.path.join(pasta, 'sermil2022.csv'), index=False)
+    >>> entrada = file_manifest(pasta)['sermil2022.csv']
+    >>> entrada['linhas'], entrada['colunas'], entrada['completo']
+    (2, ['PESO'], True)
+    """
+    manifest_path = os.path.join(folder, FILES_MANIFEST)
+    anterior = load_manifest(manifest_path)
+    manifest = {}
+    pendentes = []
+    for nome in sorted(os.listdir(folder)):
+        ano = year_from_filename(nome)
+        if ano is None:
+            continue
+        info = os.stat(os.path.join(folder, nome))
+        entrada = anterior.get(nome)
+        if entrada and entrada['size'] == info.st_size and entrada['mtime_ns'] == info.st_mtime_ns:
+            manifest[nome] = entrada
+        else:
+            pendentes.append((nome, ano))
+
+    if pendentes:
+        workers = max(1, min(int(workers), len(pendentes)))
+        # hashlib libera o GIL em blocos grandes, entao threads bastam.
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            lidos = executor.map(_scan_file, [os.path.join(folder, nome) for nome, _ in pendentes])
+            for (nome, ano), entrada in zip(pendentes, lidos):
+                entrada['ano'] = ano
+                manifest[nome] = entrada
+    if pendentes or set(manifest) != set(anterior):
+        save_manifest(manifest, manifest_path)
+    return manifest
+
+
+def integrity_check(folder:str,begin:int=2012,end:int=2022,columns:list=None,workers:int=4):
     """
     Função que verifica se todos os arquivos csv de múltiplos
     anos (onde no título ex.: 'sermil2023' do arquivo está escrito o ano), estão
-    devidamente presentes. 
+    devidamente presentes e completos: cada ano precisa ter ao menos uma
+    linha de dados, terminar com uma quebra de linha (um download
+    interrompido termina no meio de uma linha) e, se columns for
+    informado, ter essas colunas no cabeçalho.
+
+    Os dados vêm do manifesto de file_manifest, então só os arquivos que
+    mudaram desde a última verificação são lidos de novo.
 
     Importante: Esta função funciona somente para arquivos cujo 
     título é do tipo 'sermilYYYY'.
@@ -93,6 +211,12 @@ def integrity_check(folder:str,begin:int=2012,end:int=2022):
     end : str , optional
         Data de arquivo mais recente que deveria estar presente na pasta
 
+    columns : list, optional
+        Colunas que todos os arquivos devem ter.
+
+    workers : int, optional
+        Número máximo de arquivos lidos simultaneamente.
+
     Returns
     -------
     bool
@@ -117,32 +241,20 @@ def integrity_check(folder:str,begin:int=2012,end:int=2022):
     # Such as, writing begin data as end data.
     if (begin > end):
         end = begin
-
-    # Get a list of all files in the folder
     # important, to counter negative dates,(typing mistake)
     # begin and end are defined as an absolute value
-    all_files = os.listdir(folder)
     begin = abs(int(begin))
     end = abs(int(end))
-    # Filter files to only get CSV files and sort them by modification date
-    # The earlier the date, the first are the positions at the list.
-    csv_files = [f for f in all_files if f.endswith('.csv')]
-    sorted_filenames_all = sorted(csv_files, key=lambda x: int(x[6:10]))
-    sorted_filenames_all[0]
-    sorted_filenames = sorted_filenames_all[-(end-begin)-1:]
-    # If user wrote an interval that does not exist,
-    # Integrity check fails, Function returns False
-    if (end-begin)>len(sorted_filenames):
-        return False
-    # Counter that updates checked files
-    for file_name in sorted_filenames:
-        if int(file_name[6:10])==begin:
-            sorted_filenames = sorted_filenames.remove(file_name)
-        begin += 1
-    # begin == end, implies that no file is missing, all years were verified.
-    if  begin == end:
-        return True
-    return False
+
+    por_ano = {entrada['ano']: entrada for entrada in file_manifest(folder, workers).values()}
+    for ano in range(begin, end + 1):
+        entrada = por_ano.get(ano)
+        # Missing, empty or truncated year: integrity check fails.
+        if entrada is None or entrada['linhas'] == 0 or not entrada['completo']:
+            return False
+        if columns is not None and not set(columns).issubset(entrada['colunas']):
+            return False
+    return True
 
 # Run tests with doctest
 if __name__ == "__main__":
@@ -0,0 +1,524 @@
+'''
+Conjunto de dados com varios anos do SERMIL, que cresce um ano de cada vez.
+
+Substitui o 'data_concat/SERMIL_5_ANOS.csv', que era relido e reescrito por
+inteiro a cada chamada de concatenate_last_n_csv_files. Aqui cada ano fica
+na sua propria particao ('sermil_dataset/ANO_COLETA={ano}/part-0.parquet',
+ou '.csv' sem o pyarrow) e um pequeno manifesto ('dataset_manifest.json')
+registra, para cada ano, o arquivo de origem (tamanho e data de
+modificacao), o arquivo da particao e o numero de linhas. Acrescentar um
+ano grava apenas a particao desse ano e atualiza o manifesto; nada do que ja
+esta guardado e reescrito.
+
+A leitura e a gravacao de varios anos podem ser feitas em processos
+separados (argumento workers): cada processo faz o parse de um ano e o
+resultado e montado de uma vez, sempre na ordem dos anos.
+'''
+
+import os
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+try:
+    from .manifest import load_manifest, save_manifest
+    from .schema import apply_schema, csv_dtypes
+    from .parquet_store import (PARTITION_COLUMN, parquet_available, write_year,
+                                year_from_filename, read_sermil_csv)
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    from manifest import load_manifest, save_manifest
+    from schema import apply_schema, csv_dtypes
+    from parquet_store import (PARTITION_COLUMN, parquet_available, write_year,
+                               year_from_filename, read_sermil_csv)
+
+# Nome da pasta do conjunto de dados, criada dentro da pasta de destino (data_concat).
+DATASET_DIRNAME = 'sermil_dataset'
+
+_MANIFEST_FILE = 'dataset_manifest.json'
+
+
+def dataset_dir_for(destination_folder: str) -> str:
+    '''
+    Pasta do conjunto de dados dentro de uma pasta de destino.
+
+    Example
+    -------
+    >>> dataset_dir_for('data_concat') == os.path.join('data_concat', 'sermil_dataset')
+    True
+    '''
+    return os.path.join(destination_folder, DATASET_DIRNAME)
+
+
+def load_dataset_manifest(dataset_dir: str) -> dict:
+    '''
+    Le o manifesto do conjunto de dados.
+
+    Parameters
+    ----------
+    dataset_dir : str
+        Pasta do conjunto de dados.
+
+    Returns
+    -------
+    dict
+        Ano (como texto) -> {'particao', 'linhas', 'colunas', 'origem'}.
+        Vazio se o conjunto ainda nao existir.
+
+    Example
+    -------
+    >>> load_dataset_manifest('ESSA_PASTA_N_EXISTE')
+    {}
+    '''
+    return load_manifest(os.path.join(dataset_dir, _MANIFEST_FILE))
+
+
+def dataset_years(dataset_dir: str) -> List[int]:
+    '''
+    Lista, em ordem, os anos guardados no conjunto de dados.
+
+    Example
+    -------
+    >>> dataset_years('ESSA_PASTA_N_EXISTE')
+    []
+    '''
+    return sorted(int(ano) for ano in load_dataset_manifest(dataset_dir))
+
+
+def _source_signature(csv_path: str) -> dict:
+    info = os.stat(csv_path)
+    return {'arquivo': os.path.basename(csv_path), 'tamanho': info.st_size, 'mtime_ns': info.st_mtime_ns}
+
+
+def _write_partition(df: pd.DataFrame, ano: int, dataset_dir: str) -> str:
+    if parquet_available():
+        return write_year(df, ano, dataset_dir)
+    destino = os.path.join(dataset_dir, f'{PARTITION_COLUMN}={ano}', 'part-0.csv')
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    df = df.drop(columns=[PARTITION_COLUMN], errors='ignore')
+    df.to_csv(destino + '.tmp', index=False)
+    os.replace(destino + '.tmp', destino)
+    return destino
+
+
+def _write_entry(df: pd.DataFrame, ano: int, dataset_dir: str, origem: dict) -> dict:
+    destino = _write_partition(df, ano, dataset_dir)
+    return {
+        'particao': os.path.relpath(destino, dataset_dir),
+        'linhas': int(len(df)),
+        'colunas': [col for col in df.columns if col != PARTITION_COLUMN],
+        'origem': origem,
+    }
+
+
+def _save_entries(dataset_dir: str, entradas: Dict[int, dict]):
+    manifest = load_dataset_manifest(dataset_dir)
+    for ano, entrada in entradas.items():
+        manifest[str(ano)] = entrada
+    save_manifest(manifest, os.path.join(dataset_dir, _MANIFEST_FILE))
+
+
+def _ingest_csv(csv_path: str, ano: int, dataset_dir: str, origem: dict) -> dict:
+    '''
+    Le um csv e grava a particao do ano. E a unidade de trabalho dos
+    processos de update_dataset; o manifesto fica a cargo do processo principal.
+    '''
+    df = read_sermil_csv(csv_path, encoding='latin1', low_memory=False)
+    return _write_entry(df, ano, dataset_dir, origem)
+
+
+def append_year(df: pd.DataFrame, ano: int, dataset_dir: str, origem: dict = None) -> dict:
+    '''
+    Grava os dados de um ano no conjunto. Apenas a particao desse ano e
+    escrita e o manifesto so e atualizado depois dela, entao uma falha no
+    meio da escrita nao deixa o conjunto inconsistente.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dados do ano.
+
+    ano : int
+        Ano dos dados.
+
+    dataset_dir : str
+        Pasta do conjunto de dados.
+
+    origem : dict, optional
+        Assinatura do arquivo de origem, usada por update_dataset para
+        saber se o ano mudou.
+
+    Returns
+    -------
+    dict
+        A entrada do ano no manifesto.
+    '''
+    entrada = _write_entry(df, ano, dataset_dir, origem)
+    _save_entries(dataset_dir, {ano: entrada})
+    return entrada
+
+
+def update_dataset(folder: str, dataset_dir: str, anos: List[int] = None, workers: int = 1) -> List[int]:
+    '''
+    Acrescenta ao conjunto os 'sermil{ano}.csv' de uma pasta que ainda nao
+    foram guardados ou que mudaram (tamanho ou data de modificacao) desde a
+    ultima atualizacao. Os demais anos nao sao lidos.
+
+    Parameters
+    ----------
+    folder : str
+        Pasta com os csvs de cada ano.
+
+    dataset_dir : str
+        Pasta do conjunto de dados.
+
+    anos : List[int], optional
+        Anos considerados. Se None, todos os csvs da pasta.
+
+    workers : int, optional
+        Numero de processos que fazem o parse dos anos ao mesmo tempo. Por
+        padrao 1, no proprio processo.
+
+    Returns
+    -------
+    List[int]
+        Anos gravados nesta chamada.
+
+    Example
+    -------
+    >>> import tempfile
+    >>> pasta = tempfile.mkdtemp()
+    >>> pd.DataFrame({'PESO': [70, 80]}).to_csv(os.path.join(pasta, 'sermil2021.csv'), index=False)
+    >>> destino = dataset_dir_for(pasta)
+    >>> update_dataset(pasta, destino)
+    [2021]
+    >>> update_dataset(pasta, destino)
+    []
+    '''
+    manifest = load_dataset_manifest(dataset_dir)
+    pendentes = []
+    for nome in sorted(os.listdir(folder)):
+        ano = year_from_filename(nome)
+        # year_from_filename so aceita 'sermil{ano}.csv': 'sermilH2022.csv', por
+        # exemplo, tem outras colunas e nao e um ano do conjunto.
+        if ano is None or (anos is not None and ano not in anos):
+            continue
+        csv_path = os.path.join(folder, nome)
+        origem = _source_signature(csv_path)
+        if manifest.get(str(ano), {}).get('origem') != origem:
+            pendentes.append((csv_path, ano, origem))
+
+    workers = max(1, min(int(workers), len(pendentes)))
+    if workers == 1:
+        for csv_path, ano, origem in pendentes:
+            _save_entries(dataset_dir, {ano: _ingest_csv(csv_path, ano, dataset_dir, origem)})
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futuros = [executor.submit(_ingest_csv, csv_path, ano, dataset_dir, origem)
+                       for csv_path, ano, origem in pendentes]
+            # O manifesto so e gravado pelo processo principal, um ano de cada vez.
+            for (_, ano, _), futuro in zip(pendentes, futuros):
+                _save_entries(dataset_dir, {ano: futuro.result()})
+    return [ano for _, ano, _ in pendentes]
+
+
+def _mask(df: pd.DataFrame, filters: Dict[str, list]) -> pd.Series:
+    mascara = pd.Series(True, index=df.index)
+    for coluna, valores in filters.items():
+        mascara &= df[coluna].isin(valores)
+    return mascara
+
+
+def _empty_year(caminho: str, columns: List[str] = None) -> pd.DataFrame:
+    # So o esquema da particao, sem nenhuma linha.
+    if caminho.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        df = pq.read_schema(caminho).empty_table().to_pandas()
+        return df if columns is None else df[columns]
+    return apply_schema(pd.read_csv(caminho, usecols=columns, dtype=csv_dtypes(), nrows=0), inplace=True)
+
+
+def read_dataset_year(dataset_dir: str, ano: int, columns: List[str] = None,
+                      filters: Dict[str, list] = None) -> pd.DataFrame:
+    '''
+    Le um ano do conjunto, apenas com as colunas pedidas. Com filters
+    (coluna -> valores aceitos), so as linhas em que todas as colunas
+    tem um dos valores aceitos sao devolvidas; no Parquet o filtro e
+    repassado ao pyarrow, que descarta os grupos de linhas sem nenhum
+    valor aceito antes de ler. As colunas de filters precisam estar em columns.
+    Se o ano nao tiver alguma coluna de filters, nenhuma linha e aceita e o
+    resultado vem vazio, sem ler a particao.
+
+    Raises
+    ------
+    KeyError
+        Se o ano nao estiver no conjunto.
+    '''
+    entrada = load_dataset_manifest(dataset_dir).get(str(ano))
+    if entrada is None:
+        raise KeyError(f"O ano {ano} nao esta no conjunto de dados.")
+    if columns is not None:
+        columns = [col for col in entrada['colunas'] if col in set(columns)]
+    caminho = os.path.join(dataset_dir, entrada['particao'])
+    if any(col not in entrada['colunas'] for col in (filters or {})):
+        return _empty_year(caminho, columns)
+    if caminho.endswith('.parquet'):
+        pushdown = [(col, 'in', list(valores)) for col, valores in (filters or {}).items()]
+        df = pd.read_parquet(caminho, engine='pyarrow', columns=columns, filters=pushdown or None)
+    else:
+        df = apply_schema(pd.read_csv(caminho, usecols=columns, dtype=csv_dtypes()), inplace=True)
+    if filters:
+        df = df[_mask(df, filters)].reset_index(drop=True)
+    return df
+
+
+def _read_tagged(dataset_dir: str, ano: int, columns: List[str] = None,
+                 filters: Dict[str, list] = None) -> pd.DataFrame:
+    parte = read_dataset_year(dataset_dir, ano, columns, filters)
+    parte[PARTITION_COLUMN] = pd.Series(ano, index=parte.index, dtype='UInt16')
+    return parte
+
+
+def concat_years(partes: List[pd.DataFrame]) -> pd.DataFrame:
+    '''
+    Junta os DataFrames de varios anos com um unico pandas.concat, na ordem
+    recebida. As colunas categoricas recebem antes a uniao das categorias de
+    todos os anos, para que o resultado continue categorico sem passar por
+    uma coluna de texto intermediaria.
+
+    Parameters
+    ----------
+    partes : List[pandas.DataFrame]
+        Dados de cada ano.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Os dados concatenados, com indice de 0 a n-1.
+
+    Example
+    -------
+    >>> a = pd.DataFrame({'SEXO': pd.Categorical(['M'])})
+    >>> b = pd.DataFrame({'SEXO': pd.Categorical(['F', 'M'])})
+    >>> resultado = concat_years([a, b])
+    >>> resultado['SEXO'].tolist(), str(resultado['SEXO'].dtype)
+    (['M', 'F', 'M'], 'category')
+    '''
+    categoricas = {}
+    for parte in partes:
+        for col in parte.columns:
+            if isinstance(parte[col].dtype, pd.CategoricalDtype):
+                categoricas.setdefault(col, []).append(parte[col])
+    for col, series in categoricas.items():
+        if len(series) < len(partes):
+            continue
+        categorias = pd.api.types.union_categoricals(series).categories
+        for parte in partes:
+            parte[col] = parte[col].cat.set_categories(categorias)
+    return pd.concat(partes, ignore_index=True)
+
+
+def read_dataset(dataset_dir: str, columns: List[str] = None, anos: List[int] = None,
+                 workers: int = 1, filters: Dict[str, list] = None) -> pd.DataFrame:
+    '''
+    Le varios anos do conjunto em um unico DataFrame, com a coluna
+    ANO_COLETA indicando o ano de cada linha. Colunas que nao existem em
+    um ano ficam vazias nas linhas desse ano.
+
+    Parameters
+    ----------
+    dataset_dir : str
+        Pasta do conjunto de dados.
+
+    columns : List[str], optional
+        Colunas desejadas. Se None, todas.
+
+    anos : List[int], optional
+        Anos desejados. Se None, todos os anos guardados.
+
+    workers : int, optional
+        Numero de processos que leem os anos ao mesmo tempo. A ordem do
+        resultado nao depende de qual processo termina primeiro.
+
+    filters : Dict[str, list], optional
+        Coluna -> valores aceitos, aplicado a cada ano durante a leitura
+        (ver read_dataset_year).
+
+    Returns
+    -------
+    pandas.DataFrame
+        Os dados dos anos, em ordem crescente de ano.
+
+    Example
+    -------
+    >>> import tempfile
+    >>> pasta = tempfile.mkdtemp()
+    >>> _ = append_year(pd.DataFrame({'PESO': [70, 80]}), 2021, pasta)
+    >>> _ = append_year(pd.DataFrame({'PESO': [75]}), 2022, pasta)
+    >>> read_dataset(pasta, ['PESO'], anos=[2022])
+       PESO  ANO_COLETA
+    0    75        2022
+    '''
+    disponiveis = dataset_years(dataset_dir)
+    if anos is not None:
+        disponiveis = [ano for ano in disponiveis if ano in set(anos)]
+    if not disponiveis:
+        return pd.DataFrame(columns=(list(columns) if columns else []) + [PARTITION_COLUMN])
+    workers = max(1, min(int(workers), len(disponiveis)))
+    if workers == 1:
+        partes = [_read_tagged(dataset_dir, ano, columns, filters) for ano in disponiveis]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map devolve os resultados na ordem dos anos pedidos.
+            partes = list(executor.map(_read_tagged, [dataset_dir] * len(disponiveis), disponiveis,
+                                       [columns] * len(disponiveis), [filters] * len(disponiveis)))
+    # Colunas que faltam em algum ano chegam como texto; o esquema e reaplicado.
+    return apply_schema(concat_years(partes), inplace=True)
+
+
+def dataset_summary(dataset_dir: str) -> Dict[int, int]:
+    '''
+    Numero de linhas de cada ano do conjunto, lido apenas do manifesto.
+
+    Example
+    -------
+    >>> dataset_summary('ESSA_PASTA_N_EXISTE')
+    {}
+    '''
+    return {int(ano): entrada['linhas'] for ano, entrada in sorted(load_dataset_manifest(dataset_dir).items())}
+
+
+class SermilDataset:
+    '''
+    Consulta preguicosa sobre todos os anos do conjunto de dados. select e
+    where apenas devolvem uma nova consulta; nada e lido ate collect, que
+    abre so as particoes dos anos pedidos e so as colunas usadas.
+
+    Parameters
+    ----------
+    dataset_dir : str
+        Pasta do conjunto de dados (por exemplo 'data_concat/sermil_dataset').
+
+    Example
+    -------
+    >>> import tempfile
+    >>> pasta = tempfile.mkdtemp()
+    >>> _ = append_year(pd.DataFrame({'PESO': [70, 80], 'UF_RESIDENCIA': ['SP', 'RJ']}), 2021, pasta)
+    >>> _ = append_year(pd.DataFrame({'PESO': [75], 'UF_RESIDENCIA': ['SP']}), 2022, pasta)
+    >>> consulta = SermilDataset(pasta).select('PESO').where(anos=range(2021, 2023), UF_RESIDENCIA='SP')
+    >>> consulta.collect()
+       PESO  ANO_COLETA
+    0    70        2021
+    1    75        2022
+    '''
+
+    def __init__(self, dataset_dir: str, columns: List[str] = None, anos: List[int] = None,
+                 filters: Dict[str, list] = None):
+        self.dataset_dir = dataset_dir
+        self.columns = None if columns is None else list(columns)
+        self.anos = None if anos is None else sorted(set(anos))
+        self.filters = dict(filters or {})
+
+    def __repr__(self):
+        return (f"SermilDataset('{self.dataset_dir}', columns={self.columns}, "
+                f"anos={self.anos}, filters={self.filters})")
+
+    def select(self, *columns) -> 'SermilDataset':
+        '''
+        Restringe a consulta as colunas pedidas (nomes soltos ou uma lista).
+        A coluna ANO_COLETA e sempre incluida no resultado.
+        '''
+        if len(columns) == 1 and not isinstance(columns[0], str):
+            columns = tuple(columns[0])
+        columns = [col for col in columns if col != PARTITION_COLUMN]
+        return SermilDataset(self.dataset_dir, columns, self.anos, self.filters)
+
+    def where(self, anos: List[int] = None, **igualdades) -> 'SermilDataset':
+        '''
+        Restringe a consulta a alguns anos e/ou a linhas com certos valores.
+
+        Parameters
+        ----------
+        anos : List[int], optional
+            Anos aceitos (uma lista ou um range). Resolvido pelo manifesto,
+            sem abrir as particoes dos outros anos.
+
+        **igualdades
+            Coluna=valor ou coluna=[valores]. Chamadas seguidas de where
+            acumulam as condicoes.
+
+        Returns
+        -------
+        SermilDataset
+            A nova consulta.
+        '''
+        novos_anos = self.anos
+        if anos is not None:
+            anos = {int(ano) for ano in anos}
+            novos_anos = sorted(anos if self.anos is None else anos & set(self.anos))
+        filtros = dict(self.filters)
+        for coluna, valores in igualdades.items():
+            if isinstance(valores, str) or not hasattr(valores, '__iter__'):
+                valores = [valores]
+            valores = list(valores)
+            if coluna in filtros:
+                valores = [valor for valor in filtros[coluna] if valor in valores]
+            filtros[coluna] = valores
+        return SermilDataset(self.dataset_dir, self.columns, novos_anos, filtros)
+
+    def years(self) -> List[int]:
+        '''
+        Anos que a consulta vai ler, sem abrir nenhuma particao.
+        '''
+        disponiveis = dataset_years(self.dataset_dir)
+        if self.anos is None:
+            return disponiveis
+        return [ano for ano in disponiveis if ano in set(self.anos)]
+
+    def collect(self, workers: int = 1) -> pd.DataFrame:
+        '''
+        Executa a consulta.
+
+        Parameters
+        ----------
+        workers : int, optional
+            Numero de processos que leem os anos ao mesmo tempo.
+
+        Returns
+        -------
+        pandas.DataFrame
+            As colunas pedidas e ANO_COLETA, em ordem de ano.
+        '''
+        lidas = self.columns
+        if lidas is not None:
+            lidas = lidas + [col for col in self.filters if col not in lidas]
+        df = read_dataset(self.dataset_dir, columns=lidas, anos=self.years(), workers=workers,
+                          filters=self.filters or None)
+        if self.columns is not None:
+            df = df[[col for col in self.columns if col in df.columns] + [PARTITION_COLUMN]]
+        return df
+
+
+def as_frame(dados, columns: List[str] = None) -> pd.DataFrame:
+    '''
+    Permite que as funcoes de analise recebam um DataFrame, um
+    SermilDataset ou a pasta do conjunto de dados. Uma consulta e executada
+    apenas com as colunas informadas; um DataFrame e devolvido como esta.
+
+    Example
+    -------
+    >>> df = pd.DataFrame({'PESO': [70]})
+    >>> as_frame(df, ['PESO']) is df
+    True
+    '''
+    if isinstance(dados, str):
+        dados = SermilDataset(dados)
+    if isinstance(dados, SermilDataset):
+        if columns is not None:
+            dados = dados.select(columns)
+        return dados.collect()
+    return dados
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(verbose=True)
@@ -1,6 +1,11 @@
-import requests
+import os
 import importlib
 from typing import List
+try:
+    from . import httpclient
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    import httpclient
 
 def check_libraries() -> List[str]:
     '''
@@ -43,14 +48,89 @@ def check_libraries() -> List[str]:
     else:
         return None
 
-def download_gpkg_local(url: str) -> bool:
+# Camada do geopackage do IBGE com os limites das unidades da federacao.
+STATE_LAYER = "lim_unidade_federacao_a"
+
+
+def state_layer_path(gpkg_path: str) -> str:
+    '''
+    Caminho do arquivo compacto com apenas a camada dos estados, extraida
+    do geopackage em gpkg_path.
+
+    Parameters
+    ----------
+    gpkg_path: str
+        O caminho do geopackage completo.
+
+    Returns
+    -------
+    str
+        O caminho do arquivo compacto, na mesma pasta do geopackage.
+
+    Example
+    -------
+    >>> state_layer_path("data/geo_data.gpkg")
+    'data/geo_data_estados.gpkg'
+    '''
+    base, ext = os.path.splitext(gpkg_path)
+    return f"{base}_estados{ext or '.gpkg'}"
+
+
+def extract_state_layer(gpkg_path: str = "geo_data.gpkg", output_path: str = None) -> str:
+    '''
+    Extrai do geopackage completo apenas a camada dos estados e a salva em
+    um geopackage pequeno, com uma unica camada. Assim as proximas leituras
+    nao precisam abrir o arquivo de varios GB.
+
+    Parameters
+    ----------
+    gpkg_path: str
+        O caminho do geopackage completo.
+    output_path: str, optional
+        Onde salvar o arquivo compacto. Por padrao state_layer_path(gpkg_path).
+
+    Returns
+    -------
+    str or None
+        O caminho do arquivo compacto, ou None se a extracao falhar.
+
+    Example
+    -------
+    >>> extract_state_layer("ESSE_ARQUIVO_N_EXISTE.gpkg") is None
+    True
+    '''
+    if output_path is None:
+        output_path = state_layer_path(gpkg_path)
+    try:
+        import geopandas as gpd
+        if not os.path.exists(gpkg_path):
+            return None
+        estados = gpd.read_file(gpkg_path, layer=STATE_LAYER)
+        temp_path = output_path + ".tmp.gpkg"
+        estados.to_file(temp_path, layer=STATE_LAYER, driver="GPKG")
+        os.replace(temp_path, output_path)
+        return output_path
+    except Exception as e:
+        print("Ocorreu um erro ao extrair a camada dos estados: ", str(e))
+        return None
+
+
+def download_gpkg_local(url: str, local_file: str = "geo_data.gpkg", extract_states: bool = True) -> bool:
     '''
     Faz o download do um arquivo dado uma url
 
+    O arquivo e gravado em disco em blocos, conforme chega, sem ser mantido
+    inteiro na memoria. Depois do download, a camada dos estados e extraida
+    uma unica vez para um arquivo compacto (ver extract_state_layer).
+
     Parameters
     ----------
     url: str
         A URL do arquivo que será baixado.
+    local_file: str, optional
+        Onde salvar o arquivo. Por padrao 'geo_data.gpkg'.
+    extract_states: bool, optional
+        Se True (padrao), extrai a camada dos estados apos o download.
 
     Returns
     -------
@@ -64,11 +144,18 @@ def download_gpkg_local(url: str) -> bool:
     True
     '''
     try:
-        data_gpkg = requests.get(url)
-        if data_gpkg.status_code == 200:
-            with open("geo_data.gpkg", 'wb') as file:
-                file.write(data_gpkg.content)
-            return True
+        with httpclient.get(url, stream=True) as data_gpkg:
+            if data_gpkg.status_code == 200:
+                temp_file = local_file + ".part"
+                with open(temp_file, 'wb') as file:
+                    for bloco in data_gpkg.iter_content(chunk_size=1 << 20):
+                        file.write(bloco)
+                os.replace(temp_file, local_file)
+            else:
+                return None
+        if extract_states:
+            extract_state_layer(local_file)
+        return True
     except:
         return None
     
@@ -2,19 +2,42 @@
 Esse modulo tem o objetivo de baixar csvs localmente.
 Para isso foi criada uma funcao que baixa um unico arquivo csv.
 E outra que baixa todos os csvs necessarios para anlise. 
+Tambem ha uma funcao que atualiza apenas os anos que mudaram no
+servidor, usando um manifesto de downloads.
 '''
 
 import os
-from .cleandata import process_data,make_http_request
-from typing import List
+import json
+import hashlib
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Tuple
+try:
+    from . import httpclient
+    from .cleandata import process_data,make_http_request,make_http_stream,process_data_chunks
+    from .manifest import load_manifest, save_manifest, conditional_headers
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    import httpclient
+    from cleandata import process_data,make_http_request,make_http_stream,process_data_chunks
+    from manifest import load_manifest, save_manifest, conditional_headers
 
-def download_csv_local(url: str,dropna:bool = False, local_file:str = None ,columns: List[str] = None):
+# Endereco dos csvs anuais do SERMIL no portal de dados abertos do Exercito.
+SERMIL_URL = 'https://dadosabertos.eb.mil.br/arquivos/sermil/sermil{ano}.csv'
+
+def download_csv_local(url: str,dropna:bool = False, local_file:str = None ,columns: List[str] = None,
+                       chunksize: int = None, resumable: bool = False, expected_sha256: str = None):
     '''
     Serve para baixar o CSV localmente de uma URL.
     Permite que voce baixe colunas selecionadas, ou
     seja, nao baixe todo o csv. Utiliza funcoes criadas
     no modulo cleandata.
 
+    Se chunksize for informado, a resposta e lida em streaming e passa
+    pelo parser em blocos de chunksize linhas, que sao gravados em disco
+    conforme chegam. Nesse modo o pico de memoria depende do tamanho do
+    bloco, e nao do tamanho do arquivo.
+
     Parameters
     ----------
     url : str
@@ -29,12 +52,31 @@ def download_csv_local(url: str,dropna:bool = False, local_file:str = None ,colu
     
     columns : list, optional
         Lista com os nomes das colunas desejadas, se nao especificado, todas as colunas serao lidas.
+
+    chunksize : int, optional
+        Numero de linhas por bloco no modo streaming. Se None (padrao), o
+        csv inteiro e carregado na memoria antes de ser salvo.
+
+    resumable : bool, optional
+        Se True, o arquivo original e baixado com download_file_resumable,
+        que retoma o download se a conexao cair, e so depois processado.
+        Por padrao False.
+
+    expected_sha256 : str, optional
+        Hash sha256 esperado do arquivo original. Se informado, o download e
+        feito no modo retomavel, que confere o hash antes de processar o
+        arquivo; se for diferente, nada e gravado.
     
     Returns
     -------
-    None
-        Esta funcao baixa o CSV para o seu diretorio local.
+    bool
+        True se o CSV foi baixado e salvo no diretorio local, False caso
+        contrario.
     '''
+    if resumable or expected_sha256 is not None:
+        return _download_csv_resumable(url, dropna, local_file, columns, chunksize, expected_sha256)
+    if chunksize is not None:
+        return _download_csv_stream(url, dropna, local_file, columns, chunksize)
     try:
         # Chama a função que faz uma solicitação HTTP na URL e retorna o CSV em formato de texto
         textcsv = make_http_request(url)
@@ -52,31 +94,486 @@ def download_csv_local(url: str,dropna:bool = False, local_file:str = None ,colu
                     # Salva o DataFrame no diretório local como dados.csv
                     df.to_csv("dados.csv", index=False)
                     print("CSV baixado e salvo localmente com sucesso e com o nome default.")
+                return True
             else:
                 print("Falha ao processar os dados CSV, apos ter feito o acesso a url.")
         else:
             print("Falha ao obter o CSV da URL.")
     except Exception as e:
         print("Ocorreu um erro durante o processo:", str(e))
-        
-def download_alldata(desired_columns: List[str]):
+    return False
+
+
+def _download_csv_stream(url: str, dropna: bool, local_file: str, columns: List[str], chunksize: int) -> bool:
+    '''
+    Modo streaming de download_csv_local: o corpo da resposta passa direto
+    pelo parser em blocos, sem ser guardado inteiro como bytes ou texto.
+    '''
+    if local_file is None:
+        local_file = "dados.csv"
+    try:
+        response = make_http_stream(url)
+        if response is None:
+            print("Falha ao obter o CSV da URL.")
+            return False
+        with response:
+            linhas = process_data_chunks(response.raw, local_file, dropna, columns,
+                                         chunksize=chunksize, encoding=response.encoding)
+        if linhas is None:
+            print("Falha ao processar os dados CSV, apos ter feito o acesso a url.")
+            return False
+        print(f"CSV baixado em streaming e salvo localmente com sucesso ({linhas} linhas).")
+        return True
+    except Exception as e:
+        print("Ocorreu um erro durante o processo:", str(e))
+        return False
+
+
+def _load_checkpoint(checkpoint_file: str, url: str) -> dict:
+    '''
+    Le o checkpoint de um download parcial. Retorna None se ele nao existir,
+    estiver corrompido ou for de outra URL.
+    '''
+    try:
+        with open(checkpoint_file, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if checkpoint.get('url') != url:
+        return None
+    return checkpoint
+
+
+def _save_checkpoint(checkpoint_file: str, checkpoint: dict):
+    '''
+    Grava o checkpoint de forma atomica, para que uma queda no meio da
+    escrita nao corrompa o arquivo.
+    '''
+    temp_file = checkpoint_file + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_file, checkpoint_file)
+
+
+def download_file_resumable(url: str, local_file: str, expected_sha256: str = None,
+                            block_size: int = 1 << 20, tentativas: int = 3):
+    '''
+    Baixa um arquivo byte a byte, sem processa-lo, de forma que o download
+    possa ser retomado se a conexao cair.
+
+    Os bytes recebidos vao para 'local_file.part' e o progresso e registrado
+    no checkpoint 'local_file.part.json'. Em uma nova execucao (ou em uma
+    nova tentativa, caso a conexao caia) o download continua de onde parou
+    com uma requisicao HTTP Range, condicionada por If-Range ao ETag (ou,
+    sem ele, ao Last-Modified) da primeira resposta: se o arquivo mudou no
+    servidor, ele e baixado inteiro de novo em vez de ser emendado ao
+    trecho antigo. Sem nenhum dos dois o download recomeca do zero, pois
+    nao ha como saber se o trecho salvo ainda vale. O hash sha256 e
+    calculado enquanto os bytes chegam, entao o arquivo final e verificado
+    sem ser lido de novo; apenas ao retomar um download o trecho ja salvo e
+    relido uma vez para reconstruir o hash.
+
+    Parameters
+    ----------
+    url : str
+        A URL do arquivo que sera baixado.
+
+    local_file : str
+        Caminho onde o arquivo completo sera salvo.
+
+    expected_sha256 : str, optional
+        Hash sha256 esperado. Se informado e o hash final for diferente, o
+        download e descartado.
+
+    block_size : int, optional
+        Tamanho em bytes dos blocos lidos da rede. Por padrao 1 MiB.
+
+    tentativas : int, optional
+        Quantas vezes o download e retomado na mesma chamada antes de
+        desistir. O arquivo parcial continua salvo para a proxima chamada.
+
+    Returns
+    -------
+    dict or None
+        Dicionario com 'sha256', 'size', 'etag', 'last_modified' e
+        'encoding' do arquivo baixado. None, se o download falhar.
+    '''
+    part_file = local_file + '.part'
+    checkpoint_file = part_file + '.json'
+
+    for tentativa in range(1, tentativas + 1):
+        checkpoint = _load_checkpoint(checkpoint_file, url)
+        offset = 0
+        hasher = hashlib.sha256()
+        validador = checkpoint and (checkpoint.get('etag') or checkpoint.get('last_modified'))
+        if checkpoint is not None and validador and os.path.exists(part_file):
+            # O checkpoint so e gravado depois que o bloco foi escrito, entao
+            # qualquer byte alem dele e descartado.
+            offset = min(checkpoint['bytes'], os.path.getsize(part_file))
+            with open(part_file, 'r+b') as f:
+                f.truncate(offset)
+                for bloco in iter(lambda: f.read(block_size), b''):
+                    hasher.update(bloco)
+        else:
+            checkpoint = {'url': url, 'bytes': 0}
+
+        # Sem compressao, os offsets do Range correspondem aos bytes do arquivo.
+        headers = {'Accept-Encoding': 'identity'}
+        if offset > 0:
+            headers['Range'] = f'bytes={offset}-'
+            # Se o arquivo mudou no servidor, If-Range faz ele responder 200 com o arquivo todo.
+            headers['If-Range'] = validador
+        try:
+            with httpclient.get(url, headers=headers, stream=True) as response:
+                if response.status_code == 416:
+                    # O trecho pedido nao existe mais: recomeca do zero.
+                    os.remove(part_file)
+                    os.remove(checkpoint_file)
+                    continue
+                if response.status_code not in (200, 206):
+                    print("Falha ao recuperar dados. Codigo de status:", response.status_code)
+                    return None
+                if response.status_code == 200 and offset > 0:
+                    # O servidor ignorou o Range, entao o arquivo e baixado de novo.
+                    offset = 0
+                    hasher = hashlib.sha256()
+
+                if response.status_code == 206:
+                    total = int(response.headers['Content-Range'].rsplit('/', 1)[1])
+                else:
+                    total = int(response.headers.get('Content-Length', -1))
+                checkpoint.update({
+                    'etag': response.headers.get('ETag', checkpoint.get('etag')),
+                    'last_modified': response.headers.get('Last-Modified', checkpoint.get('last_modified')),
+                    'encoding': response.encoding,
+                    'total': total,
+                    'bytes': offset,
+                })
+                _save_checkpoint(checkpoint_file, checkpoint)
+
+                with open(part_file, 'ab' if offset > 0 else 'wb') as f:
+                    for bloco in response.iter_content(chunk_size=block_size):
+                        f.write(bloco)
+                        f.flush()
+                        hasher.update(bloco)
+                        checkpoint['bytes'] += len(bloco)
+                        _save_checkpoint(checkpoint_file, checkpoint)
+        except requests.exceptions.RequestException as erro:
+            print(f"Conexao interrompida (tentativa {tentativa} de {tentativas}):", str(erro))
+            continue
+
+        if total >= 0 and checkpoint['bytes'] != total:
+            print(f"Download incompleto: {checkpoint['bytes']} de {total} bytes.")
+            continue
+
+        digest = hasher.hexdigest()
+        if expected_sha256 is not None and digest != expected_sha256.lower():
+            print("O hash do arquivo baixado nao confere, o download foi descartado.")
+            os.remove(part_file)
+            os.remove(checkpoint_file)
+            return None
+
+        os.replace(part_file, local_file)
+        os.remove(checkpoint_file)
+        return {
+            'sha256': digest,
+            'size': checkpoint['bytes'],
+            'etag': checkpoint.get('etag'),
+            'last_modified': checkpoint.get('last_modified'),
+            'encoding': checkpoint.get('encoding'),
+        }
+    return None
+
+
+def _download_csv_resumable(url: str, dropna: bool, local_file: str, columns: List[str], chunksize: int,
+                            expected_sha256: str = None) -> bool:
+    '''
+    Modo retomavel de download_csv_local: o arquivo original e baixado com
+    download_file_resumable e depois lido do disco em blocos, mantendo so as
+    colunas pedidas.
+    '''
+    if local_file is None:
+        local_file = "dados.csv"
+    raw_file = local_file + '.raw'
+    try:
+        info = download_file_resumable(url, raw_file, expected_sha256)
+        if info is None:
+            print("Falha ao obter o CSV da URL.")
+            return False
+        with open(raw_file, 'rb') as f:
+            linhas = process_data_chunks(f, local_file, dropna, columns,
+                                         chunksize=chunksize or 100000, encoding=info['encoding'])
+        os.remove(raw_file)
+        if linhas is None:
+            print("Falha ao processar os dados CSV, apos ter feito o acesso a url.")
+            return False
+        print(f"CSV baixado e salvo localmente com sucesso ({linhas} linhas, sha256 {info['sha256']}).")
+        return True
+    except Exception as e:
+        print("Ocorreu um erro durante o processo:", str(e))
+        return False
+
+
+class _HashingReader:
+    '''
+    Envolve um stream de bytes e calcula o sha256 e o tamanho do que for
+    lido, para que o hash saia junto com o parse, sem uma segunda leitura.
+    '''
+    def __init__(self, raw):
+        self.raw = raw
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def read(self, n: int = -1) -> bytes:
+        bloco = self.raw.read(n)
+        self.hasher.update(bloco)
+        self.size += len(bloco)
+        return bloco
+
+    def drain(self, block_size: int = 1 << 20):
+        # Consome o que o parser nao leu, para o hash cobrir o arquivo todo.
+        while self.read(block_size):
+            pass
+
+
+def download_csv_conditional(url: str, local_file: str, entry: dict = None, dropna: bool = False,
+                             columns: List[str] = None, chunksize: int = 100000, expected_sha256: str = None):
+    '''
+    Baixa um csv apenas se ele mudou desde o ultimo download registrado no
+    manifesto. A requisicao leva If-None-Match/If-Modified-Since; se o
+    servidor responder 304 nada e baixado. A entrada tambem guarda as
+    colunas gravadas no csv local: se columns for diferente, o csv e baixado
+    inteiro de novo, sem condicao, mesmo que nao tenha mudado no servidor.
+    Caso contrario, o corpo e lido em
+    streaming, as colunas pedidas sao gravadas em 'local_file.download' e o
+    sha256 e o tamanho do arquivo original sao calculados durante a leitura.
+    So depois que o tamanho confere com o Content-Length (e o hash com
+    expected_sha256, se informado) o arquivo substitui local_file; uma
+    resposta truncada nao apaga o csv anterior.
+
+    Parameters
+    ----------
+    url : str
+        A URL que aponta para o conjunto de dados a ser lido.
+
+    local_file : str
+        Nome do arquivo onde sera salvo o csv.
+
+    entry : dict, optional
+        Entrada do manifesto para esse arquivo. Se None, o download e feito
+        sem condicao.
+
+    dropna : bool
+        Argumento para tirar ou nao linhas com valores nulos.
+
+    columns : list, optional
+        Lista com os nomes das colunas desejadas.
+
+    chunksize : int, optional
+        Numero de linhas por bloco lido. Por padrao 100000.
+
+    expected_sha256 : str, optional
+        Hash sha256 esperado do arquivo original. Se informado e diferente,
+        o download e descartado.
+
+    Returns
+    -------
+    tuple or None
+        (atualizado, entrada), em que atualizado e False se o servidor
+        respondeu 304 e entrada e a nova entrada do manifesto ('etag',
+        'last_modified', 'size', 'sha256', 'columns'). None, se o download
+        falhar.
+    '''
+    colunas = None if columns is None else list(columns)
+    mesmas_colunas = entry is not None and entry.get('columns') == colunas
+    headers = conditional_headers(entry) if mesmas_colunas and os.path.exists(local_file) else {}
+    headers['Accept-Encoding'] = 'identity'
+    staging_file = local_file + '.download'
+    try:
+        with httpclient.get(url, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                return False, entry
+            if response.status_code != 200:
+                print("Falha ao recuperar dados. Codigo de status:", response.status_code)
+                return None
+            leitor = _HashingReader(response.raw)
+            linhas = process_data_chunks(leitor, staging_file, dropna, columns,
+                                         chunksize=chunksize, encoding=response.encoding)
+            if linhas is None:
+                return None
+            leitor.drain()
+            total = int(response.headers.get('Content-Length', leitor.size))
+            if leitor.size != total:
+                print(f"Download incompleto: {leitor.size} de {total} bytes.")
+                return None
+            digest = leitor.hasher.hexdigest()
+            if expected_sha256 is not None and digest != expected_sha256.lower():
+                print("O hash do arquivo baixado nao confere, o download foi descartado.")
+                return None
+            os.replace(staging_file, local_file)
+            return True, {
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'size': leitor.size,
+                'sha256': digest,
+                'columns': colunas,
+            }
+    except Exception as e:
+        print("Ocorreu um erro durante o processo:", str(e))
+        return None
+    finally:
+        # So sobra algo aqui se o download foi descartado.
+        if os.path.exists(staging_file):
+            os.remove(staging_file)
+
+
+def _download_year(ano: int, desired_columns: List[str], **opcoes) -> bool:
+    '''
+    Baixa o csv de um unico ano do SERMIL para 'sermil{ano}.csv'.
+    E a unidade de trabalho usada pelas threads de download_alldata.
+    '''
+    url_repositorio = SERMIL_URL.format(ano=ano)
+    return download_csv_local(url_repositorio, local_file=f'sermil{ano}.csv', dropna=True, columns=desired_columns,
+                              **opcoes)
+
+
+def download_alldata(desired_columns: List[str], workers: int = 1, chunksize: int = None,
+                     resumable: bool = False) -> Dict[int, str]:
     '''
     Apenas baixa todos os csvs dos anos dispniveis no ambiente local.
     Note que essa funcao so funciona pro caso especifico do tema do trabalho.
 
+    Com workers maior que 1 os anos sao baixados ao mesmo tempo por um
+    conjunto limitado de threads. Como o download e limitado pela latencia
+    da rede e nao pela CPU, sobrepor as transferencias reduz bastante o tempo
+    total. O progresso e informado ano a ano e as falhas sao devolvidas ao
+    final, em vez de apenas impressas.
+
     Parameters
     ----------
     desired_columns : List[str]
         Lista com as colunas que o usuario deseja baixar.
 
+    workers : int, optional
+        Numero maximo de anos baixados simultaneamente. Por padrao 1, ou
+        seja, os anos sao baixados um apos o outro.
+
+    chunksize : int, optional
+        Se informado, cada ano e baixado em streaming, em blocos de
+        chunksize linhas (ver download_csv_local).
+
+    resumable : bool, optional
+        Se True, cada ano e baixado de forma retomavel (ver
+        download_csv_local).
+
     Returns
     -------
-    None.
+    Dict[int, str]
+        Dicionario com os anos que falharam e o motivo da falha. Vazio se
+        todos os anos foram baixados (ou ja existiam localmente).
 
     '''
+    anos_pendentes = []
     for i in range(2007, 2023):
         if not os.path.exists(f'sermil{i}.csv'):
-            url_repositorio = f'https://dadosabertos.eb.mil.br/arquivos/sermil/sermil{i}.csv'
-            download_csv_local(url_repositorio, local_file=f'sermil{i}.csv', dropna=True, columns=desired_columns)
+            anos_pendentes.append(i)
         else:
-            print(f'O arquivo sermil{i}.csv ja existe no seu local de trabalho.')
\ No newline at end of file
+            print(f'O arquivo sermil{i}.csv ja existe no seu local de trabalho.')
+
+    falhas = {}
+    total = len(anos_pendentes)
+    if total == 0:
+        return falhas
+
+    # Nunca cria mais threads do que anos a serem baixados.
+    workers = max(1, min(int(workers), total))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futuros = {executor.submit(_download_year, ano, desired_columns,
+                                   chunksize=chunksize, resumable=resumable): ano for ano in anos_pendentes}
+        for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+            ano = futuros[futuro]
+            try:
+                sucesso = futuro.result()
+            except Exception as e:
+                sucesso = False
+                falhas[ano] = str(e)
+            else:
+                if not sucesso:
+                    falhas[ano] = 'Falha ao baixar ou processar o CSV.'
+            status = 'concluido' if sucesso else 'falhou'
+            print(f'[{concluidos}/{total}] sermil{ano}.csv: {status}')
+    return falhas
+
+
+def refresh_alldata(desired_columns: List[str], manifest_file: str = 'sermil_manifest.json',
+                    workers: int = 1, chunksize: int = 100000, folder: str = '.') -> Tuple[List[int], Dict[int, str]]:
+    '''
+    Atualiza os csvs de todos os anos usando o manifesto de downloads.
+    Diferente de download_alldata, que so olha se o arquivo existe, esta
+    funcao pergunta ao servidor, com requisicoes condicionais, se cada ano
+    mudou. Anos inalterados custam uma unica ida e volta; so os anos que
+    mudaram sao baixados de novo. O manifesto guarda ETag, Last-Modified,
+    tamanho, sha256 e as colunas de cada ano e e salvo a cada ano concluido;
+    se desired_columns mudar, todos os anos sao baixados de novo.
+
+    Parameters
+    ----------
+    desired_columns : List[str]
+        Lista com as colunas que o usuario deseja baixar.
+
+    manifest_file : str, optional
+        Caminho do manifesto, relativo a folder. Por padrao
+        'sermil_manifest.json'.
+
+    workers : int, optional
+        Numero maximo de anos verificados simultaneamente.
+
+    chunksize : int, optional
+        Numero de linhas por bloco lido (ver download_csv_conditional).
+
+    folder : str, optional
+        Pasta onde os 'sermil{ano}.csv' sao gravados. Por padrao a pasta
+        atual.
+
+    Returns
+    -------
+    Tuple[List[int], Dict[int, str]]
+        Lista ordenada dos anos que foram baixados de novo, para serem
+        repassados as etapas seguintes, e dicionario com os anos que
+        falharam e o motivo.
+    '''
+    manifest_file = os.path.join(folder, manifest_file)
+    manifest = load_manifest(manifest_file)
+    anos = list(range(2007, 2023))
+    atualizados = []
+    falhas = {}
+
+    def verifica_ano(ano):
+        url_repositorio = SERMIL_URL.format(ano=ano)
+        return download_csv_conditional(url_repositorio, os.path.join(folder, f'sermil{ano}.csv'),
+                                        manifest.get(str(ano)), dropna=True, columns=desired_columns,
+                                        chunksize=chunksize)
+
+    workers = max(1, min(int(workers), len(anos)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futuros = {executor.submit(verifica_ano, ano): ano for ano in anos}
+        for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+            ano = futuros[futuro]
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                resultado = None
+                falhas[ano] = str(e)
+            if resultado is None:
+                falhas.setdefault(ano, 'Falha ao baixar ou processar o CSV.')
+                status = 'falhou'
+            elif resultado[0]:
+                atualizados.append(ano)
+                manifest[str(ano)] = resultado[1]
+                save_manifest(manifest, manifest_file)
+                status = 'atualizado'
+            else:
+                status = 'inalterado'
+            print(f'[{concluidos}/{len(anos)}] sermil{ano}.csv: {status}')
+    return sorted(atualizados), falhas
@@ -0,0 +1,235 @@
+'''
+Histogramas de contagem para as medidas antropometricas.
+
+ALTURA, PESO, CINTURA, CABECA e CALCADO sao inteiros de faixa pequena (o
+esquema os guarda como UInt8/UInt16). Em vez de ordenar milhoes de valores
+para obter mediana e percentis, cada valor e contado com numpy.bincount e os
+quantis saem exatos do vetor de contagens acumuladas, em tempo linear.
+Histogramas de anos diferentes se juntam somando as contagens.
+
+O vetor tem uma posicao por inteiro entre o menor e o maior valor, entao um
+unico valor absurdo (ALTURA=99999, que a validacao apenas relata) o faria
+crescer sem limite. Por isso a faixa e limitada a MAX_WIDTH valores; dados
+mais espalhados que isso ficam com o sketch KLL (ver streamstats).
+'''
+
+import math
+import numpy as np
+import pandas as pd
+
+# Colunas inteiras de faixa pequena cujos quantis saem de histogramas.
+HISTOGRAM_COLUMNS = ['ALTURA', 'PESO', 'CINTURA', 'CABECA', 'CALCADO']
+
+# Maior faixa (maior - menor + 1) de um histograma. As medidas validas cabem com folga.
+MAX_WIDTH = 4096
+
+
+def is_integral(valores) -> bool:
+    '''
+    Indica se todos os valores (sem nulos) sao inteiros e cabem em um histograma.
+
+    Example
+    -------
+    >>> is_integral([170, 180.0]), is_integral([170.5])
+    (True, False)
+    '''
+    valores = np.asarray(valores, dtype='float64')
+    return bool(np.array_equal(valores.astype('int64'), valores))
+
+
+def fits_histogram(valores, histograma: 'IntegerHistogram' = None) -> bool:
+    '''
+    Indica se os valores (sem nulos) sao inteiros e se, junto com a faixa de
+    histograma, cabem em MAX_WIDTH posicoes.
+
+    Example
+    -------
+    >>> fits_histogram([170, 180.0]), fits_histogram([170.5]), fits_histogram([170, 99999])
+    (True, False, False)
+    '''
+    valores = np.asarray(valores, dtype='float64')
+    if not is_integral(valores):
+        return False
+    limites = list(histograma.limites()) if histograma is not None else []
+    if len(valores):
+        limites += [valores.min(), valores.max()]
+    return not limites or max(limites) - min(limites) < MAX_WIDTH
+
+
+class IntegerHistogram:
+    '''
+    Contagem de cada valor inteiro entre o menor e o maior valor vistos.
+
+    Example
+    -------
+    >>> h = IntegerHistogram().update([170, 180, 175]).merge(IntegerHistogram().update([160]))
+    >>> h.n, h.quantile([0.25, 0.5, 0.75]).tolist()
+    (4, [167.5, 172.5, 176.25])
+    '''
+    def __init__(self):
+        self.inicio = 0
+        self.contagens = np.zeros(0, dtype='int64')
+
+    @property
+    def n(self) -> int:
+        return int(self.contagens.sum())
+
+    @property
+    def exact(self) -> bool:
+        '''
+        Sempre True: os quantis de um histograma sao exatos.
+        '''
+        return True
+
+    def limites(self) -> tuple:
+        '''
+        Menor e maior valor da faixa do histograma; vazio se nada foi contado.
+        '''
+        if len(self.contagens) == 0:
+            return ()
+        return self.inicio, self.inicio + len(self.contagens) - 1
+
+    def _add(self, inicio: int, contagens: np.ndarray) -> 'IntegerHistogram':
+        if len(contagens) == 0:
+            return self
+        if len(self.contagens) and (max(self.inicio + len(self.contagens), inicio + len(contagens))
+                                    - min(self.inicio, inicio) > MAX_WIDTH):
+            raise ValueError(f"A faixa do histograma passaria de MAX_WIDTH ({MAX_WIDTH}) valores.")
+        if len(self.contagens) == 0:
+            self.inicio, self.contagens = int(inicio), np.asarray(contagens, dtype='int64').copy()
+            return self
+        novo_inicio = min(self.inicio, inicio)
+        fim = max(self.inicio + len(self.contagens), inicio + len(contagens))
+        total = np.zeros(fim - novo_inicio, dtype='int64')
+        total[self.inicio - novo_inicio:self.inicio - novo_inicio + len(self.contagens)] += self.contagens
+        total[inicio - novo_inicio:inicio - novo_inicio + len(contagens)] += contagens
+        self.inicio, self.contagens = int(novo_inicio), total
+        return self
+
+    def update(self, valores) -> 'IntegerHistogram':
+        '''
+        Conta um bloco de valores inteiros (sem nulos).
+
+        Raises
+        ------
+        ValueError
+            Se algum valor nao for inteiro, ou se a faixa passar de MAX_WIDTH
+            (ver fits_histogram).
+        '''
+        valores = np.asarray(valores, dtype='float64')
+        if not is_integral(valores):
+            raise ValueError("IntegerHistogram so aceita valores inteiros.")
+        if not fits_histogram(valores, self):
+            raise ValueError(f"A faixa do histograma passaria de MAX_WIDTH ({MAX_WIDTH}) valores.")
+        inteiros = valores.astype('int64')
+        if len(inteiros) == 0:
+            return self
+        menor = int(inteiros.min())
+        return self._add(menor, np.bincount(inteiros - menor))
+
+    def merge(self, outro: 'IntegerHistogram') -> 'IntegerHistogram':
+        '''
+        Soma as contagens de outro histograma a este.
+
+        Raises
+        ------
+        TypeError
+            Se outro nao for um IntegerHistogram (para juntar com um sketch
+            KLL, converta antes com KLLSketch.from_histogram).
+        '''
+        if not isinstance(outro, IntegerHistogram):
+            raise TypeError(f"IntegerHistogram so se junta com outro IntegerHistogram, nao com {type(outro).__name__}.")
+        return self._add(outro.inicio, outro.contagens)
+
+    def rank_error(self) -> float:
+        '''
+        Erro de posto dos quantis: zero.
+        '''
+        return 0.0
+
+    def quantile(self, q) -> np.ndarray:
+        '''
+        Quantis exatos, com a interpolacao linear do pandas.
+        '''
+        q = np.atleast_1d(np.asarray(q, dtype='float64'))
+        n = self.n
+        if n == 0:
+            return np.full(len(q), math.nan)
+        acumulado = np.cumsum(self.contagens)
+        posicao = q * (n - 1)
+        baixo, alto = np.floor(posicao), np.ceil(posicao)
+        # O valor de posto r e o primeiro cuja contagem acumulada passa de r.
+        v_baixo = self.inicio + np.searchsorted(acumulado, baixo, side='right')
+        v_alto = self.inicio + np.searchsorted(acumulado, alto, side='right')
+        return v_baixo + (v_alto - v_baixo) * (posicao - baixo)
+
+    def to_frame(self) -> pd.DataFrame:
+        '''
+        Valores com contagem positiva, em colunas VALOR e N.
+
+        Example
+        -------
+        >>> IntegerHistogram().update([57, 57, 59]).to_frame().to_dict('list')
+        {'VALOR': [57, 59], 'N': [2, 1]}
+        '''
+        presentes = np.flatnonzero(self.contagens)
+        return pd.DataFrame({'VALOR': self.inicio + presentes, 'N': self.contagens[presentes]})
+
+    @classmethod
+    def from_counts(cls, valores, contagens) -> 'IntegerHistogram':
+        '''
+        Monta um histograma a partir de pares valor/contagem (ver to_frame).
+        '''
+        valores = np.asarray(valores, dtype='int64')
+        if len(valores) == 0:
+            return cls()
+        menor = int(valores.min())
+        vetor = np.zeros(int(valores.max()) - menor + 1, dtype='int64')
+        np.add.at(vetor, valores - menor, np.asarray(contagens, dtype='int64'))
+        return cls()._add(menor, vetor)
+
+
+def grouped_histograms(grupos: pd.Series, valores: pd.Series) -> pd.DataFrame:
+    '''
+    Histogramas de uma coluna inteira para cada grupo, em uma unica
+    passagem: o codigo do grupo e o valor formam um indice so, contado com
+    numpy.bincount. Linhas com grupo ou valor nulo sao ignoradas.
+
+    Raises
+    ------
+    ValueError
+        Se algum valor nao for inteiro ou se a faixa passar de MAX_WIDTH.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Colunas GRUPO, VALOR e N, so com contagens positivas.
+
+    Example
+    -------
+    >>> grupos = pd.Series([2007, 2007, 2008, None])
+    >>> grouped_histograms(grupos, pd.Series([170, 170, 180, 175])).to_dict('list')
+    {'GRUPO': [2007.0, 2008.0], 'VALOR': [170, 180], 'N': [2, 1]}
+    '''
+    codigos, rotulos = pd.factorize(grupos)
+    numeros = pd.to_numeric(valores).to_numpy(dtype='float64', na_value=np.nan)
+    validos = (codigos >= 0) & ~np.isnan(numeros)
+    if not validos.any():
+        return pd.DataFrame({'GRUPO': [], 'VALOR': np.zeros(0, dtype='int64'), 'N': np.zeros(0, dtype='int64')})
+    if not is_integral(numeros[validos]):
+        raise ValueError("grouped_histograms so aceita valores inteiros.")
+    if not fits_histogram(numeros[validos]):
+        raise ValueError(f"A faixa do histograma passaria de MAX_WIDTH ({MAX_WIDTH}) valores.")
+    inteiros = numeros[validos].astype('int64')
+    menor = int(inteiros.min())
+    largura = int(inteiros.max()) - menor + 1
+    contagens = np.bincount(codigos[validos] * largura + (inteiros - menor), minlength=len(rotulos) * largura)
+    presentes = np.flatnonzero(contagens)
+    return pd.DataFrame({'GRUPO': np.asarray(rotulos)[presentes // largura],
+                         'VALOR': menor + presentes % largura,
+                         'N': contagens[presentes]})
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,83 @@
+'''
+Histogramas por ano das medidas inteiras, guardados no armazenamento de
+agregados (modulo yearstore).
+
+Para as colunas de histogram.HISTOGRAM_COLUMNS cada ano do conjunto de
+dados guarda 'sermil_aggstore/{ano}_hist.csv', com a contagem de cada valor
+por VINCULACAO_ANO. Os histogramas se somam entre anos e dao medianas e
+percentis exatos de todo o historico (ver aggstore.yearly_stats).
+'''
+
+import pandas as pd
+from typing import Dict, List
+try:
+    from .yearstore import GROUP_COLUMN, read_year_tables
+    from .histogram import HISTOGRAM_COLUMNS, IntegerHistogram, grouped_histograms, fits_histogram
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    from yearstore import GROUP_COLUMN, read_year_tables
+    from histogram import HISTOGRAM_COLUMNS, IntegerHistogram, grouped_histograms, fits_histogram
+
+# Tabela gravada para cada ano.
+HIST_TABLE = '{ano}_hist.csv'
+
+HIST_COLUMNS = [GROUP_COLUMN, 'COLUNA', 'VALOR', 'N']
+
+
+def partial_histograms(df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Histogramas das colunas de HISTOGRAM_COLUMNS presentes em df, por
+    VINCULACAO_ANO. Colunas com algum valor nao inteiro, ou com valores
+    espalhados demais (ver histogram.fits_histogram), ficam de fora: seus
+    quantis sao calculados a partir dos dados brutos.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Colunas VINCULACAO_ANO, COLUNA, VALOR e N, so com contagens positivas.
+
+    Example
+    -------
+    >>> df = pd.DataFrame({'VINCULACAO_ANO': [2007, 2007, 2008], 'CABECA': [57, 57, 58]})
+    >>> partial_histograms(df).to_dict('list')
+    {'VINCULACAO_ANO': [2007, 2008], 'COLUNA': ['CABECA', 'CABECA'], 'VALOR': [57, 58], 'N': [2, 1]}
+    '''
+    partes = []
+    colunas = [col for col in HISTOGRAM_COLUMNS if col in df.columns] if GROUP_COLUMN in df.columns else []
+    for coluna in colunas:
+        valores = pd.to_numeric(df[coluna]).dropna()
+        if not fits_histogram(valores):
+            continue
+        contagem = grouped_histograms(df[GROUP_COLUMN], df[coluna]).rename(columns={'GRUPO': GROUP_COLUMN})
+        partes.append(contagem.assign(COLUNA=coluna))
+    if not partes:
+        return pd.DataFrame(columns=HIST_COLUMNS)
+    return pd.concat(partes, ignore_index=True)[HIST_COLUMNS]
+
+
+def load_histograms(store_dir: str, coluna: str, anos: List[int] = None) -> Dict[int, IntegerHistogram]:
+    '''
+    Histogramas de uma coluna de HISTOGRAM_COLUMNS por VINCULACAO_ANO,
+    somados entre os anos do conjunto (ANO_COLETA) guardados.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    coluna : str
+        Coluna de HISTOGRAM_COLUMNS.
+
+    anos : List[int], optional
+        Anos do conjunto (ANO_COLETA) considerados. Se None, todos.
+    '''
+    contagem = read_year_tables(store_dir, HIST_TABLE, HIST_COLUMNS, anos)
+    contagem = contagem[contagem['COLUNA'] == coluna]
+    # Valores repetidos entre anos se somam em from_counts.
+    return {int(grupo): IntegerHistogram.from_counts(parte['VALOR'], parte['N'])
+            for grupo, parte in contagem.groupby(GROUP_COLUMN)}
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,228 @@
+'''
+Camada HTTP compartilhada por todos os modulos que baixam dados.
+
+Todas as requisicoes passam por uma unica requests.Session, de modo que as
+conexoes (e o handshake TLS) sao reaproveitadas entre arquivos. Alem disso,
+toda requisicao tem timeout de conexao e de leitura, e repetida com backoff
+exponencial e jitter em caso de falha temporaria, e o numero de requisicoes
+simultaneas para um mesmo servidor e limitado.
+'''
+
+import time
+import random
+import weakref
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+# Timeout (conexao, leitura) em segundos. A leitura conta o tempo entre dois
+# blocos recebidos, e nao o download inteiro.
+DEFAULT_TIMEOUT = (10, 60)
+
+# Quantas vezes uma requisicao e repetida apos uma falha temporaria.
+MAX_RETRIES = 3
+
+# Espera base e maxima, em segundos, do backoff exponencial.
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+
+# Numero maximo de requisicoes abertas ao mesmo tempo para um mesmo servidor.
+MAX_CONNECTIONS_PER_HOST = 4
+
+# Codigos de status que indicam falha temporaria do servidor.
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    '''
+    Devolve a sessao HTTP compartilhada, criando a na primeira chamada.
+
+    Returns
+    -------
+    requests.Session
+        Sessao com pool de conexoes keep-alive.
+
+    Example
+    -------
+    >>> get_session() is get_session()
+    True
+    '''
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=MAX_CONNECTIONS_PER_HOST)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+
+def _host_slot(host: str) -> threading.BoundedSemaphore:
+    '''
+    Semaforo que limita as requisicoes simultaneas para um servidor.
+    '''
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(MAX_CONNECTIONS_PER_HOST)
+        return _host_slots[host]
+
+
+def backoff_delay(tentativa: int) -> float:
+    '''
+    Calcula a espera antes de uma nova tentativa, com backoff exponencial e
+    jitter completo: um valor aleatorio entre zero e BACKOFF_BASE * 2**tentativa,
+    limitado por BACKOFF_MAX. O jitter evita que varias threads repitam a
+    requisicao exatamente ao mesmo tempo.
+
+    Parameters
+    ----------
+    tentativa : int
+        Numero da tentativa que falhou, comecando em 0.
+
+    Returns
+    -------
+    float
+        Tempo de espera em segundos.
+
+    Example
+    -------
+    >>> 0 <= backoff_delay(0) <= BACKOFF_BASE
+    True
+    >>> backoff_delay(50) <= BACKOFF_MAX
+    True
+    '''
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** tentativa))
+
+
+def _release_on_close(response: requests.Response, slot: threading.BoundedSemaphore):
+    '''
+    Libera a vaga do servidor uma unica vez, no que acontecer primeiro: a
+    resposta e fechada, o corpo termina de ser lido (o urllib3 devolve a
+    conexao ao pool) ou a resposta, descartada sem nada disso, e coletada.
+    '''
+    # finalize roda uma unica vez, chamado diretamente ou na coleta da resposta.
+    liberar = weakref.finalize(response, slot.release)
+    # Uma referencia fraca evita um ciclo que atrasaria a coleta da resposta.
+    referencia = weakref.ref(response)
+
+    def close():
+        try:
+            alvo = referencia()
+            if alvo is not None:
+                type(alvo).close(alvo)
+        finally:
+            liberar()
+
+    response.close = close
+    raw = response.raw
+    if raw is not None and hasattr(raw, 'release_conn'):
+        release_original = raw.release_conn
+
+        def release_conn():
+            try:
+                release_original()
+            finally:
+                liberar()
+
+        raw.release_conn = release_conn
+
+
+def get(url: str, headers: dict = None, stream: bool = False, timeout=None,
+        retries: int = None) -> requests.Response:
+    '''
+    Faz um GET pela sessao compartilhada, com timeout, novas tentativas e
+    limite de conexoes por servidor. Pode substituir requests.get.
+
+    Com stream=False o corpo e lido antes de retornar e a vaga do servidor
+    ja e liberada. Com stream=True a vaga e liberada quando a resposta for
+    fechada ou o corpo terminar de ser lido; de preferencia use a como
+    gerenciador de contexto (with ... as response). Uma resposta descartada
+    sem ser lida nem fechada libera a vaga quando e coletada.
+
+    Parameters
+    ----------
+    url : str
+        A URL da requisicao.
+
+    headers : dict, optional
+        Cabecalhos extras da requisicao.
+
+    stream : bool, optional
+        Se True, o corpo nao e lido antes de retornar.
+
+    timeout : float or tuple, optional
+        Timeout (conexao, leitura). Por padrao DEFAULT_TIMEOUT.
+
+    retries : int, optional
+        Numero de novas tentativas. Por padrao MAX_RETRIES.
+
+    Returns
+    -------
+    requests.Response
+        A resposta da ultima tentativa. Respostas com status de falha
+        temporaria sao devolvidas se as tentativas se esgotarem.
+
+    Raises
+    ------
+    requests.exceptions.RequestException
+        Se a ultima tentativa falhar por erro de conexao ou timeout, ou se a
+        URL for invalida.
+
+    Example
+    -------
+    >>> try:
+    ...     get('ESSA_URL_N_EXISTE')
+    ... except requests.exceptions.RequestException:
+    ...     print('URL invalida')
+    URL invalida
+    '''
+    if timeout is None:
+        timeout = DEFAULT_TIMEOUT
+    if retries is None:
+        retries = MAX_RETRIES
+    session = get_session()
+    slot = _host_slot(urlsplit(url).netloc)
+
+    for tentativa in range(retries + 1):
+        ultima = tentativa == retries
+        slot.acquire()
+        try:
+            response = session.get(url, headers=headers, stream=stream, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError):
+            slot.release()
+            if ultima:
+                raise
+            time.sleep(backoff_delay(tentativa))
+            continue
+        except Exception:
+            slot.release()
+            raise
+
+        if response.status_code in RETRY_STATUS and not ultima:
+            espera = backoff_delay(tentativa)
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                espera = min(BACKOFF_MAX, int(retry_after))
+            response.close()
+            slot.release()
+            time.sleep(espera)
+            continue
+
+        if not stream:
+            slot.release()
+            return response
+        _release_on_close(response, slot)
+        return response
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(verbose=True)
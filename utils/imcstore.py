@@ -0,0 +1,127 @@
+'''
+Cubo de contagens de IMC por ano, guardado no armazenamento de agregados
+(modulo yearstore).
+
+Cada ano do conjunto de dados guarda 'sermil_aggstore/{ano}_imc.csv', o
+numero de linhas por UF_RESIDENCIA, DISPENSA e categoria de IMC usado por
+utils_gabriel.bar_plot_imc. Filtrar anos ou UFs e somar linhas dessa
+tabela, sem reler os dados.
+'''
+
+import numpy as np
+import pandas as pd
+from typing import List
+try:
+    from .yearstore import read_year_tables
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    from yearstore import read_year_tables
+
+# Faixas de IMC (peso/altura**2) e seus nomes, como na tabela de IMC.
+IMC_BINS = [0, 18.5, 24.9, 29.9, 34.9, 39.9, float('inf')]
+IMC_LABELS = ['Abaixo do peso', 'Peso normal', 'Sobrepeso', 'Obesidade grau I', 'Obesidade grau II', 'Obesidade grau III']
+
+# Dimensoes do cubo de IMC, alem do ano e da categoria.
+CUBE_DIMENSIONS = ['UF_RESIDENCIA', 'DISPENSA']
+
+CUBE_COLUMNS = CUBE_DIMENSIONS + ['CATEGORIA_IMC', 'N']
+
+# Tabela gravada para cada ano.
+IMC_TABLE = '{ano}_imc.csv'
+
+
+def imc_cube(df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Contagem de linhas por UF_RESIDENCIA, DISPENSA e categoria de IMC.
+    Linhas sem altura ou peso validos (nulos, zero ou negativos) ficam fora;
+    UF ou DISPENSA nulas (ou ausentes de df) entram como nulas.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Colunas UF_RESIDENCIA, DISPENSA, CATEGORIA_IMC e N.
+
+    Example
+    -------
+    >>> df = pd.DataFrame({'ALTURA': [170, 180, 160, 0], 'PESO': [60, 100, 58, 70],
+    ...                    'DISPENSA': ['Sem dispensa'] * 3 + ['Com dispensa'], 'UF_RESIDENCIA': ['SP'] * 4})
+    >>> imc_cube(df).to_dict('list')
+    {'UF_RESIDENCIA': ['SP', 'SP'], 'DISPENSA': ['Sem dispensa', 'Sem dispensa'], 'CATEGORIA_IMC': ['Peso normal', 'Obesidade grau I'], 'N': [2, 1]}
+    '''
+    if not {'ALTURA', 'PESO'} <= set(df.columns):
+        return pd.DataFrame(columns=CUBE_COLUMNS)
+    altura = pd.to_numeric(df['ALTURA']).to_numpy(dtype='float64', na_value=np.nan) / 100
+    peso = pd.to_numeric(df['PESO']).to_numpy(dtype='float64', na_value=np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        imc = np.where((altura > 0) & (peso > 0), peso / altura ** 2, np.nan)
+    categoria = pd.cut(imc, bins=IMC_BINS, labels=IMC_LABELS)
+    validos = ~pd.isna(categoria)
+    dados = {col: (df[col] if col in df.columns else pd.Series(np.nan, index=df.index, dtype=object))[validos]
+             for col in CUBE_DIMENSIONS}
+    dados['CATEGORIA_IMC'] = pd.Series(categoria[validos], index=df.index[validos])
+    contagem = pd.DataFrame(dados).groupby(CUBE_DIMENSIONS + ['CATEGORIA_IMC'], observed=True, dropna=False).size()
+    contagem = contagem.rename('N').reset_index()
+    contagem['CATEGORIA_IMC'] = contagem['CATEGORIA_IMC'].astype(str)
+    return contagem[contagem['N'] > 0].reset_index(drop=True)[CUBE_COLUMNS]
+
+
+def load_imc_cube(store_dir: str, anos: List[int] = None, ufs: List[str] = None) -> pd.DataFrame:
+    '''
+    Le o cubo de IMC guardado, com a coluna ANO_COLETA, apenas dos anos e
+    UFs pedidos.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    anos : List[int], optional
+        Anos do conjunto (ANO_COLETA). Se None, todos.
+
+    ufs : List[str], optional
+        Valores de UF_RESIDENCIA. Se None, todas as linhas, inclusive as
+        sem UF.
+
+    Raises
+    ------
+    ValueError
+        Se ufs for informado e algum dos anos lidos nao tiver
+        UF_RESIDENCIA (csv baixado sem essa coluna): o filtro deixaria esse
+        ano de fora sem aviso.
+    '''
+    cubo = read_year_tables(store_dir, IMC_TABLE, CUBE_COLUMNS, anos)[['ANO_COLETA'] + CUBE_COLUMNS]
+    if ufs is not None:
+        com_uf = cubo['UF_RESIDENCIA'].notna().groupby(cubo['ANO_COLETA']).any()
+        sem_uf = sorted(int(ano) for ano in com_uf.index[~com_uf])
+        if sem_uf:
+            raise ValueError(f'O cubo de IMC dos anos {sem_uf} nao tem UF_RESIDENCIA; '
+                             'baixe esses anos de novo com essa coluna antes de filtrar por UF.')
+        cubo = cubo[cubo['UF_RESIDENCIA'].isin(list(ufs))].reset_index(drop=True)
+    return cubo
+
+
+def imc_percentages(cubo: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Fracao de cada categoria de IMC dentro de cada valor de DISPENSA.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Indexado por IMC_LABELS, na ordem da tabela de IMC, com uma coluna
+        por valor de DISPENSA. Cada coluna soma 1.
+
+    Example
+    -------
+    >>> cubo = pd.DataFrame({'DISPENSA': ['Sem dispensa', 'Sem dispensa', 'Com dispensa'],
+    ...                      'CATEGORIA_IMC': ['Peso normal', 'Sobrepeso', 'Peso normal'], 'N': [3, 1, 2]})
+    >>> imc_percentages(cubo).loc[['Peso normal', 'Sobrepeso']].to_dict('index')
+    {'Peso normal': {'Com dispensa': 1.0, 'Sem dispensa': 0.75}, 'Sobrepeso': {'Com dispensa': 0.0, 'Sem dispensa': 0.25}}
+    '''
+    contagem = cubo.pivot_table(index='CATEGORIA_IMC', columns='DISPENSA', values='N', aggfunc='sum', fill_value=0)
+    contagem = contagem.reindex(IMC_LABELS, fill_value=0).rename_axis(index=None, columns=None)
+    return contagem / contagem.sum()
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,106 @@
+'''
+Este modulo guarda e le manifestos em JSON, pequenos arquivos que registram
+metadados dos arquivos baixados (ETag, Last-Modified, tamanho e hash) para
+que execucoes seguintes saibam o que mudou sem baixar tudo de novo.
+'''
+
+import os
+import json
+
+
+def load_manifest(path: str) -> dict:
+    '''
+    Le um manifesto do disco.
+
+    Parameters
+    ----------
+    path : str
+        Caminho do arquivo JSON do manifesto.
+
+    Returns
+    -------
+    dict
+        O conteudo do manifesto. Um dicionario vazio se o arquivo nao existir
+        ou nao puder ser lido.
+
+    Example
+    -------
+    >>> load_manifest('ESSE_MANIFESTO_N_EXISTE.json')
+    {}
+    '''
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict):
+        return {}
+    return manifest
+
+
+def save_manifest(manifest: dict, path: str):
+    '''
+    Grava um manifesto no disco de forma atomica: o JSON e escrito em um
+    arquivo temporario que so depois substitui o original.
+
+    Parameters
+    ----------
+    manifest : dict
+        O conteudo do manifesto.
+
+    path : str
+        Caminho do arquivo JSON do manifesto.
+
+    Returns
+    -------
+    None
+
+    Example
+    -------
+    >>> import tempfile
+    >>> caminho = os.path.join(tempfile.mkdtemp(), 'manifest.json')
+    >>> save_manifest({'2022': {'etag': '"abc"'}}, caminho)
+    >>> load_manifest(caminho)
+    {'2022': {'etag': '"abc"'}}
+    '''
+    temp_file = path + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temp_file, path)
+
+
+def conditional_headers(entry: dict) -> dict:
+    '''
+    Monta os cabecalhos de uma requisicao condicional a partir da entrada
+    de um arquivo no manifesto.
+
+    Parameters
+    ----------
+    entry : dict
+        Entrada do manifesto, com as chaves 'etag' e/ou 'last_modified'.
+
+    Returns
+    -------
+    dict
+        Cabecalhos If-None-Match e If-Modified-Since, quando disponiveis.
+
+    Example
+    -------
+    >>> conditional_headers({'etag': '"abc"', 'last_modified': 'Mon, 02 Jan 2023 10:00:00 GMT'})
+    {'If-None-Match': '"abc"', 'If-Modified-Since': 'Mon, 02 Jan 2023 10:00:00 GMT'}
+    >>> conditional_headers(None)
+    {}
+    '''
+    headers = {}
+    if not entry:
+        return headers
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(verbose=True)
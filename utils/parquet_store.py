@@ -0,0 +1,487 @@
+'''
+Armazenamento colunar dos csvs do SERMIL em Parquet, particionado por ano.
+
+Cada 'sermil{ano}.csv' e convertido uma unica vez para
+'sermil_parquet/ANO_COLETA={ano}/part-0.parquet', na mesma pasta do csv,
+com os tipos compactos do modulo schema e compressao. Depois disso, ler algumas colunas ou
+alguns anos nao exige mais o parse do texto inteiro: a projecao de colunas
+e o filtro de anos sao resolvidos pelos metadados do Parquet.
+
+Os leitores do projeto usam read_sermil_csv, que le o Parquet quando a
+particao do ano existe e esta atualizada, e o csv caso contrario. O
+pyarrow e opcional: sem ele tudo continua funcionando a partir dos csvs.
+'''
+
+import os
+import re
+import pandas as pd
+from typing import List, Tuple
+try:
+    from .schema import apply_schema, csv_dtypes
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    from schema import apply_schema, csv_dtypes
+
+# Nome da pasta do armazenamento, criada ao lado dos csvs.
+STORE_DIRNAME = 'sermil_parquet'
+
+# Coluna de particao, a mesma usada por concatenate_last_n_csv_files.
+PARTITION_COLUMN = 'ANO_COLETA'
+
+# Apenas 'sermil{ano}.csv' e uma particao anual: outros csvs com ano no nome,
+# como 'sermilH2022.csv', tem outras colunas e nao podem ocupar a mesma particao.
+_YEAR_RE = re.compile(r'^sermil(\d{4})\.csv$')
+
+# Argumentos do read_csv que so dizem respeito ao parse do texto e nao mudam
+# nada na leitura do Parquet.
+_TEXT_ONLY_KWARGS = {'encoding', 'low_memory'}
+
+# Argumentos do read_csv que tambem sao aplicados na leitura do Parquet.
+_PARQUET_KWARGS = _TEXT_ONLY_KWARGS | {'nrows', 'dtype'}
+
+
+def parquet_available() -> bool:
+    '''
+    Verifica se o pyarrow, necessario para ler e gravar Parquet, esta instalado.
+
+    Returns
+    -------
+    bool
+        True se o pyarrow puder ser importado.
+    '''
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def year_from_filename(path: str) -> int:
+    '''
+    Extrai o ano do nome de um csv anual do SERMIL ('sermil{ano}.csv').
+
+    Parameters
+    ----------
+    path : str
+        Caminho do csv, por exemplo 'data/sermil2022.csv'.
+
+    Returns
+    -------
+    int or None
+        O ano, ou None se o nome nao for do tipo 'sermil{ano}.csv'.
+
+    Example
+    -------
+    >>> year_from_filename('data/sermil2022.csv')
+    2022
+    >>> year_from_filename('sermilH2022.csv') is None
+    True
+    >>> year_from_filename('dados.csv') is None
+    True
+    '''
+    encontrado = _YEAR_RE.search(os.path.basename(path))
+    if encontrado is None:
+        return None
+    return int(encontrado.group(1))
+
+
+def store_dir_for(csv_path: str) -> str:
+    '''
+    Pasta do armazenamento Parquet que corresponde a um csv.
+
+    Example
+    -------
+    >>> store_dir_for(os.path.join('data', 'sermil2022.csv')) == os.path.join('data', 'sermil_parquet')
+    True
+    '''
+    return os.path.join(os.path.dirname(csv_path), STORE_DIRNAME)
+
+
+def partition_path(store_dir: str, ano: int) -> str:
+    '''
+    Caminho do arquivo Parquet de um ano dentro do armazenamento.
+
+    Example
+    -------
+    >>> partition_path('sermil_parquet', 2022) == os.path.join('sermil_parquet', 'ANO_COLETA=2022', 'part-0.parquet')
+    True
+    '''
+    return os.path.join(store_dir, f'{PARTITION_COLUMN}={ano}', 'part-0.parquet')
+
+
+def stored_years(store_dir: str) -> List[int]:
+    '''
+    Lista, em ordem, os anos que ja tem particao no armazenamento.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    Returns
+    -------
+    List[int]
+        Anos disponiveis. Vazia se a pasta nao existir.
+    '''
+    if not os.path.isdir(store_dir):
+        return []
+    anos = []
+    prefixo = PARTITION_COLUMN + '='
+    for nome in os.listdir(store_dir):
+        if nome.startswith(prefixo) and nome[len(prefixo):].isdigit():
+            ano = int(nome[len(prefixo):])
+            if os.path.exists(partition_path(store_dir, ano)):
+                anos.append(ano)
+    return sorted(anos)
+
+
+def _read_csv_any_encoding(csv_path: str, **kwargs) -> pd.DataFrame:
+    '''
+    Le um csv em utf-8 e, se falhar, em latin1 (codificacao dos arquivos do Drive).
+    '''
+    try:
+        return pd.read_csv(csv_path, encoding='utf-8', low_memory=False, **kwargs)
+    except UnicodeDecodeError:
+        return pd.read_csv(csv_path, encoding='latin1', low_memory=False, **kwargs)
+
+
+def write_year(df: pd.DataFrame, ano: int, store_dir: str, compression: str = 'snappy') -> str:
+    '''
+    Grava os dados de um ano como uma particao do armazenamento. Apenas a
+    particao desse ano e escrita; as demais nao sao tocadas. Os tipos do
+    esquema do SERMIL sao aplicados antes da escrita.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dados do ano.
+
+    ano : int
+        Ano dos dados.
+
+    store_dir : str
+        Pasta do armazenamento.
+
+    compression : str, optional
+        Compressao do Parquet. Por padrao 'snappy'.
+
+    Returns
+    -------
+    str
+        Caminho do arquivo Parquet gravado.
+    '''
+    destino = partition_path(store_dir, ano)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    df = apply_schema(df.drop(columns=[PARTITION_COLUMN], errors='ignore'))
+    temp_file = destino + '.tmp'
+    df.to_parquet(temp_file, engine='pyarrow', compression=compression, index=False)
+    os.replace(temp_file, destino)
+    return destino
+
+
+def convert_csv_to_parquet(csv_path: str, store_dir: str = None, ano: int = None,
+                           compression: str = 'snappy') -> str:
+    '''
+    Converte um csv do SERMIL em uma particao Parquet.
+
+    Parameters
+    ----------
+    csv_path : str
+        Caminho do csv.
+
+    store_dir : str, optional
+        Pasta do armazenamento. Por padrao store_dir_for(csv_path).
+
+    ano : int, optional
+        Ano dos dados. Por padrao extraido do nome do arquivo.
+
+    compression : str, optional
+        Compressao do Parquet. Por padrao 'snappy'.
+
+    Returns
+    -------
+    str or None
+        Caminho do arquivo Parquet gravado, ou None se a conversao falhar.
+
+    Example
+    -------
+    >>> import tempfile
+    >>> pasta = tempfile.mkdtemp()
+    >>> csv = os.path.join(pasta, 'sermil2022.csv')
+    >>> pd.DataFrame({'PESO': [70, 80], 'UF_RESIDENCIA': ['SP', 'RJ']}).to_csv(csv, index=False)
+    >>> destino = convert_csv_to_parquet(csv)
+    >>> stored_years(store_dir_for(csv))
+    [2022]
+    '''
+    try:
+        if store_dir is None:
+            store_dir = store_dir_for(csv_path)
+        if ano is None:
+            ano = year_from_filename(csv_path)
+        if ano is None:
+            raise ValueError(f"Nao foi possivel identificar o ano de '{csv_path}'.")
+        df = _read_csv_any_encoding(csv_path, dtype=csv_dtypes())
+        return write_year(df, ano, store_dir, compression)
+    except Exception as e:
+        print("Ocorreu um erro na conversao para Parquet:", str(e))
+        return None
+
+
+def convert_folder(folder: str, store_dir: str = None, force: bool = False) -> List[int]:
+    '''
+    Converte para Parquet todos os 'sermil{ano}.csv' de uma pasta que
+    ainda nao foram convertidos ou que mudaram desde a conversao.
+
+    Parameters
+    ----------
+    folder : str
+        Pasta com os csvs.
+
+    store_dir : str, optional
+        Pasta do armazenamento. Por padrao 'folder/sermil_parquet'.
+
+    force : bool, optional
+        Se True, converte todos os anos de novo.
+
+    Returns
+    -------
+    List[int]
+        Anos convertidos nesta chamada.
+    '''
+    if store_dir is None:
+        store_dir = os.path.join(folder, STORE_DIRNAME)
+    convertidos = []
+    for nome in sorted(os.listdir(folder)):
+        ano = year_from_filename(nome)
+        csv_path = os.path.join(folder, nome)
+        if ano is None or (not force and is_fresh(csv_path, store_dir, ano)):
+            continue
+        if convert_csv_to_parquet(csv_path, store_dir, ano) is not None:
+            convertidos.append(ano)
+    return convertidos
+
+
+def parquet_writer(ano: int, df: pd.DataFrame, folder: str) -> str:
+    '''
+    Etapa de escrita para pipeline.run_pipeline que grava cada ano direto
+    no armazenamento Parquet de folder, sem passar por csv.
+    '''
+    return write_year(df, ano, os.path.join(folder, STORE_DIRNAME))
+
+
+def is_fresh(csv_path: str, store_dir: str = None, ano: int = None) -> bool:
+    '''
+    Indica se a particao Parquet de um csv existe e nao e mais antiga que ele.
+
+    Parameters
+    ----------
+    csv_path : str
+        Caminho do csv. Nao precisa existir: se so o Parquet existir, ele e
+        considerado atualizado.
+
+    store_dir : str, optional
+        Pasta do armazenamento. Por padrao store_dir_for(csv_path).
+
+    ano : int, optional
+        Ano dos dados. Por padrao extraido do nome do arquivo.
+
+    Returns
+    -------
+    bool
+        True se a particao pode ser usada no lugar do csv.
+    '''
+    if store_dir is None:
+        store_dir = store_dir_for(csv_path)
+    if ano is None:
+        ano = year_from_filename(csv_path)
+    if ano is None:
+        return False
+    destino = partition_path(store_dir, ano)
+    if not os.path.exists(destino):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return os.path.getmtime(destino) >= os.path.getmtime(csv_path)
+
+
+def read_year(store_dir: str, ano: int, columns: List[str] = None) -> pd.DataFrame:
+    '''
+    Le um ano do armazenamento, apenas com as colunas pedidas.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    ano : int
+        Ano a ser lido.
+
+    columns : List[str], optional
+        Colunas desejadas. Se None, todas.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Os dados do ano.
+
+    Raises
+    ------
+    ValueError
+        Se alguma coluna pedida nao existir no arquivo (mesmo erro do
+        pandas.read_csv com usecols).
+    '''
+    destino = partition_path(store_dir, ano)
+    if columns is not None:
+        import pyarrow.parquet as pq
+        existentes = pq.read_schema(destino).names
+        faltando = [c for c in columns if c not in existentes]
+        if faltando:
+            raise ValueError(f"Usecols do not match columns, columns expected but not found: {faltando}")
+        # Mantem a ordem das colunas no arquivo, como o usecols do read_csv.
+        columns = [c for c in existentes if c in set(columns)]
+    return pd.read_parquet(destino, engine='pyarrow', columns=columns)
+
+
+def read_store(store_dir: str, columns: List[str] = None, anos: List[int] = None) -> pd.DataFrame:
+    '''
+    Le varios anos do armazenamento em um unico DataFrame, com a coluna
+    ANO_COLETA indicando o ano de cada linha. Apenas as particoes dos anos
+    pedidos sao abertas.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    columns : List[str], optional
+        Colunas desejadas. Se None, todas.
+
+    anos : List[int], optional
+        Anos desejados. Se None, todos os anos disponiveis.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Os dados dos anos, em ordem crescente de ano.
+    '''
+    disponiveis = stored_years(store_dir)
+    if anos is not None:
+        disponiveis = [ano for ano in disponiveis if ano in set(anos)]
+    partes = []
+    for ano in disponiveis:
+        parte = read_year(store_dir, ano, columns)
+        parte[PARTITION_COLUMN] = ano
+        partes.append(parte)
+    if not partes:
+        return pd.DataFrame(columns=(list(columns) if columns else []) + [PARTITION_COLUMN])
+    return pd.concat(partes, ignore_index=True)
+
+
+def peek_columns(csv_path: str, **kwargs) -> Tuple[List[str], bool]:
+    '''
+    Le apenas o cabecalho de um csv do SERMIL e a primeira linha de dados
+    (ou os metadados da particao Parquet, quando atualizada), para validar
+    colunas sem fazer o parse do arquivo inteiro.
+
+    Parameters
+    ----------
+    csv_path : str
+        Caminho do csv.
+
+    **kwargs
+        Argumentos repassados a pandas.read_csv quando o csv for lido.
+
+    Returns
+    -------
+    Tuple[List[str], bool]
+        As colunas do arquivo e se ele tem ao menos uma linha de dados.
+
+    Example
+    -------
+    >>> import tempfile
+    >>> csv = os.path.join(tempfile.mkdtemp(), 'sermil2020.csv')
+    >>> pd.DataFrame({'PESO': [70], 'ALTURA': [170]}).to_csv(csv, index=False)
+    >>> peek_columns(csv)
+    (['PESO', 'ALTURA'], True)
+    '''
+    if parquet_available() and is_fresh(csv_path):
+        import pyarrow.parquet as pq
+        metadados = pq.read_metadata(partition_path(store_dir_for(csv_path), year_from_filename(csv_path)))
+        return list(metadados.schema.names), metadados.num_rows > 0
+    primeira = pd.read_csv(csv_path, nrows=1, **kwargs)
+    return list(primeira.columns), not primeira.empty
+
+
+def read_sermil_csv(csv_path: str, usecols: List[str] = None, schema: bool = True, **kwargs) -> pd.DataFrame:
+    '''
+    Le um csv do SERMIL, usando a particao Parquet correspondente quando
+    ela existe e esta atualizada. Pode substituir pandas.read_csv nos
+    leitores do projeto. Por padrao os tipos compactos do modulo schema
+    sao aplicados.
+
+    Parameters
+    ----------
+    csv_path : str
+        Caminho do csv, por exemplo 'data/sermil2022.csv'.
+
+    usecols : List[str], optional
+        Colunas desejadas.
+
+    schema : bool, optional
+        Se True (padrao), aplica o esquema do SERMIL.
+
+    **kwargs
+        Argumentos repassados a pandas.read_csv. Na leitura do Parquet,
+        nrows e dtype sao aplicados e encoding e low_memory nao tem efeito;
+        com qualquer outro argumento o csv e lido no lugar do Parquet.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Os dados do arquivo.
+
+    Raises
+    ------
+    TypeError
+        Se so o Parquet existir e algum argumento nao puder ser aplicado a ele.
+
+    Example
+    -------
+    >>> import tempfile
+    >>> pasta = tempfile.mkdtemp()
+    >>> csv = os.path.join(pasta, 'sermil2021.csv')
+    >>> pd.DataFrame({'PESO': [70, 80], 'ALTURA': [170, 180]}).to_csv(csv, index=False)
+    >>> _ = convert_csv_to_parquet(csv)
+    >>> os.remove(csv)
+    >>> read_sermil_csv(csv, usecols=['ALTURA'])
+       ALTURA
+    0     170
+    1     180
+    '''
+    usar_parquet = parquet_available() and is_fresh(csv_path)
+    outros = set(kwargs) - _PARQUET_KWARGS
+    if usar_parquet and outros:
+        if not os.path.exists(csv_path):
+            raise TypeError(f"Argumentos sem efeito na leitura do Parquet de '{csv_path}': {sorted(outros)}")
+        usar_parquet = False
+    if usar_parquet:
+        df = read_year(store_dir_for(csv_path), year_from_filename(csv_path), usecols)
+        if kwargs.get('nrows') is not None:
+            df = df.head(kwargs['nrows'])
+        if kwargs.get('dtype') is not None:
+            dtype = kwargs['dtype']
+            if isinstance(dtype, dict):
+                dtype = {col: tipo for col, tipo in dtype.items() if col in df.columns}
+            df = df.astype(dtype)
+    else:
+        if schema and 'dtype' not in kwargs:
+            kwargs['dtype'] = csv_dtypes()
+        df = pd.read_csv(csv_path, usecols=usecols, **kwargs)
+    if schema:
+        df = apply_schema(df, inplace=True)
+    return df
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,295 @@
+'''
+Este modulo organiza a ingestao dos csvs do SERMIL como um pipeline de
+tres etapas: download, parse e escrita no armazenamento local.
+
+Cada etapa roda em suas proprias threads e as etapas sao ligadas por filas
+de tamanho limitado. Assim o parse (que usa CPU) de um ano acontece ao
+mesmo tempo que o download (que espera a rede) dos anos seguintes, e as
+filas limitadas impedem que um download rapido acumule anos demais no
+disco. O parse le cada ano em blocos de linhas, entao nenhum ano inteiro
+fica na memoria. O pipeline mede a vazao de cada etapa e a ocupacao das filas, o
+que mostra qual etapa e o gargalo.
+'''
+
+import os
+import time
+import queue
+import threading
+import pandas as pd
+from typing import Callable, Dict, List
+try:
+    from . import downloaddata
+    from .cleandata import process_data_chunks
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    import downloaddata
+    from cleandata import process_data_chunks
+
+# Marcador de fim de fila.
+_FIM = object()
+
+
+def _new_stats(nome: str, workers: int) -> dict:
+    return {'etapa': nome, 'workers': workers, 'itens': 0, 'falhas': 0, 'segundos_ocupado': 0.0}
+
+
+def _new_queue_stats(nome: str, maxsize: int) -> dict:
+    return {'fila': nome, 'maxsize': maxsize, 'amostras': 0, 'soma_ocupacao': 0, 'ocupacao_maxima': 0}
+
+
+def _put(fila: queue.Queue, item, queue_stats: dict, lock: threading.Lock):
+    '''
+    Coloca um item na fila (bloqueando se ela estiver cheia) e registra a
+    ocupacao da fila nesse momento.
+    '''
+    fila.put(item)
+    ocupacao = fila.qsize()
+    with lock:
+        queue_stats['amostras'] += 1
+        queue_stats['soma_ocupacao'] += ocupacao
+        queue_stats['ocupacao_maxima'] = max(queue_stats['ocupacao_maxima'], ocupacao)
+
+
+def _stage_worker(funcao: Callable, entrada: queue.Queue, saida: queue.Queue, stats: dict,
+                  queue_stats: dict, falhas: dict, lock: threading.Lock):
+    '''
+    Laco de uma thread de uma etapa: le itens da entrada, aplica a funcao e
+    repassa o resultado para a saida. Itens que falham sao registrados em
+    falhas, pelo ano, e nao seguem para as proximas etapas.
+    '''
+    while True:
+        item = entrada.get()
+        if item is _FIM:
+            # Devolve o marcador para as outras threads da mesma etapa.
+            entrada.put(_FIM)
+            return
+        ano = item[0]
+        inicio = time.perf_counter()
+        try:
+            resultado = funcao(item)
+        except Exception as e:
+            resultado = None
+            with lock:
+                falhas[ano] = f"{stats['etapa']}: {e}"
+        duracao = time.perf_counter() - inicio
+        with lock:
+            stats['segundos_ocupado'] += duracao
+            if resultado is None:
+                stats['falhas'] += 1
+                falhas.setdefault(ano, f"{stats['etapa']}: falhou")
+            else:
+                stats['itens'] += 1
+        if resultado is not None and saida is not None:
+            _put(saida, resultado, queue_stats, lock)
+
+
+def _download_stage(folder: str) -> Callable:
+    def baixa(item):
+        ano = item[0]
+        raw_file = os.path.join(folder, f'sermil{ano}.csv.raw')
+        info = downloaddata.download_file_resumable(downloaddata.SERMIL_URL.format(ano=ano), raw_file)
+        if info is None:
+            return None
+        return ano, raw_file, info['encoding']
+    return baixa
+
+
+def _parse_stage(desired_columns: List[str], dropna: bool, chunksize: int) -> Callable:
+    def le(item):
+        ano, raw_file, encoding = item
+        parsed_file = raw_file[:-len('.raw')] + '.parsed'
+        try:
+            with open(raw_file, 'rb') as f:
+                linhas = process_data_chunks(f, parsed_file, dropna, desired_columns,
+                                             chunksize=chunksize, encoding=encoding)
+        finally:
+            # O arquivo bruto nao e mais usado, mesmo que o parse tenha falhado.
+            os.remove(raw_file)
+        if linhas is None:
+            return None
+        return ano, parsed_file
+    return le
+
+
+def write_csv(ano: int, df: pd.DataFrame, folder: str) -> str:
+    '''
+    Escrita padrao do pipeline: grava o ano em 'sermil{ano}.csv' na pasta.
+
+    Parameters
+    ----------
+    ano : int
+        Ano dos dados.
+
+    df : pandas.DataFrame
+        Dados do ano, ja com as colunas selecionadas.
+
+    folder : str
+        Pasta de destino.
+
+    Returns
+    -------
+    str
+        Caminho do arquivo gravado.
+
+    Example
+    -------
+    >>> import tempfile
+    >>> pasta = tempfile.mkdtemp()
+    >>> caminho = write_csv(2022, pd.DataFrame({'PESO': [70, 80]}), pasta)
+    >>> os.path.basename(caminho)
+    'sermil2022.csv'
+    '''
+    local_file = os.path.join(folder, f'sermil{ano}.csv')
+    temp_file = local_file + '.tmp'
+    df.to_csv(temp_file, index=False)
+    os.replace(temp_file, local_file)
+    return local_file
+
+
+def _write_stage(writer: Callable, folder: str) -> Callable:
+    def grava(item):
+        ano, parsed_file = item
+        try:
+            if writer is write_csv:
+                # O parse ja gravou o csv com as colunas pedidas: basta renomea-lo.
+                local_file = os.path.join(folder, f'sermil{ano}.csv')
+                os.replace(parsed_file, local_file)
+                return ano, local_file
+            return ano, writer(ano, pd.read_csv(parsed_file), folder)
+        finally:
+            if os.path.exists(parsed_file):
+                os.remove(parsed_file)
+    return grava
+
+
+def _summary(stats: List[dict], queues: List[dict], wall: float) -> Dict:
+    '''
+    Calcula vazao das etapas, ocupacao media das filas e a etapa gargalo.
+    '''
+    etapas = {}
+    for s in stats:
+        ocupado_por_worker = s['segundos_ocupado'] / s['workers']
+        etapas[s['etapa']] = {
+            'workers': s['workers'],
+            'itens': s['itens'],
+            'falhas': s['falhas'],
+            'segundos_ocupado': s['segundos_ocupado'],
+            'itens_por_segundo': s['itens'] / ocupado_por_worker if ocupado_por_worker > 0 else 0.0,
+            'utilizacao': ocupado_por_worker / wall if wall > 0 else 0.0,
+        }
+    filas = {}
+    for q in queues:
+        filas[q['fila']] = {
+            'maxsize': q['maxsize'],
+            'ocupacao_media': q['soma_ocupacao'] / q['amostras'] if q['amostras'] else 0.0,
+            'ocupacao_maxima': q['ocupacao_maxima'],
+        }
+    # A etapa que passou mais tempo ocupada, por worker, limita o pipeline.
+    gargalo = max(etapas, key=lambda nome: etapas[nome]['utilizacao'])
+    return {'etapas': etapas, 'filas': filas, 'gargalo': gargalo, 'segundos_total': wall}
+
+
+def run_pipeline(anos: List[int] = None, desired_columns: List[str] = None, dropna: bool = True,
+                 folder: str = '.', download_workers: int = 4, parse_workers: int = 1,
+                 queue_size: int = 2, writer: Callable = None, chunksize: int = 100000) -> Dict:
+    '''
+    Baixa, le e grava os csvs do SERMIL em um pipeline de tres etapas
+    ligadas por filas limitadas.
+
+    Parameters
+    ----------
+    anos : List[int], optional
+        Anos a serem processados. Por padrao de 2007 a 2022. Pode receber,
+        por exemplo, os anos devolvidos por refresh_alldata.
+
+    desired_columns : List[str], optional
+        Colunas mantidas no parse. Se None, todas as colunas sao mantidas.
+
+    dropna : bool, optional
+        Se True (padrao), tira as linhas com valores nulos.
+
+    folder : str, optional
+        Pasta onde os arquivos temporarios e os resultados sao gravados.
+
+    download_workers : int, optional
+        Numero de downloads simultaneos.
+
+    parse_workers : int, optional
+        Numero de threads de parse.
+
+    queue_size : int, optional
+        Tamanho maximo das filas entre as etapas.
+
+    writer : Callable, optional
+        Funcao writer(ano, df, folder) usada na etapa de escrita. Por padrao
+        write_csv, que apenas renomeia o csv gerado pelo parse; outras
+        funcoes recebem o ano ja reduzido as colunas pedidas.
+
+    chunksize : int, optional
+        Numero de linhas por bloco lido no parse. Por padrao 100000.
+
+    Returns
+    -------
+    dict
+        'escritos' (ano -> caminho gravado), 'falhas' (ano -> motivo) e
+        'metricas', com itens, tempo ocupado, vazao e utilizacao de cada
+        etapa, ocupacao media e maxima de cada fila e o nome da etapa
+        gargalo.
+    '''
+    if anos is None:
+        anos = list(range(2007, 2023))
+    if writer is None:
+        writer = write_csv
+    lock = threading.Lock()
+    falhas = {}
+    escritos = {}
+
+    entrada = queue.Queue()
+    fila_parse = queue.Queue(maxsize=queue_size)
+    fila_escrita = queue.Queue(maxsize=queue_size)
+    fila_fim = queue.Queue()
+    for ano in anos:
+        entrada.put((ano,))
+    entrada.put(_FIM)
+
+    stats = [_new_stats('download', download_workers), _new_stats('parse', parse_workers),
+             _new_stats('escrita', 1)]
+    queues = [_new_queue_stats('download->parse', queue_size), _new_queue_stats('parse->escrita', queue_size),
+              _new_queue_stats('escritos', 0)]
+    etapas = [
+        (_download_stage(folder), entrada, fila_parse, download_workers),
+        (_parse_stage(desired_columns, dropna, chunksize), fila_parse, fila_escrita, parse_workers),
+        (_write_stage(writer, folder), fila_escrita, fila_fim, 1),
+    ]
+
+    inicio = time.perf_counter()
+    threads_por_etapa = []
+    for (funcao, fila_entrada, fila_saida, workers), s, q in zip(etapas, stats, queues):
+        threads = [threading.Thread(target=_stage_worker,
+                                    args=(funcao, fila_entrada, fila_saida, s, q, falhas, lock),
+                                    daemon=True)
+                   for _ in range(workers)]
+        for t in threads:
+            t.start()
+        threads_por_etapa.append((threads, fila_saida))
+
+    # Quando todas as threads de uma etapa terminam, a etapa seguinte recebe o fim.
+    for threads, fila_saida in threads_por_etapa:
+        for t in threads:
+            t.join()
+        fila_saida.put(_FIM)
+    wall = time.perf_counter() - inicio
+
+    while True:
+        item = fila_fim.get()
+        if item is _FIM:
+            break
+        escritos[item[0]] = item[1]
+
+    return {'escritos': dict(sorted(escritos.items())), 'falhas': falhas,
+            'metricas': _summary(stats, queues[:2], wall)}
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(verbose=True)
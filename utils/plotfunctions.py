@@ -6,8 +6,9 @@ def bar_cluster(df, column1, column2, name, xname, yname):
 
     Parâmetros
     ----------
-    df : pandas.core.frame.DataFrame
-        O DataFrame que contém os dados.
+    df : pandas.core.frame.DataFrame or SermilDataset
+        O DataFrame que contém os dados. De uma consulta (módulo dataset)
+        são lidas só as duas colunas.
     column1 : str
         O nome da primeira coluna para agrupamento.
     column2 : str
@@ -27,10 +28,26 @@ def bar_cluster(df, column1, column2, name, xname, yname):
     import pandas as pd
     import matplotlib.pyplot as plt
 
+    try:
+        from .dataset import as_frame
+    except ImportError:
+        from dataset import as_frame
+    df = as_frame(df, [column1, column2])
+
     plt.figure(figsize=(10, 6))
     
-    # crosstab para contar as ocorrências das colunas desejadas
-    tabela_contagem = pd.crosstab(df[column1], df[column2])
+    # crosstab para contar as ocorrências das colunas desejadas; colunas
+    # categóricas são contadas direto pelos códigos inteiros
+    if all(isinstance(df[col].dtype, pd.CategoricalDtype) for col in (column1, column2)):
+        try:
+            from .catstore import crosstab_codes
+        except ImportError:
+            from catstore import crosstab_codes
+        tabela_contagem = crosstab_codes(df[column1], df[column2])
+        # Como no pd.crosstab, categorias sem nenhuma ocorrencia ficam fora do grafico
+        tabela_contagem = tabela_contagem.loc[tabela_contagem.sum(axis=1) > 0, tabela_contagem.sum(axis=0) > 0]
+    else:
+        tabela_contagem = pd.crosstab(df[column1], df[column2])
 
     # Cores pras barras
     colors = ['#123456', '#6d745f']
@@ -49,8 +66,9 @@ def top_ages_histogram(data, column_name, num_top_ages=5, colors=None):
 
     Parâmetros
     ----------
-    data : pandas.core.frame.DataFrame
-        O DataFrame contendo os dados.
+    data : pandas.core.frame.DataFrame or SermilDataset
+        O DataFrame contendo os dados. De uma consulta (módulo dataset)
+        é lida só a coluna das idades.
     column_name : str
         O nome da coluna que contém as idades.
     num_top_ages : int, opcional
@@ -66,6 +84,11 @@ def top_ages_histogram(data, column_name, num_top_ages=5, colors=None):
     """
 
     import matplotlib.pyplot as plt
+    try:
+        from .dataset import as_frame
+    except ImportError:
+        from dataset import as_frame
+    data = as_frame(data, [column_name])
 
     top_ages = data[column_name].value_counts().nlargest(num_top_ages)
     
@@ -0,0 +1,169 @@
+'''
+Registro unico dos tipos das colunas do SERMIL.
+
+Sem um esquema explicito o pandas le as medidas (PESO, ALTURA, ...) como
+float64 ou object e as colunas de texto com poucos valores distintos
+(UF_RESIDENCIA, DISPENSA, ESCOLARIDADE, SEXO, ...) como objetos Python, um
+por linha. Este modulo define tipos compactos para cada coluna (inteiros
+pequenos que aceitam nulos, float32 e categorias) e as funcoes que os
+aplicam, usadas por todos os leitores do projeto.
+'''
+
+import numpy as np
+import pandas as pd
+from typing import Dict, List
+
+# Colunas numericas e o tipo inteiro desejado. Se a coluna tiver valores
+# fracionarios ou fora do intervalo do tipo, ela fica como float32.
+INTEGER_COLUMNS: Dict[str, str] = {
+    'ANO_NASCIMENTO': 'UInt16',
+    'VINCULACAO_ANO': 'UInt16',
+    'ANO_COLETA': 'UInt16',
+    'PESO': 'UInt16',
+    'ALTURA': 'UInt16',
+    'CINTURA': 'UInt16',
+    'CABECA': 'UInt8',
+    'CALCADO': 'UInt8',
+}
+
+# Colunas de texto com vocabulario pequeno, guardadas como categorias.
+CATEGORICAL_COLUMNS: List[str] = [
+    'SEXO',
+    'DISPENSA',
+    'ESCOLARIDADE',
+    'ESTADO_CIVIL',
+    'RELIGIAO',
+    'ZONA_RESIDENCIAL',
+    'UF_RESIDENCIA',
+    'UF_NASCIMENTO',
+    'UF_JSM',
+    'PAIS_NASCIMENTO',
+    'PAIS_RESIDENCIA',
+    'MUN_NASCIMENTO',
+    'MUN_RESIDENCIA',
+    'MUN_JSM',
+    'JSM',
+]
+
+
+def csv_dtypes(columns: List[str] = None) -> Dict[str, str]:
+    '''
+    Tipos para o argumento dtype do pandas.read_csv. As categorias ja sao
+    criadas no parse e as colunas numericas sao lidas como float32; a
+    conversao para inteiros e feita depois por apply_schema, pois um valor
+    fracionario no meio do arquivo faria o parse falhar.
+
+    Parameters
+    ----------
+    columns : List[str], optional
+        Se informado, so devolve os tipos dessas colunas.
+
+    Returns
+    -------
+    Dict[str, str]
+        Dicionario coluna -> tipo.
+
+    Example
+    -------
+    >>> csv_dtypes(['PESO', 'SEXO', 'OUTRA'])
+    {'PESO': 'float32', 'SEXO': 'category'}
+    '''
+    dtypes = {col: 'float32' for col in INTEGER_COLUMNS}
+    dtypes.update({col: 'category' for col in CATEGORICAL_COLUMNS})
+    if columns is not None:
+        dtypes = {col: dtypes[col] for col in columns if col in dtypes}
+    return dtypes
+
+
+def _compact_integer(serie: pd.Series, dtype: str) -> pd.Series:
+    '''
+    Converte uma serie numerica para o inteiro compacto, se todos os
+    valores forem inteiros e couberem no tipo; senao, para float32.
+    '''
+    valores = pd.to_numeric(serie, errors='coerce')
+    validos = valores.dropna()
+    limites = np.iinfo(pd.api.types.pandas_dtype(dtype).numpy_dtype)
+    if len(validos) == 0 or (
+            (validos % 1 == 0).all() and validos.min() >= limites.min and validos.max() <= limites.max):
+        return valores.astype(dtype)
+    return valores.astype('float32')
+
+
+def apply_schema(df: pd.DataFrame, inplace: bool = False) -> pd.DataFrame:
+    '''
+    Aplica o esquema do SERMIL as colunas conhecidas de um DataFrame. As
+    demais colunas nao sao alteradas.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Dados do SERMIL.
+
+    inplace : bool, optional
+        Se True, altera o proprio DataFrame em vez de uma copia.
+
+    Returns
+    -------
+    pandas.DataFrame
+        O DataFrame com os tipos compactos.
+
+    Example
+    -------
+    >>> df = pd.DataFrame({'ALTURA': [170.0, 180.0, None], 'PESO': [70.5, 80.0, 90.0],
+    ...                    'SEXO': ['M', 'F', 'M']})
+    >>> apply_schema(df).dtypes.astype(str).to_dict()
+    {'ALTURA': 'UInt16', 'PESO': 'float32', 'SEXO': 'category'}
+    '''
+    if not inplace:
+        df = df.copy()
+    for col, dtype in INTEGER_COLUMNS.items():
+        if col in df.columns and str(df[col].dtype) != dtype:
+            df[col] = _compact_integer(df[col], dtype)
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Compara a memoria usada por coluna antes e depois de aplicar o esquema.
+
+    Parameters
+    ----------
+    before : pandas.DataFrame
+        Dados com os tipos inferidos pelo pandas.
+
+    after : pandas.DataFrame
+        Os mesmos dados depois de apply_schema.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Uma linha por coluna (e uma linha TOTAL) com TIPO_ANTES, TIPO_DEPOIS,
+        BYTES_ANTES, BYTES_DEPOIS, ECONOMIA_BYTES e ECONOMIA (fracao).
+
+    Example
+    -------
+    >>> antes = pd.DataFrame({'SEXO': ['M', 'F'] * 1000})
+    >>> relatorio = memory_report(antes, apply_schema(antes))
+    >>> bool(relatorio.loc['SEXO', 'ECONOMIA'] > 0.5)
+    True
+    '''
+    bytes_antes = before.memory_usage(deep=True, index=False)
+    bytes_depois = after.memory_usage(deep=True, index=False)
+    relatorio = pd.DataFrame({
+        'TIPO_ANTES': before.dtypes.astype(str),
+        'TIPO_DEPOIS': after.dtypes.astype(str),
+        'BYTES_ANTES': bytes_antes,
+        'BYTES_DEPOIS': bytes_depois,
+    })
+    relatorio.loc['TOTAL'] = ['', '', bytes_antes.sum(), bytes_depois.sum()]
+    relatorio['ECONOMIA_BYTES'] = relatorio['BYTES_ANTES'] - relatorio['BYTES_DEPOIS']
+    relatorio['ECONOMIA'] = relatorio['ECONOMIA_BYTES'] / relatorio['BYTES_ANTES'].where(relatorio['BYTES_ANTES'] > 0)
+    return relatorio
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(verbose=True)
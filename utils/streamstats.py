@@ -0,0 +1,442 @@
+'''
+Estatisticas descritivas de uma coluna numerica calculadas em fluxo.
+
+Os dados sao consumidos em pedacos (ou um ano do conjunto por vez) e cada
+pedaco atualiza um resumo de tamanho limitado:
+
+- Moments guarda contagem, media, soma dos quadrados dos desvios (M2),
+  minimo e maximo. Dois resumos se juntam pela formula de Chan et al., a
+  mesma do algoritmo de Welford aplicada a blocos.
+- KLLSketch guarda uma amostra ponderada dos valores em niveis
+  (compactadores), como no sketch KLL de Karnin, Lang e Liberty. Dois
+  sketches se juntam nivel a nivel.
+
+Para as colunas inteiras de histogram.HISTOGRAM_COLUMNS (ALTURA, PESO,
+CINTURA, CABECA, CALCADO) o sketch e trocado por um IntegerHistogram, que
+se junta da mesma forma e da quantis exatos. Se um bloco dessas colunas
+tiver valores nao inteiros ou espalhados demais (ver
+histogram.fits_histogram), ou se o resumo for juntado a um que usa KLL, o
+histograma e convertido em um sketch KLL com os mesmos valores.
+
+StreamingStats junta os dois e devolve a mesma Series de
+pandas.Series.describe(). Enquanto nenhum nivel foi compactado (ate cerca de
+k valores) os quantis sao exatos; depois o erro de posto normalizado fica
+abaixo de rank_error() com 99% de confianca: um quantil q devolvido esta
+entre os quantis exatos q - erro e q + erro (ver quantile_interval).
+
+stream_stats processa os anos do conjunto de dados em paralelo, um
+processo por ano, e junta os resumos na ordem dos anos.
+'''
+
+import os
+import math
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
+try:
+    from .dataset import SermilDataset, read_dataset_year
+    from .validation import check_numeric
+    from .analysis_utils import iter_chunks
+    from .histogram import HISTOGRAM_COLUMNS, IntegerHistogram, fits_histogram
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    from dataset import SermilDataset, read_dataset_year
+    from validation import check_numeric
+    from analysis_utils import iter_chunks
+    from histogram import HISTOGRAM_COLUMNS, IntegerHistogram, fits_histogram
+
+# Quantis da saida de describe().
+DESCRIBE_PERCENTILES = [0.25, 0.5, 0.75]
+
+# Tamanho padrao do sketch: cerca de 1,3% de erro de posto, poucos KB por ano.
+DEFAULT_K = 200
+
+# Razao entre as capacidades de niveis vizinhos do KLL.
+_C = 2 / 3
+
+
+class Moments:
+    '''
+    Contagem, media, M2, minimo e maximo, atualizados por blocos.
+
+    Example
+    -------
+    >>> m = Moments().update(np.array([1.0, 2.0])).merge(Moments().update(np.array([3.0, 4.0])))
+    >>> m.n, m.media, m.variancia, m.minimo, m.maximo
+    (4, 2.5, 1.6666666666666667, 1.0, 4.0)
+    '''
+    def __init__(self):
+        self.n = 0
+        self.media = 0.0
+        self.m2 = 0.0
+        self.minimo = math.nan
+        self.maximo = math.nan
+
+    def update(self, valores: np.ndarray) -> 'Moments':
+        '''
+        Acrescenta um bloco de valores (sem nulos).
+        '''
+        if len(valores) == 0:
+            return self
+        bloco = Moments()
+        bloco.n = len(valores)
+        bloco.media = float(valores.mean())
+        bloco.m2 = float(((valores - bloco.media) ** 2).sum())
+        bloco.minimo = float(valores.min())
+        bloco.maximo = float(valores.max())
+        return self.merge(bloco)
+
+    def merge(self, outro: 'Moments') -> 'Moments':
+        '''
+        Junta outro resumo a este.
+        '''
+        if outro.n == 0:
+            return self
+        if self.n == 0:
+            self.n, self.media, self.m2 = outro.n, outro.media, outro.m2
+            self.minimo, self.maximo = outro.minimo, outro.maximo
+            return self
+        n = self.n + outro.n
+        delta = outro.media - self.media
+        self.media += delta * outro.n / n
+        self.m2 += outro.m2 + delta * delta * self.n * outro.n / n
+        self.n = n
+        self.minimo = min(self.minimo, outro.minimo)
+        self.maximo = max(self.maximo, outro.maximo)
+        return self
+
+    @property
+    def variancia(self) -> float:
+        '''
+        Variancia amostral (ddof=1, como no pandas).
+        '''
+        return self.m2 / (self.n - 1) if self.n > 1 else math.nan
+
+
+class KLLSketch:
+    '''
+    Sketch de quantis KLL, alimentado por blocos de valores.
+
+    Cada nivel h guarda valores com peso 2**h. Quando o total de valores
+    passa da capacidade, um nivel cheio e ordenado e metade dos seus valores
+    (os de posicao par ou impar, ao acaso) sobe para o nivel seguinte com o
+    dobro do peso. O peso total continua igual ao numero de valores vistos.
+
+    Example
+    -------
+    >>> s = KLLSketch(k=8, seed=0).update(np.arange(1000, dtype='float64'))
+    >>> s.n, s.exact, sum(len(nivel) for nivel in s.niveis) < 40
+    (1000, False, True)
+    '''
+    def __init__(self, k: int = DEFAULT_K, seed: int = None):
+        self.k = k
+        self.n = 0
+        self.niveis = [np.empty(0)]
+        self.compactado = False
+        self._rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_histogram(cls, histograma: IntegerHistogram, k: int = DEFAULT_K, seed: int = None) -> 'KLLSketch':
+        '''
+        Sketch com os mesmos valores de um IntegerHistogram. Cada contagem e
+        escrita em binario: o valor entra no nivel h (peso 2**h) quando o bit
+        h da contagem esta ligado, entao nada se perde ate a primeira
+        compactacao.
+
+        Example
+        -------
+        >>> h = IntegerHistogram().update([170, 170, 170, 180])
+        >>> s = KLLSketch.from_histogram(h)
+        >>> s.n, s.exact, s.quantile([0.5, 1.0]).tolist()
+        (4, True, [170.0, 180.0])
+        '''
+        sketch = cls(k, seed)
+        valores = (histograma.inicio + np.arange(len(histograma.contagens))).astype('float64')
+        contagens = histograma.contagens.copy()
+        h = 0
+        while contagens.any():
+            if h == len(sketch.niveis):
+                sketch.niveis.append(np.empty(0))
+            sketch.niveis[h] = valores[(contagens & 1) == 1]
+            contagens >>= 1
+            h += 1
+        sketch.n = histograma.n
+        sketch._compactar()
+        return sketch
+
+    @property
+    def exact(self) -> bool:
+        '''
+        True enquanto nenhum valor foi descartado por compactacao.
+        '''
+        return not self.compactado
+
+    def _capacidade(self, h: int) -> int:
+        return int(math.ceil(self.k * _C ** (len(self.niveis) - h - 1))) + 1
+
+    def _cheio(self) -> bool:
+        tamanho = sum(len(nivel) for nivel in self.niveis)
+        return tamanho >= sum(self._capacidade(h) for h in range(len(self.niveis)))
+
+    def _compactar(self):
+        while self._cheio():
+            for h in range(len(self.niveis)):
+                if len(self.niveis[h]) < self._capacidade(h):
+                    continue
+                if h + 1 == len(self.niveis):
+                    self.niveis.append(np.empty(0))
+                nivel = np.sort(self.niveis[h])
+                # Com um numero impar de valores, o menor fica no nivel.
+                sobra = len(nivel) % 2
+                promovidos = nivel[sobra + int(self._rng.integers(2))::2]
+                self.niveis[h] = nivel[:sobra]
+                self.niveis[h + 1] = np.concatenate([self.niveis[h + 1], promovidos])
+                self.compactado = True
+                if not self._cheio():
+                    break
+
+    def update(self, valores: np.ndarray) -> 'KLLSketch':
+        '''
+        Acrescenta um bloco de valores (sem nulos).
+        '''
+        self.niveis[0] = np.concatenate([self.niveis[0], np.asarray(valores, dtype='float64')])
+        self.n += len(valores)
+        self._compactar()
+        return self
+
+    def merge(self, outro: 'KLLSketch') -> 'KLLSketch':
+        '''
+        Junta outro sketch a este, nivel a nivel.
+        '''
+        if isinstance(outro, IntegerHistogram):
+            outro = KLLSketch.from_histogram(outro, self.k)
+        self.compactado = self.compactado or outro.compactado
+        while len(self.niveis) < len(outro.niveis):
+            self.niveis.append(np.empty(0))
+        for h, nivel in enumerate(outro.niveis):
+            self.niveis[h] = np.concatenate([self.niveis[h], nivel])
+        self.n += outro.n
+        self._compactar()
+        return self
+
+    def rank_error(self) -> float:
+        '''
+        Erro de posto normalizado dos quantis, com 99% de confianca. Zero
+        enquanto o sketch e exato. Usa a calibracao empirica do KLL da
+        biblioteca Apache DataSketches, 2.296 / k**0.9723.
+        '''
+        return 0.0 if self.exact else 2.296 / self.k ** 0.9723
+
+    def quantile(self, q) -> np.ndarray:
+        '''
+        Quantis com interpolacao linear entre postos, como no pandas. Num
+        sketch exato o resultado e o mesmo de pandas.Series.quantile.
+        '''
+        q = np.atleast_1d(np.asarray(q, dtype='float64'))
+        if self.n == 0:
+            return np.full(len(q), math.nan)
+        valores = np.concatenate(self.niveis)
+        pesos = np.concatenate([np.full(len(nivel), 2 ** h, dtype='int64') for h, nivel in enumerate(self.niveis)])
+        ordem = np.argsort(valores, kind='stable')
+        valores, acumulado = valores[ordem], np.cumsum(pesos[ordem])
+        posicao = q * (self.n - 1)
+        baixo, alto = np.floor(posicao), np.ceil(posicao)
+        # O valor de posto r e o primeiro cujo peso acumulado passa de r.
+        v_baixo = valores[np.searchsorted(acumulado, baixo, side='right')]
+        v_alto = valores[np.searchsorted(acumulado, alto, side='right')]
+        return v_baixo + (v_alto - v_baixo) * (posicao - baixo)
+
+
+class StreamingStats:
+    '''
+    Resumo em fluxo de uma coluna, com a saida de describe().
+
+    Parameters
+    ----------
+    name : str, optional
+        Nome da coluna, usado como nome da Series de describe().
+
+    k : int, optional
+        Tamanho do sketch de quantis.
+
+    seed : int, optional
+        Semente das escolhas aleatorias do sketch.
+
+    histogram : bool, optional
+        Comeca com um IntegerHistogram (quantis exatos) em vez do sketch
+        KLL. Por padrao, apenas para as colunas de HISTOGRAM_COLUMNS. O
+        histograma vira um sketch KLL no primeiro bloco com valores nao
+        inteiros ou fora de MAX_WIDTH, ou ao ser juntado com um resumo que
+        usa KLL.
+
+    Attributes
+    ----------
+    relatorio : dict
+        Primeiro relatorio de check_numeric com linhas rejeitadas, quando
+        update recebe regras; None se todos os blocos passaram.
+
+    Example
+    -------
+    >>> s = StreamingStats('PESO').update(pd.Series([70, None, 80])).merge(StreamingStats('PESO').update([90]))
+    >>> s.describe().to_dict()
+    {'count': 3.0, 'mean': 80.0, 'std': 10.0, 'min': 70.0, '25%': 75.0, '50%': 80.0, '75%': 85.0, 'max': 90.0}
+    '''
+    def __init__(self, name: str = None, k: int = DEFAULT_K, seed: int = None, histogram: bool = None):
+        if histogram is None:
+            histogram = name in HISTOGRAM_COLUMNS
+        self.name = name
+        self.k, self.seed = k, seed
+        self.momentos = Moments()
+        self.sketch = IntegerHistogram() if histogram else KLLSketch(k, seed)
+        self.relatorio = None
+
+    def update(self, valores, rules: Dict[str, object] = None) -> 'StreamingStats':
+        '''
+        Acrescenta um bloco. Nulos sao ignorados, como em describe(). Com
+        rules (argumentos de check_numeric), o bloco e verificado antes.
+        '''
+        serie = pd.Series(valores).dropna()
+        if rules is not None and self.relatorio is None:
+            relatorio = check_numeric(serie, **rules)
+            if not relatorio['valido']:
+                self.relatorio = relatorio
+        numeros = pd.to_numeric(serie, errors='coerce').dropna().to_numpy(dtype='float64')
+        self.momentos.update(numeros)
+        if isinstance(self.sketch, IntegerHistogram) and not fits_histogram(numeros, self.sketch):
+            self.sketch = KLLSketch.from_histogram(self.sketch, self.k, self.seed)
+        self.sketch.update(numeros)
+        return self
+
+    def merge(self, outro: 'StreamingStats') -> 'StreamingStats':
+        '''
+        Junta outro resumo a este; o relatorio de falha mais antigo prevalece.
+        Se so um dos dois usa histograma, ou se as duas faixas juntas passam
+        de MAX_WIDTH, o histograma deste resumo e convertido para KLL.
+        '''
+        self.momentos.merge(outro.momentos)
+        if isinstance(self.sketch, IntegerHistogram) and not (
+                isinstance(outro.sketch, IntegerHistogram) and fits_histogram(outro.sketch.limites(), self.sketch)):
+            self.sketch = KLLSketch.from_histogram(self.sketch, self.k, self.seed)
+        self.sketch.merge(outro.sketch)
+        if self.relatorio is None:
+            self.relatorio = outro.relatorio
+        return self
+
+    def rank_error(self) -> float:
+        '''
+        Erro de posto normalizado dos quantis (ver KLLSketch.rank_error).
+        '''
+        return self.sketch.rank_error()
+
+    def quantile_interval(self, q: float) -> tuple:
+        '''
+        Intervalo que contem o quantil exato q com 99% de confianca: os
+        valores do sketch nos postos q - erro e q + erro.
+        '''
+        erro = self.rank_error()
+        baixo, alto = self.sketch.quantile([max(q - erro, 0.0), min(q + erro, 1.0)])
+        return float(baixo), float(alto)
+
+    def describe(self) -> pd.Series:
+        '''
+        O mesmo formato de pandas.Series.describe(). O erro de posto dos
+        quartis fica em describe().attrs['erro_rank'].
+        '''
+        m = self.momentos
+        quartis = self.sketch.quantile(DESCRIBE_PERCENTILES)
+        resumo = pd.Series([float(m.n), m.media if m.n else math.nan, math.sqrt(m.variancia), m.minimo,
+                            *quartis, m.maximo],
+                           index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'],
+                           name=self.name, dtype='float64')
+        resumo.attrs['erro_rank'] = self.rank_error()
+        return resumo
+
+
+def describe_series(serie: pd.Series) -> pd.Series:
+    '''
+    describe() de uma Series em memoria. Nas colunas de HISTOGRAM_COLUMNS
+    com valores inteiros dentro de MAX_WIDTH os quartis saem de um
+    histograma de contagem, sem ordenar os valores; nas demais e o proprio
+    describe().
+
+    Example
+    -------
+    >>> describe_series(pd.Series([170, 180, 175, 160], name='ALTURA'))['50%']
+    172.5
+    '''
+    valores = serie.dropna()
+    if (serie.name in HISTOGRAM_COLUMNS and pd.api.types.is_numeric_dtype(valores.dtype)
+            and fits_histogram(valores)):
+        return StreamingStats(serie.name).update(valores).describe()
+    return serie.describe()
+
+
+def _year_stats(dataset_dir: str, ano: int, coluna: str, filters: Dict[str, list], k: int,
+                rules: Dict[str, object]) -> StreamingStats:
+    colunas = [coluna] + [col for col in filters if col != coluna]
+    df = read_dataset_year(dataset_dir, ano, colunas, filters)
+    # A semente do ano deixa o resultado reprodutivel com qualquer numero de processos.
+    return StreamingStats(coluna, k, seed=ano).update(df[coluna], rules)
+
+
+def stream_stats(source, coluna: str, workers: int = 1, k: int = DEFAULT_K,
+                 rules: Dict[str, object] = None) -> StreamingStats:
+    '''
+    Resumo em fluxo de uma coluna.
+
+    Parameters
+    ----------
+    source : str, SermilDataset, pandas.DataFrame ou iteravel de DataFrames
+        A pasta do conjunto de dados ou uma consulta (um resumo por ano,
+        lido so com a coluna), um csv lido em pedacos ou pedacos ja lidos
+        (ver analysis_utils.iter_chunks).
+
+    coluna : str
+        Coluna numerica.
+
+    workers : int, optional
+        Numero de processos para os anos do conjunto. Com 1, tudo roda no
+        processo atual.
+
+    k : int, optional
+        Tamanho do sketch de quantis.
+
+    rules : dict, optional
+        Regras de check_numeric verificadas em cada bloco.
+
+    Returns
+    -------
+    StreamingStats
+        Resumo de todos os blocos, juntado na ordem dos anos (ou pedacos).
+
+    Raises
+    ------
+    KeyError
+        Se a coluna nao existir nos dados.
+    '''
+    if isinstance(source, str) and os.path.isdir(source):
+        source = SermilDataset(source)
+    if isinstance(source, SermilDataset):
+        anos = source.years()
+        argumentos = ([source.dataset_dir] * len(anos), anos, [coluna] * len(anos),
+                      [source.filters] * len(anos), [k] * len(anos), [rules] * len(anos))
+        if workers <= 1 or len(anos) <= 1:
+            partes = list(map(_year_stats, *argumentos))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # map devolve os resumos na ordem dos anos.
+                partes = list(executor.map(_year_stats, *argumentos))
+        resultado = StreamingStats(coluna, k)
+        for parte in partes:
+            resultado.merge(parte)
+        return resultado
+    resultado = StreamingStats(coluna, k, seed=0)
+    for chunk in iter_chunks(source, [coluna]):
+        resultado.update(chunk[coluna], rules)
+    return resultado
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(verbose=True)
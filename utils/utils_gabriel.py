@@ -9,12 +9,22 @@ import os
 import matplotlib.pyplot as plt
 from matplotlib.ticker import FuncFormatter
 import numpy as np
-from .downloaddata import download_alldata
+from concurrent.futures import ProcessPoolExecutor
+from .downloaddata import refresh_alldata
+from .parquet_store import read_sermil_csv, is_fresh
+from .schema import apply_schema
+from .dataset import as_frame, dataset_dir_for, update_dataset
+from .yearstore import aggstore_dir_for
+from .aggstore import update_aggstore
+from .imcstore import IMC_LABELS, load_imc_cube, imc_percentages
+from .validation import check_numeric, raise_if_invalid
+from .catstore import count_codes
 
 
 def read_local_data(path: str, dropnull: bool = False,cols: List[str] = None):
     '''
-    Lê um arquivo csv e cria um DataFrame.
+    Lê um arquivo csv e cria um DataFrame. Se o ano já foi convertido
+    para o armazenamento Parquet (módulo parquet_store), lê de lá.
 
     Parameters
     ----------
@@ -38,11 +48,11 @@ def read_local_data(path: str, dropnull: bool = False,cols: List[str] = None):
         Se o nome do arquivo passado nao existir no repositorio.
     '''
     try:
-        if os.path.exists(path):
+        if os.path.exists(path) or is_fresh(path):
             if cols is None:
-                df = pd.read_csv(path)
+                df = read_sermil_csv(path)
             else:
-                df = pd.read_csv(path,usecols=cols)
+                df = read_sermil_csv(path,usecols=cols)
             if dropnull is True:
                 cleandf = df.dropna()
             if dropnull is False:
@@ -58,13 +68,28 @@ def read_local_data(path: str, dropnull: bool = False,cols: List[str] = None):
         return cleandf
 
 
+def _read_year(ano: int, dropna: bool, cols: List[str]):
+    '''
+    Le o 'sermil{ano}.csv' como save_data_in_list sempre leu: com cols, as
+    linhas nulas nao sao removidas. E a unidade de trabalho dos processos.
+    '''
+    arquivo_csv = f'sermil{ano}.csv'
+    if cols is None:
+        return read_local_data(arquivo_csv, dropnull=dropna)
+    return read_local_data(arquivo_csv, cols=cols)
+
+
 #Importante: Essa função serve apenas para guardar os dataframes em uma lista para facilitar a maniupalção.
-def save_data_in_list(dropna: bool = False,cols: List[str] = None):
+def save_data_in_list(dropna: bool = False,cols: List[str] = None, workers: int = 1):
     '''
     Lê arquivos CSV dos anos de 2007 a 2022 e armazena os DataFrames em uma lista.
     Note que essa funcao apenas serve se o nome dos csvs forem compativeis com o formato
     'sermil{ano}.csv' e todos eles estiverem baixados no repositorio.
 
+    Com workers maior que 1 os anos sao lidos ao mesmo tempo em processos
+    separados, ja que o parse de um csv e limitado pela CPU. A lista
+    devolvida e a mesma da leitura em serie, na ordem dos anos.
+
     Parameters
     ----------
     cols : list
@@ -73,6 +98,10 @@ def save_data_in_list(dropna: bool = False,cols: List[str] = None):
     dropna : bool
         Se True dropa as linhas nulas dos datasets da lista, se False, não dropa. 
 
+    workers : int, optional
+        Numero maximo de anos lidos simultaneamente. Por padrao 1. Se houver
+        apenas um arquivo, a leitura e sempre feita no proprio processo.
+
     Returns
     -------
     dataframes : list
@@ -81,28 +110,19 @@ def save_data_in_list(dropna: bool = False,cols: List[str] = None):
         você pode usar dataframes[0], para 'sermil2008.csv', use dataframes[1],
         e assim por diante.
     '''
-    # Lista para armazenar os DataFrames
-    dataframes = []
+    anos = list(range(2007, 2023))
     try:
-        # Loop para ler os arquivos CSV e armazenar os DataFrames especicos do trabalho.
-        if cols is None:
-            for ano in range(2007, 2023):
-                arquivo_csv = f'sermil{ano}.csv'
-                if dropna is False:
-                    df = read_local_data(arquivo_csv)
-                    if df is not None:
-                        dataframes.append(df)
-                if dropna is True:
-                    df = read_local_data(arquivo_csv, dropnull=True)
-                    if df is not None:
-                        dataframes.append(df)                
+        # Nunca cria mais processos do que arquivos disponiveis.
+        disponiveis = [ano for ano in anos if os.path.exists(f'sermil{ano}.csv') or is_fresh(f'sermil{ano}.csv')]
+        workers = max(1, min(int(workers), len(disponiveis)))
+        if workers == 1:
+            lidos = [_read_year(ano, dropna, cols) for ano in anos]
         else:
-            for ano in range(2007, 2023):
-                arquivo_csv = f'sermil{ano}.csv'
-                df = read_local_data(arquivo_csv, cols=cols)
-            
-                if df is not None:
-                    dataframes.append(df)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # map devolve os DataFrames na ordem dos anos, nao na ordem de conclusao.
+                lidos = list(executor.map(_read_year, anos, [dropna] * len(anos), [cols] * len(anos)))
+        # Lista para armazenar os DataFrames
+        dataframes = [df for df in lidos if df is not None]
     except Exception as e:
         print("O erro é:",str(e))
         return None
@@ -163,6 +183,8 @@ def df_allyears(data_list: list):
         return None
     else:
         df_concatenado = pd.concat(data_list, ignore_index=True)
+        # Categorias diferentes entre os anos viram texto no concat, entao o esquema e reaplicado.
+        df_concatenado = apply_schema(df_concatenado, inplace=True)
     return df_concatenado
 
 
@@ -173,8 +195,9 @@ def create_imc(df, height_colname: str, weight_colname: str):
     
     Parameters
     ----------
-    df : pandas.DataFrame
-        Tabela que tenha colunas de altura e peso.
+    df : pandas.DataFrame or SermilDataset
+        Tabela que tenha colunas de altura e peso. Uma consulta
+        (modulo dataset) e executada antes.
     
     height_colname : str
         Nome da coluna do DataFrame que representa a altura.
@@ -204,15 +227,16 @@ def create_imc(df, height_colname: str, weight_colname: str):
     2        55       1.50  24.444444
     3        90       1.80  27.777778
     '''
+    df = as_frame(df)
     try:
-        for valor in df[height_colname]:
-            assert isinstance(valor, (int, float)), f"Erro, elementos da coluna {height_colname} não são números."
-            assert valor != 0, "Erro, altura não pode ser zero."
-            assert valor > 0, "Erro, altura deve ser maior que zero."
-        for valor in df[weight_colname]:
-            assert isinstance(valor, (int, float)), f"Erro, elementos da {weight_colname} não são números."
-            assert valor != 0, "Erro, peso não pode ser zero."
-            assert valor > 0, "Erro, peso deve ser maior que zero."
+        raise_if_invalid(check_numeric(df[height_colname], nonzero=True, positive=True),
+                         {'tipo': f"Erro, elementos da coluna {height_colname} não são números.",
+                          'zero': "Erro, altura não pode ser zero.",
+                          'positivo': "Erro, altura deve ser maior que zero."})
+        raise_if_invalid(check_numeric(df[weight_colname], nonzero=True, positive=True),
+                         {'tipo': f"Erro, elementos da {weight_colname} não são números.",
+                          'zero': "Erro, peso não pode ser zero.",
+                          'positivo': "Erro, peso deve ser maior que zero."})
     except AssertionError as erro:
         print(erro)
         return None
@@ -228,6 +252,7 @@ def create_imc(df, height_colname: str, weight_colname: str):
 def percentage_value_counts(series):
     '''
     Mostra a porcentagem que cada valor de uma serie panda representa do total.
+    Series categoricas (como as do modulo catstore) sao contadas pelos codigos.
 
     Parameters
     ----------
@@ -274,6 +299,9 @@ def percentage_value_counts(series):
         print(erro)
         return None
     else:
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Conta direto pelos codigos inteiros, sem comparar os textos.
+            return pd.DataFrame({'PORCENTAGEM': count_codes(series)/series_count})
         categories_count = series.value_counts()
         df = pd.DataFrame(categories_count)
         df['PORCENTAGEM'] = df[nome]/series_count
@@ -309,51 +337,83 @@ def percentage_formatter(x, pos):
     return f'{x*100:.0f}%'
 
 
-# Pasta com os arquivos para esta vis está adicionada no GitHub. Basta arrasta-los para a pasta ANALISES.
-def bar_plot_imc():
-    '''
-    Funcao que cria a visualizacao para a analise do IMC. Note que ela 
-    baixa os arquivos para vis caso necessario.
+# Colunas baixadas para a analise do IMC.
+IMC_COLUMNS = ['PESO', 'ALTURA', 'DISPENSA', 'UF_RESIDENCIA']
+
+
+def update_imc_data(folder: str = '.', workers: int = 1) -> List[int]:
     '''
-    # Baixa os dados caso nao estejam baixados localmente(demora pra baixar).
-    download_alldata(['PESO','ALTURA','DISPENSA'])
+    Baixa, quando necessario, os csvs usados por bar_plot_imc para a pasta
+    folder e atualiza o conjunto de dados (modulo dataset) e o cubo de
+    contagens por ano, UF_RESIDENCIA, DISPENSA e categoria de IMC (modulo
+    imcstore) apenas nos anos novos ou alterados.
+
+    O download usa o manifesto de refresh_alldata: um csv baixado antes sem
+    alguma das colunas de IMC_COLUMNS (por exemplo sem UF_RESIDENCIA) e
+    baixado de novo, e o seu ano e refeito no cubo.
+
+    Parameters
+    ----------
+    folder : str, optional
+        Pasta dos 'sermil{ano}.csv', por padrao a pasta atual.
 
-    # Lista com os dfs de cada ano.
-    dfs = save_data_in_list()
+    workers : int, optional
+        Numero de anos baixados, e de processos que fazem o parse dos anos
+        novos, ao mesmo tempo.
 
-    # Data Frame que concatenou todos os anos.
-    df = df_allyears(dfs)
+    Returns
+    -------
+    List[int]
+        Anos refeitos no cubo de IMC.
+    '''
+    # Baixa os dados caso nao estejam baixados localmente(demora pra baixar).
+    _, falhas = refresh_alldata(IMC_COLUMNS, workers=workers, folder=folder)
+    for ano, motivo in sorted(falhas.items()):
+        print(f'Erro: sermil{ano}.csv nao foi baixado ({motivo}).')
 
-    # Novo Data Frame com a coluna imc e a altura em metros.
-    df = create_imc(df, 'ALTURA', 'PESO')
+    dataset_dir = dataset_dir_for(folder)
+    update_dataset(folder, dataset_dir, workers=workers)
+    return update_aggstore(dataset_dir, aggstore_dir_for(dataset_dir))
 
-    # Dividiu se em uma tabela para os dispensados e outra para os que nao foram.
-    dispensados = df[df['DISPENSA'] == 'Com dispensa']
-    recrutados = df[df['DISPENSA'] == 'Sem dispensa']
 
-    # Duas séries pandas para visualização.
-    serie_dispensados = dispensados.loc[:,'IMC']
-    serie_recrutados = recrutados.loc[:,'IMC']
+# Pasta com os arquivos para esta vis está adicionada no GitHub. Basta arrasta-los para a pasta ANALISES.
+def bar_plot_imc(anos: List[int] = None, ufs: List[str] = None, folder: str = '.'):
+    '''
+    Funcao que cria a visualizacao para a analise do IMC.
 
-    # De acordo com a tabela de IMC ha 6 grupos diferentes de IMCs.
-    intervalo = [0, 18.5, 24.9, 29.9, 34.9, 39.9, float('inf')]
-    rotulos = ['Abaixo do peso', 'Peso normal', 'Sobrepeso', 'Obesidade grau I', 'Obesidade grau II', 'Obesidade grau III']
+    O grafico e desenhado apenas a partir do cubo de IMC guardado ao lado
+    do conjunto de dados da pasta folder (ver update_imc_data, que baixa e
+    carrega os dados), entao filtrar anos ou UFs nao rele nem baixa nada.
 
-    # Serie panda que substitui o valor do imc pela categoria que ele se encontra.
-    dispensados_categorizado_imc = pd.cut(serie_dispensados, bins=intervalo, labels=rotulos)
-    recrutados_categorizado_imc = pd.cut(serie_recrutados, bins=intervalo, labels=rotulos)
+    Parameters
+    ----------
+    anos : List[int], optional
+        Anos considerados. Se None, todos.
 
-    # Conta os valores em cada categoria e ve a porcentagem em relação ao total de dispensados e recrutados respectivamente.
-    contagem_intervalos_dispensados = percentage_value_counts(dispensados_categorizado_imc)
-    contagem_intervalos_recrutados = percentage_value_counts(recrutados_categorizado_imc)
+    ufs : List[str], optional
+        Siglas das UFs de residencia consideradas. Se None, todas.
 
-    # Coloca a serie na ordem da tabela de IMC
-    contagem_intervalos_dispensados_reordenado =contagem_intervalos_dispensados.reindex(rotulos)
-    contagem_intervalos_recrutados_reordenado =contagem_intervalos_recrutados.reindex(rotulos)
+    folder : str, optional
+        Pasta dos 'sermil{ano}.csv' passada a update_imc_data, por padrao
+        a pasta atual.
 
-    # Os valores da coluna PORCENTAGEM de cada data frame já ordenado
-    porcentagens_dispensados = contagem_intervalos_dispensados_reordenado['PORCENTAGEM']
-    porcentagens_recrutados = contagem_intervalos_recrutados_reordenado['PORCENTAGEM']
+    Raises
+    ------
+    ValueError
+        Se o cubo nao tiver nenhum dos anos pedidos, ou se ufs for
+        informado e algum desses anos nao tiver UF_RESIDENCIA.
+    '''
+    cubo = load_imc_cube(aggstore_dir_for(dataset_dir_for(folder)), anos, ufs)
+    if cubo.empty:
+        raise ValueError(f'O cubo de IMC de {folder} nao tem dados dos anos e UFs pedidos; '
+                         'rode update_imc_data antes.')
+
+    # Porcentagem de cada categoria de IMC entre dispensados e recrutados, na ordem da tabela de IMC.
+    rotulos = IMC_LABELS
+    porcentagens = imc_percentages(cubo)
+    porcentagens = porcentagens.reindex(columns=['Com dispensa', 'Sem dispensa'], fill_value=0)
+    porcentagens_dispensados = porcentagens['Com dispensa']
+    porcentagens_recrutados = porcentagens['Sem dispensa']
 
     # Largura das barras do gráfico
     largura_barra = 0.23
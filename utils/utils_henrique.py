@@ -1,5 +1,14 @@
+import re
 import pandas as pd
+import numpy as np
 import datetime
+try:
+    from .parquet_store import read_sermil_csv, peek_columns
+    from .dataset import as_frame
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    from parquet_store import read_sermil_csv, peek_columns
+    from dataset import as_frame
 
 # Funções para preparar o dataframe pra visualização
 class EmptyFileError(Exception):
@@ -22,6 +31,8 @@ def take_data(csv_file, columns):
     -------
     novo_df : pandas.core.frame.DataFrame
         Retorna um DataFrame contendo apenas as colunas desejadas do arquivo CSV.
+        A validação lê só o cabeçalho e a primeira linha; depois apenas as
+        colunas pedidas são lidas.
         
     Raises
     ------
@@ -55,14 +66,15 @@ def take_data(csv_file, columns):
     """
     import pandas as pd
     try:
-        df = pd.read_csv(csv_file, encoding='utf-8')
+        colunas_arquivo, tem_linhas = peek_columns(csv_file, encoding='utf-8')
 
-        if df.empty:
+        if not tem_linhas:
             raise EmptyFileError(f"O arquivo CSV '{csv_file}' está vazio.")
 
-        if not set(columns).issubset(df.columns):
+        if not set(columns).issubset(colunas_arquivo):
             raise NonexistentColumnsError("Algumas das colunas especificadas não existem no arquivo CSV.")
 
+        df = read_sermil_csv(csv_file, usecols=list(dict.fromkeys(columns)), encoding='utf-8')
         novo_df = df[columns]
 
         return novo_df
@@ -75,17 +87,24 @@ def take_data(csv_file, columns):
 
     
 
+# Tipos inferidos (pandas.api.types.infer_dtype) aceitos pelo acessor .str do pandas.
+_TEXT_INFERRED_TYPES = ('string', 'empty', 'bytes', 'mixed', 'mixed-integer')
+
 def transform_column(df, coluna, transform_dict):
     """
     Parameters
     ----------
-    df : pandas.core.frame.DataFrame
-        Recebe um dataframe que terá colunas transformadas.
+    df : pandas.core.frame.DataFrame or SermilDataset
+        Recebe um dataframe que terá colunas transformadas. Uma consulta
+        (módulo dataset) é executada antes.
     coluna : str
         Recebe o nome da coluna que queremos transformar.
     transform_dict : dict
         Recebe um dicionário com as chaves sendo itens a serem tranformados, e 
-        os valores sendo a transformação.
+        os valores sendo a transformação. Cada valor distinto da coluna é
+        resolvido uma única vez: vale a primeira chave que aparece nele, na
+        ordem do dicionário. Se a coluna for categórica, só as categorias
+        são transformadas e os códigos são remapeados.
 
     Returns
     -------
@@ -114,21 +133,66 @@ def transform_column(df, coluna, transform_dict):
     
     """
 
+    df = as_frame(df)
     if coluna not in df.columns:
         raise KeyError(f"A coluna '{coluna}' não existe no DataFrame.")
 
-    for original, transformado in transform_dict.items():
-        df[coluna] = df[coluna].str.replace('.*' + original + '.*', transformado, regex=True)
+    if not transform_dict:
+        return df
+
+    serie = df[coluna]
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Transforma so o vocabulario e remapeia os codigos inteiros.
+        traducao, novas = pd.factorize(pd.Series(_transform_values(serie.cat.categories, transform_dict),
+                                                 dtype=object))
+        codigos = serie.cat.codes.to_numpy()
+        codigos = np.where(codigos >= 0, traducao[codigos], -1)
+        df[coluna] = pd.Categorical.from_codes(codigos, categories=novas)
+        return df
 
+    if pd.api.types.infer_dtype(serie, skipna=True) not in _TEXT_INFERRED_TYPES:
+        # Mesmo erro do .str.replace da versao anterior para colunas que nao sao de texto.
+        raise AttributeError("Can only use .str accessor with string values!")
+    # Cada valor distinto e resolvido uma vez e o resultado e espalhado pelos codigos.
+    codigos, unicos = pd.factorize(serie)
+    mapeados = np.array(_transform_values(unicos, transform_dict), dtype=object)
+    resultado = serie.to_numpy(dtype=object).copy()
+    validos = codigos >= 0
+    resultado[validos] = mapeados[codigos[validos]]
+    novo = pd.Series(resultado, index=serie.index, name=coluna)
+    if serie.dtype != object:
+        novo = novo.astype(serie.dtype)
+    df[coluna] = novo
     return df
 
+def _transform_values(valores, transform_dict) -> list:
+    """
+    Aplica transform_dict a uma lista de valores distintos. Para cada valor
+    vale a primeira chave (na ordem do dicionário) cuja expressão aparece
+    nele, e o valor inteiro é substituído; valores que não são texto viram
+    NaN, como no .str.replace.
+    """
+    padroes = [(re.compile('.*' + original + '.*'), transformado)
+               for original, transformado in transform_dict.items()]
+    resultado = []
+    for valor in valores:
+        if not isinstance(valor, str):
+            resultado.append(np.nan)
+            continue
+        for padrao, transformado in padroes:
+            if padrao.search(valor):
+                valor = padrao.sub(transformado, valor)
+                break
+        resultado.append(valor)
+    return resultado
+
 def calculate_age(df, birthyear_column):
     """
     Calcula a idade com base no ano de nascimento e cria uma nova coluna.
 
     Parameters
     ----------
-    df : pandas.core.frame.DataFrame
+    df : pandas.core.frame.DataFrame or SermilDataset
         O DataFrame que contém os dados.
     birthyear_column : str
         O nome da coluna que contém o ano de nascimento.
@@ -154,6 +218,7 @@ def calculate_age(df, birthyear_column):
     import datetime
     try:
         current_year = datetime.datetime.now().year
+        df = as_frame(df)
         df['Idade'] = current_year - df[birthyear_column]
         return df
     except KeyError as e:
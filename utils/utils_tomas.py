@@ -10,12 +10,31 @@ import geopandas as gpd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+try:
+    from .download_data_tomas import STATE_LAYER, state_layer_path, extract_state_layer
+    from .dataset import as_frame, SermilDataset
+    from .analysis_utils import iter_chunks
+    from .validation import check_numeric, raise_if_invalid
+    from .streamstats import stream_stats, describe_series
+    from .covariance import CovarianceAccumulator, stream_covariance
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    from download_data_tomas import STATE_LAYER, state_layer_path, extract_state_layer
+    from dataset import as_frame, SermilDataset
+    from analysis_utils import iter_chunks
+    from validation import check_numeric, raise_if_invalid
+    from streamstats import stream_stats, describe_series
+    from covariance import CovarianceAccumulator, stream_covariance
 
 
 def get_state_coordinates(path: str, dropnull: bool = False) -> gpd.GeoDataFrame:
     '''
     Lê um arquivo gpkg e cria um GeoDataFrame.
 
+    Apenas a camada dos estados é usada. Na primeira leitura ela é extraída
+    para um arquivo compacto ao lado do gpkg (ver extract_state_layer), e as
+    leituras seguintes usam esse arquivo em vez do geopackage completo.
+
     Parameters
     ----------
     path: str
@@ -41,9 +60,16 @@ def get_state_coordinates(path: str, dropnull: bool = False) -> gpd.GeoDataFrame
     '''
 
     try:
+        compact_path = state_layer_path(path)
+        if os.path.exists(path) and (not os.path.exists(compact_path)
+                                     or os.path.getmtime(path) > os.path.getmtime(compact_path)):
+            # Extração única da camada dos estados (refeita se o gpkg for mais novo).
+            extract_state_layer(path, compact_path)
+        if os.path.exists(compact_path):
+            path = compact_path
         if os.path.exists(path):
             # Lê o arquivo GeoPackage no caminho especificado.
-            geobrazil_df = gpd.read_file(path, layer="lim_unidade_federacao_a")
+            geobrazil_df = gpd.read_file(path, layer=STATE_LAYER)
             geobrazil_df.rename({"sigla": "UF_RESIDENCIA"},
                                 axis=1, inplace=True)
         else:
@@ -103,6 +129,8 @@ def merge_height_geography_df(army_df: pd.DataFrame, height_colname: str, state_
     True
     '''
 
+    # Uma consulta (modulo dataset) e lida so com as colunas usadas.
+    army_df = as_frame(army_df, [height_colname, state_colname])
     try:
         if height_colname not in army_df.columns:
             # Verifica se a coluna de altura existe no DataFrame.
@@ -127,12 +155,11 @@ def merge_height_geography_df(army_df: pd.DataFrame, height_colname: str, state_
     army_df = army_df.dropna(subset=[height_colname])
 
     try:
-        for val in army_df[height_colname]:
-            # Verifica se os valores na coluna de altura são números válidos.
-            assert isinstance(
-                val, (int, float)), f"Erro, elementos da coluna {height_colname} não são números"
-            assert val != 0, "Erro, altura não pode ser zero"
-            assert val > 0, "Erro, altura deve ser maior que zero."
+        # Verifica se os valores na coluna de altura são números válidos.
+        raise_if_invalid(check_numeric(army_df[height_colname], nonzero=True, positive=True),
+                         {'tipo': f"Erro, elementos da coluna {height_colname} não são números",
+                          'zero': "Erro, altura não pode ser zero",
+                          'positivo': "Erro, altura deve ser maior que zero."})
     except AssertionError as error:
         # Lida com exceções de assert.
         print(error)
@@ -217,17 +244,16 @@ def create_height_heatmap(merged_army_height_df: pd.DataFrame, height_colname: s
     merged_army_height_df = merged_army_height_df.dropna(
         subset=[height_colname])
 
-    for valor in merged_army_height_df[height_colname]:
-        try:
-            # Verifica se os valores na coluna de altura são números válidos.
-            assert isinstance(
-                valor, (int, float)), f"Erro, elementos da coluna {height_colname} não são números"
-            assert valor != 0, "Erro, altura não pode ser zero"
-            assert valor > 0, "Erro, altura deve ser maior que zero."
-        except AssertionError as error:
-            # Lida com exceções de assert.
-            print(error)
-            return None
+    try:
+        # Verifica se os valores na coluna de altura são números válidos.
+        raise_if_invalid(check_numeric(merged_army_height_df[height_colname], nonzero=True, positive=True),
+                         {'tipo': f"Erro, elementos da coluna {height_colname} não são números",
+                          'zero': "Erro, altura não pode ser zero",
+                          'positivo': "Erro, altura deve ser maior que zero."})
+    except AssertionError as error:
+        # Lida com exceções de assert.
+        print(error)
+        return None
 
     try:
         # Cria um mapa de calor.
@@ -250,16 +276,25 @@ def create_height_heatmap(merged_army_height_df: pd.DataFrame, height_colname: s
         return False
 
 
-def get_stats(army_df: pd.DataFrame, numeric_colname: str) -> pd.Series:
+def get_stats(army_df: pd.DataFrame, numeric_colname: str, workers: int = 1) -> pd.Series:
     '''
     Realiza análise estatística de uma coluna em um DataFrame.
 
+    Com a pasta do conjunto de dados, um SermilDataset ou pedaços de
+    DataFrame, as estatísticas são calculadas em fluxo (ver streamstats),
+    sem carregar todos os anos. Nas medidas inteiras (ALTURA, PESO, CINTURA,
+    CABECA, CALCADO) os quartis vêm de histogramas de contagem e são exatos,
+    também para DataFrames; nas demais colunas vêm de um sketch KLL, e o
+    erro de posto normalizado fica em result.attrs['erro_rank'].
+
     Parameters
     ----------
     army_df: pd.DataFrame
         # DataFrame com dados do alistamento militar.
     numeric_colname : str
         # Nome da coluna no DataFrame com dados numéricos.
+    workers : int
+        # Número de processos usados nos anos do conjunto de dados.
 
     Returns
     -------
@@ -279,6 +314,9 @@ def get_stats(army_df: pd.DataFrame, numeric_colname: str) -> pd.Series:
     True
     '''
 
+    if not isinstance(army_df, pd.DataFrame):
+        return _stream_get_stats(army_df, numeric_colname, workers)
+
     army_df = army_df.dropna(subset=[numeric_colname])
 
     try:
@@ -292,12 +330,11 @@ def get_stats(army_df: pd.DataFrame, numeric_colname: str) -> pd.Series:
         return None
 
     try:
-        for val in army_df[numeric_colname]:
-            # Verifica se os valores na coluna numérica são números válidos.
-            assert isinstance(
-                val, (int, float)), f"Erro, elementos da coluna {numeric_colname} não são números"
-            assert val != 0, "Erro, valor não pode ser zero"
-            assert val > 0, "Erro, valor deve ser maior que zero."
+        # Verifica se os valores na coluna numérica são números válidos.
+        raise_if_invalid(check_numeric(army_df[numeric_colname], nonzero=True, positive=True),
+                         {'tipo': f"Erro, elementos da coluna {numeric_colname} não são números",
+                          'zero': "Erro, valor não pode ser zero",
+                          'positivo': "Erro, valor deve ser maior que zero."})
     except AssertionError as error:
         # Lida com exceções assert.
         print(error)
@@ -308,8 +345,8 @@ def get_stats(army_df: pd.DataFrame, numeric_colname: str) -> pd.Series:
         return None
     else:
         try:
-            # Calcula estatísticas da coluna numérica.
-            col_summary = army_df[numeric_colname].describe()
+            # Calcula estatísticas da coluna numérica; medidas inteiras usam histograma de contagem.
+            col_summary = describe_series(army_df[numeric_colname])
         except Exception as e:
             # Lida com exceções gerais.
             print('Um erro ocorreu: ', str(e))
@@ -318,17 +355,48 @@ def get_stats(army_df: pd.DataFrame, numeric_colname: str) -> pd.Series:
             return col_summary
 
 
+def _stream_get_stats(source, numeric_colname: str, workers: int) -> pd.Series:
+    # Mesmas regras e mensagens de get_stats, verificadas em cada ano ou pedaço.
+    try:
+        stats = stream_stats(source, numeric_colname, workers=workers,
+                             rules={'nonzero': True, 'positive': True})
+    except KeyError:
+        print("Erro: ", "A seguinte coluna não existe no DataFrame: ", numeric_colname)
+        return None
+    if stats.relatorio is not None:
+        try:
+            raise_if_invalid(stats.relatorio,
+                             {'tipo': f"Erro, elementos da coluna {numeric_colname} não são números",
+                              'zero': "Erro, valor não pode ser zero",
+                              'positivo': "Erro, valor deve ser maior que zero."})
+        except AssertionError as error:
+            print(error)
+            return None
+    return stats.describe()
+
+
 
-def create_correlation_matrix(army_df: pd.DataFrame, hum_measures_list: List[str]) -> bool:
+def create_correlation_matrix(army_df: pd.DataFrame, hum_measures_list: List[str], uf: str = None,
+                              workers: int = 1) -> bool:
     '''
     Cria uma matriz de correlação para medidas físicas humanas.
 
+    A matriz vem de um CovarianceAccumulator (ver covariance), que descarta
+    os nulos par a par, como DataFrame.corr(): o resultado é o mesmo para um
+    DataFrame, para pedaços dele ou para a pasta do conjunto de dados. Com a
+    pasta ou um SermilDataset todos os anos são acumulados em uma passagem,
+    um ano por processo, sem carregar os dados na memória.
+
     Parameters
     ----------
     army_df: pd.DataFrame
         # DataFrame com dados de medidas físicas humanas.
     hum_measures_list : List[str]
         # Lista de colunas no DataFrame representando medidas físicas.
+    uf : str
+        # Se informada, usa apenas as linhas com essa UF_RESIDENCIA.
+    workers : int
+        # Número de processos usados nos anos do conjunto de dados.
 
     Returns
     -------
@@ -343,10 +411,13 @@ def create_correlation_matrix(army_df: pd.DataFrame, hum_measures_list: List[str
     True
     '''
 
+    if not isinstance(army_df, pd.DataFrame):
+        return _stream_correlation_matrix(army_df, hum_measures_list, uf, workers)
+
     try:
-        for elem in hum_measures_list:
+        for elem in list(hum_measures_list) + ([] if uf is None else ['UF_RESIDENCIA']):
             if elem not in army_df.columns:
-                # Verifica se as colunas da lista existem no DataFrame.
+                # Verifica se as colunas da lista (e a de UF, se usada) existem no DataFrame.
                 raise KeyError(
                     "A seguinte coluna não existe no DataFrame: ", elem)
     except KeyError as ke:
@@ -354,28 +425,44 @@ def create_correlation_matrix(army_df: pd.DataFrame, hum_measures_list: List[str
         print('Erro: ', str(ke))
         return None
 
-    army_df = army_df.dropna(subset=hum_measures_list)
-    filtered_army_df = army_df[hum_measures_list]
+    # O DataFrame e um unico pedaço: mesmo filtro de UF, regras e descarte de nulos par a par.
+    return _stream_correlation_matrix(army_df, hum_measures_list, uf, workers)
 
-    for col in hum_measures_list:
+
+def _stream_correlation_matrix(source, hum_measures_list: List[str], uf: str, workers: int) -> bool:
+    # Mesmas regras e mensagens de create_correlation_matrix, verificadas em cada ano ou pedaço.
+    if uf is not None:
+        # A UF vira filtro da leitura: só as linhas dessa UF são acumuladas e validadas.
+        if isinstance(source, str) and os.path.isdir(source):
+            source = SermilDataset(source)
+        if isinstance(source, SermilDataset):
+            source = source.where(UF_RESIDENCIA=uf)
+        else:
+            source = (chunk[chunk['UF_RESIDENCIA'] == uf]
+                      for chunk in iter_chunks(source, list(hum_measures_list) + ['UF_RESIDENCIA']))
+    try:
+        total, _ = stream_covariance(source, hum_measures_list, workers=workers,
+                                     rules={'nonzero': True, 'positive': True})
+    except KeyError as ke:
+        print('Erro: ', str(ke))
+        return None
+    if total.relatorio is not None:
+        coluna = total.relatorio['coluna']
         try:
-            for val in army_df[col]:
-                # Verifica se os valores nas colunas são números válidos.
-                assert isinstance(
-                    val, (int, float)), f"Erro, elementos da coluna {col} não são números"
-                assert val != 0, "As medidas físicas humanas não podem ser iguais a zero."
-                assert val > 0, "As medidas físicas humanas não podem ser menores ou iguais a zero."
+            raise_if_invalid(total.relatorio,
+                             {'tipo': f"Erro, elementos da coluna {coluna} não são números",
+                              'zero': "As medidas físicas humanas não podem ser iguais a zero.",
+                              'positivo': "As medidas físicas humanas não podem ser menores ou iguais a zero."})
         except AssertionError as error:
-            # Lida com exceções de assert.
             print(error)
             return None
-        except Exception as e:
-            # Lida com exceções genéricas.
-            print("Ocorreu um erro: ", str(e))
-            return None
+    return _plot_correlation_matrix(total)
+
 
+def _plot_correlation_matrix(acumulador: CovarianceAccumulator) -> bool:
+    # Heatmap da matriz de correlação já acumulada.
     try:
-        corr_matrix = filtered_army_df.corr().round(2)
+        corr_matrix = acumulador.corr().round(2)
         cmap = sns.diverging_palette(240, 10, s=150, l=40, n=250)
         fig, ax = plt.subplots(figsize=(12, 10))
         sns.heatmap(
@@ -426,16 +513,18 @@ def get_age(army_df: pd.DataFrame, birth_date_colname: str) -> pd.DataFrame:
     True
     '''
 
+    army_df = as_frame(army_df, [birth_date_colname])
     current_year = dt.datetime.today().year
-    age_list = []
 
     try:
-        for birth_date in army_df[birth_date_colname]:
-            # Verifica se os valores na coluna de data de nascimento tão de acordo com as restrições.
-            assert isinstance(
-                birth_date, (int, float)), f"Erro, elementos da coluna {birth_date_colname} não são números"
-            assert birth_date > 1920, "Erro, data de nascimento deve ser maior que 1920."
-            age_list.append(current_year - birth_date)
+        # Verifica se os valores na coluna de data de nascimento tão de acordo com as restrições.
+        raise_if_invalid(check_numeric(army_df[birth_date_colname], greater_than=1920),
+                         {'tipo': f"Erro, elementos da coluna {birth_date_colname} não são números",
+                          'minimo': "Erro, data de nascimento deve ser maior que 1920."})
+        # Inteiros continuam inteiros, como na lista calculada valor a valor.
+        serie = army_df[birth_date_colname]
+        tipo = 'int64' if pd.api.types.is_integer_dtype(serie.dtype) else 'float64'
+        idades = current_year - serie.to_numpy(dtype=tipo)
     except AssertionError as error:
         # Lida com exceções de assert.
         print(error)
@@ -446,7 +535,7 @@ def get_age(army_df: pd.DataFrame, birth_date_colname: str) -> pd.DataFrame:
         return None
     else:
         # Cria um DataFrame com a idade calculada.
-        army_age_df = pd.DataFrame(age_list, columns=['IDADE'])
+        army_age_df = pd.DataFrame({'IDADE': idades})
         return army_age_df
 
 
@@ -474,12 +563,11 @@ def create_age_histogram(army_age_df: pd.DataFrame) -> bool:
     '''
 
     try:
-        for val in army_age_df['IDADE']:
-            # Verifica se os valores na coluna 'IDADE' são números válidos.
-            assert isinstance(
-                val, (int, float)), f"Erro, elementos da coluna {'IDADE'} não são números"
-            assert val != 0, "A idade não pode ser igual a zero."
-            assert val > 0, "A idade deve ser maior que zero."
+        # Verifica se os valores na coluna 'IDADE' são números válidos.
+        raise_if_invalid(check_numeric(army_age_df['IDADE'], nonzero=True, positive=True),
+                         {'tipo': f"Erro, elementos da coluna {'IDADE'} não são números",
+                          'zero': "A idade não pode ser igual a zero.",
+                          'positivo': "A idade deve ser maior que zero."})
     except AssertionError as error:
         # Lida com exceções de assert.
         print(error)
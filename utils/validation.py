@@ -0,0 +1,136 @@
+'''
+Validacao vetorizada das colunas numericas usadas nas analises.
+
+As funcoes de analise verificavam cada valor com um laco for, isinstance e
+assert. Aqui as mesmas regras (tipo numerico, diferente de zero, maior que
+zero, maior que um limite) sao avaliadas de uma vez com operacoes do NumPy,
+e o resultado e um relatorio com as contagens por regra e uma amostra das
+linhas rejeitadas. Cada linha e atribuida a primeira regra que ela viola,
+na mesma ordem dos asserts antigos, e raise_if_invalid levanta o
+AssertionError com a mensagem da regra violada pela primeira linha
+rejeitada, como o laco fazia.
+'''
+
+import numpy as np
+import pandas as pd
+from typing import Dict
+
+# Regras na ordem em que sao avaliadas para cada valor.
+RULES = ['tipo', 'zero', 'positivo', 'minimo']
+
+
+def _numeric_values(serie: pd.Series):
+    '''
+    Devolve (valores em float64, mascara dos valores de tipo numerico). Um
+    valor e numerico nas mesmas condicoes de isinstance(valor, (int, float,
+    np.number)) aplicado aos elementos da serie.
+    '''
+    dtype = serie.dtype
+    if not isinstance(dtype, pd.CategoricalDtype) and pd.api.types.is_numeric_dtype(dtype):
+        if pd.api.types.is_extension_array_dtype(dtype):
+            # Colunas que aceitam nulos devolvem pd.NA, que nao e um numero.
+            tipo_ok = ~serie.isna().to_numpy()
+            return serie.to_numpy(dtype='float64', na_value=np.nan), tipo_ok
+        return serie.to_numpy(dtype='float64'), np.ones(len(serie), dtype=bool)
+    # Colunas de objetos: apenas aqui cada elemento precisa ser inspecionado.
+    tipo_ok = np.fromiter((isinstance(valor, (int, float, np.number)) for valor in serie),
+                          dtype=bool, count=len(serie))
+    valores = pd.to_numeric(pd.Series(np.asarray(serie, dtype=object)).where(tipo_ok), errors='coerce')
+    return valores.to_numpy(dtype='float64'), tipo_ok
+
+
+def check_numeric(serie: pd.Series, nonzero: bool = False, positive: bool = False,
+                  greater_than: float = None, sample: int = 5) -> dict:
+    '''
+    Verifica em bloco as regras de uma coluna numerica.
+
+    Parameters
+    ----------
+    serie : pandas.Series
+        Valores a verificar.
+
+    nonzero : bool, optional
+        Rejeita valores iguais a zero (regra 'zero').
+
+    positive : bool, optional
+        Rejeita valores que nao sejam maiores que zero, inclusive NaN
+        (regra 'positivo').
+
+    greater_than : float, optional
+        Rejeita valores que nao sejam maiores que o limite, inclusive NaN
+        (regra 'minimo').
+
+    sample : int, optional
+        Numero maximo de linhas rejeitadas na amostra do relatorio.
+
+    Returns
+    -------
+    dict
+        'coluna', 'linhas', 'valido', 'falhas' (regra -> numero de linhas),
+        'primeira' (regra violada pela primeira linha rejeitada, ou None) e
+        'amostra' (DataFrame com indice, VALOR e REGRA das primeiras linhas
+        rejeitadas).
+
+    Example
+    -------
+    >>> relatorio = check_numeric(pd.Series([170, 0, -5, 180, 0]), nonzero=True, positive=True)
+    >>> relatorio['valido'], relatorio['falhas'], relatorio['primeira']
+    (False, {'tipo': 0, 'zero': 2, 'positivo': 1, 'minimo': 0}, 'zero')
+    >>> relatorio['amostra']['REGRA'].tolist()
+    ['zero', 'positivo', 'zero']
+    '''
+    valores, tipo_ok = _numeric_values(serie)
+    # Codigo da primeira regra violada por linha (0 = valida). As regras sao
+    # aplicadas da ultima para a primeira, para que a primeira prevaleca.
+    codigos = np.zeros(len(valores), dtype='int8')
+    with np.errstate(invalid='ignore'):
+        if greater_than is not None:
+            codigos[~(valores > greater_than)] = RULES.index('minimo') + 1
+        if positive:
+            codigos[~(valores > 0)] = RULES.index('positivo') + 1
+        if nonzero:
+            codigos[valores == 0] = RULES.index('zero') + 1
+    codigos[~tipo_ok] = RULES.index('tipo') + 1
+
+    contagem = np.bincount(codigos, minlength=len(RULES) + 1)
+    rejeitadas = np.flatnonzero(codigos)
+    amostra = rejeitadas[:sample]
+    return {
+        'coluna': serie.name,
+        'linhas': len(valores),
+        'valido': len(rejeitadas) == 0,
+        'falhas': {regra: int(contagem[i + 1]) for i, regra in enumerate(RULES)},
+        'primeira': RULES[codigos[rejeitadas[0]] - 1] if len(rejeitadas) else None,
+        'amostra': pd.DataFrame({'VALOR': serie.iloc[amostra].to_numpy(dtype=object),
+                                 'REGRA': [RULES[c - 1] for c in codigos[amostra]]},
+                                index=serie.index[amostra]),
+    }
+
+
+def raise_if_invalid(relatorio: dict, mensagens: Dict[str, str]):
+    '''
+    Levanta AssertionError com a mensagem da regra violada pela primeira
+    linha rejeitada, se houver alguma.
+
+    Parameters
+    ----------
+    relatorio : dict
+        Relatorio de check_numeric.
+
+    mensagens : Dict[str, str]
+        Regra -> mensagem do erro.
+
+    Example
+    -------
+    >>> raise_if_invalid(check_numeric(pd.Series([1, 'a'])), {'tipo': 'Nao e numero'})
+    Traceback (most recent call last):
+    ...
+    AssertionError: Nao e numero
+    '''
+    if not relatorio['valido']:
+        raise AssertionError(mensagens[relatorio['primeira']])
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(verbose=True)
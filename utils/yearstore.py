@@ -0,0 +1,119 @@
+'''
+Pasta de tabelas pequenas por ano do conjunto de dados, guardada ao lado
+dele ('sermil_aggstore', ao lado de 'sermil_dataset').
+
+Cada ano do conjunto (modulo dataset) grava ali algumas tabelas: as
+parciais das series temporais (aggstore), os histogramas das medidas
+inteiras (histstore) e o cubo de IMC (imcstore). O 'index.json' guarda a
+versao da particao usada em cada ano. aggstore.update_aggstore grava as
+tabelas na ingestao; as consultas apenas as leem por este modulo.
+'''
+
+import os
+import pandas as pd
+from typing import List
+try:
+    from .manifest import load_manifest
+except ImportError:
+    # Os testes unitarios importam os modulos direto da pasta utils, fora do pacote.
+    from manifest import load_manifest
+
+# Nome da pasta do armazenamento, criada ao lado do conjunto de dados.
+AGGSTORE_DIRNAME = 'sermil_aggstore'
+
+# Coluna que define o ano das series temporais.
+GROUP_COLUMN = 'VINCULACAO_ANO'
+
+INDEX_FILE = 'index.json'
+
+
+def aggstore_dir_for(dataset_dir: str) -> str:
+    '''
+    Pasta do armazenamento de agregados ao lado de um conjunto de dados.
+
+    Example
+    -------
+    >>> aggstore_dir_for(os.path.join('data_concat', 'sermil_dataset')) == os.path.join('data_concat', 'sermil_aggstore')
+    True
+    '''
+    return os.path.join(os.path.dirname(os.path.normpath(dataset_dir)), AGGSTORE_DIRNAME)
+
+
+def load_aggstore_index(store_dir: str) -> dict:
+    '''
+    Le o indice do armazenamento: ano -> origem dos dados usados.
+
+    Example
+    -------
+    >>> load_aggstore_index('ESSA_PASTA_N_EXISTE')
+    {}
+    '''
+    return load_manifest(os.path.join(store_dir, INDEX_FILE))
+
+
+def stored_years(store_dir: str, anos: List[int] = None) -> List[int]:
+    '''
+    Anos do conjunto (ANO_COLETA) com tabelas guardadas, em ordem.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    anos : List[int], optional
+        Anos desejados. Se None, todos os guardados.
+
+    Example
+    -------
+    >>> stored_years('ESSA_PASTA_N_EXISTE')
+    []
+    '''
+    guardados = sorted(int(ano) for ano in load_aggstore_index(store_dir))
+    if anos is not None:
+        guardados = [ano for ano in guardados if ano in set(anos)]
+    return guardados
+
+
+def write_table(df: pd.DataFrame, destino: str):
+    '''
+    Grava uma tabela do armazenamento de forma atomica.
+    '''
+    df.to_csv(destino + '.tmp', index=False)
+    os.replace(destino + '.tmp', destino)
+
+
+def read_year_tables(store_dir: str, nome: str, columns: List[str], anos: List[int] = None) -> pd.DataFrame:
+    '''
+    Junta uma tabela de todos os anos guardados, com a coluna ANO_COLETA.
+
+    Parameters
+    ----------
+    store_dir : str
+        Pasta do armazenamento.
+
+    nome : str
+        Nome da tabela, com '{ano}' no lugar do ano (por exemplo '{ano}_imc.csv').
+
+    columns : List[str]
+        Colunas da tabela, usadas quando nenhum ano tem linhas.
+
+    anos : List[int], optional
+        Anos do conjunto (ANO_COLETA) desejados. Se None, todos.
+
+    Returns
+    -------
+    pandas.DataFrame
+        As linhas de todos os anos, com as colunas da tabela e ANO_COLETA.
+    '''
+    partes = [pd.read_csv(os.path.join(store_dir, nome.format(ano=ano))).assign(ANO_COLETA=ano)
+              for ano in stored_years(store_dir, anos)]
+    # Anos sem os dados da tabela gravam uma tabela vazia.
+    partes = [parte for parte in partes if not parte.empty]
+    if not partes:
+        return pd.DataFrame(columns=list(columns) + ['ANO_COLETA'])
+    return pd.concat(partes, ignore_index=True)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(verbose=True)